@@ -0,0 +1,98 @@
+"""This module is used to compare the commit latency of fixed and adaptive batching (see ADAPTIVE_BATCHING inside
+config.py). It starts a cluster of nodes inside a single process connected over loopback connections. Transactions are
+passed to node 0 at a constant rate. After all transactions have been committed, the 50th and 99th percentile of the
+commit latency (time from `make_txn` until node 0 committed the transaction) are printed to the standard output.
+
+With --sweep the measurement is repeated for fixed and adaptive batching and multiple rates (each in its own process).
+
+Note: set TESTING to False inside config.py to reach optimal performance.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from twisted.internet import reactor
+from twisted.internet.task import deferLater, LoopingCall
+
+import piChain.PaxosLogic
+from piChain import Node
+
+
+# Transactions are passed to node 0 in this interval
+SEND_INTERVAL = 0.01
+
+
+def percentile(ordered, p):
+    return ordered[max(0, int(round(p / 100 * len(ordered))) - 1)]
+
+
+def run(batching, rps, duration, cluster_size):
+    piChain.PaxosLogic.ADAPTIVE_BATCHING = batching == 'adaptive'
+
+    # delete .pichain folder
+    base_path = os.path.expanduser('~/.pichain')
+    if os.path.exists(base_path):
+        shutil.rmtree(base_path)
+
+    peers = {str(i): {'loopback': 'node_%i' % i} for i in range(cluster_size)}
+    nodes = [Node(i, peers) for i in range(cluster_size)]
+
+    total = int(rps * duration)
+    per_send = max(1, int(rps * SEND_INTERVAL))
+    sent = 0
+    latencies = []
+
+    def tx_committed(txn_id, sent_at):
+        latencies.append(time.time() - sent_at)
+        if len(latencies) == total:
+            ordered = sorted(latencies)
+            print('batching = %s, rps = %i: p50 = %s ms, p99 = %s ms' %
+                  (batching, rps, str(round(1000 * percentile(ordered, 50), 1)),
+                   str(round(1000 * percentile(ordered, 99), 1))))
+            reactor.stop()
+
+    def send_batch():
+        nonlocal sent
+        for _ in range(per_send):
+            if sent == total:
+                lc.stop()
+                return
+            sent += 1
+            sent_at = time.time()
+            d = nodes[0].make_txn('put k%i v' % sent)
+            d.addCallback(tx_committed, sent_at)
+
+    for node in nodes:
+        node.start()
+
+    # give the nodes some time to connect
+    lc = LoopingCall(send_batch)
+    deferLater(reactor, 1, lc.start, SEND_INTERVAL)
+    reactor.run()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batching', choices=['fixed', 'adaptive'], default='adaptive')
+    parser.add_argument('--rps', type=int, default=1000, help='Requests per second')
+    parser.add_argument('--duration', type=float, default=5, help='Number of seconds transactions are sent')
+    parser.add_argument('--clustersize', type=int, default=3)
+    parser.add_argument('--sweep', action='store_true', help='Measure fixed and adaptive batching for multiple rates')
+    args = parser.parse_args()
+
+    if not args.sweep:
+        run(args.batching, args.rps, args.duration, args.clustersize)
+        return
+
+    for rps in [100, 1000, 5000, 10000]:
+        for batching in ['fixed', 'adaptive']:
+            subprocess.call([sys.executable, __file__, '--batching', batching, '--rps', str(rps),
+                             '--duration', str(args.duration), '--clustersize', str(args.clustersize)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""This module is used to measure how fast a piChain cluster becomes operational. It starts a cluster of nodes inside a
+single process and prints the time until all nodes are connected to each other (full mesh) and the time until node 0
+committed its first block. Then a peer of a second cluster (connection managers only) is restarted and the time until
+the full mesh is reestablished is printed.
+
+Note: set TESTING to False inside config.py to reach optimal performance.
+"""
+
+import argparse
+import os
+import shutil
+import time
+
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+
+from piChain import Node
+from piChain.PaxosNetwork import ConnectionManager
+
+
+class Peer(ConnectionManager):
+    """Connection manager that only keeps connections to its peers (no paxos logic)."""
+    def receive_pong_message(self, message, sender):
+        pass
+
+
+def make_peers(transport, cluster_size, prefix):
+    """
+    Args:
+        transport (str): loopback, unix or tcp.
+        cluster_size (int): number of nodes.
+        prefix (int): used to keep names and ports of multiple clusters apart.
+
+    Returns:
+        dict: peers dictionary in which each node uses the given `transport`.
+    """
+    peers = {}
+    for i in range(cluster_size):
+        if transport == 'loopback':
+            peers.update({str(i): {'loopback': 'cluster_%i_node_%i' % (prefix, i)}})
+        elif transport == 'unix':
+            path = '/tmp/pichain_cluster_%i_node_%i.sock' % (prefix, i)
+            if os.path.exists(path):
+                os.remove(path)
+            peers.update({str(i): {'unix': path}})
+        else:
+            peers.update({str(i): {'ip': '127.0.0.1', 'port': 7000 + 100 * prefix + i}})
+    return peers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transport', choices=['loopback', 'unix', 'tcp'], default='loopback')
+    parser.add_argument('--clustersize', type=int, default=3)
+    parser.add_argument('--downtime', type=float, default=1, help='Seconds the restarted peer is offline')
+    args = parser.parse_args()
+
+    # delete .pichain folder
+    base_path = os.path.expanduser('~/.pichain')
+    if os.path.exists(base_path):
+        shutil.rmtree(base_path)
+
+    # cluster startup
+    peers = make_peers(args.transport, args.clustersize, 0)
+    nodes = [Node(i, peers) for i in range(args.clustersize)]
+
+    def tx_committed(commands):
+        mesh = max(node.time_to_full_mesh or 0 for node in nodes)
+        print('transport = %s, cluster size = %i: time to full mesh = %s, time to first commit = %s' %
+              (args.transport, args.clustersize, str(round(mesh, 3)), str(round(nodes[0].time_to_first_commit, 3))))
+        nodes[0].tx_committed = None
+        deferLater(reactor, 1, restart_peer)
+
+    nodes[0].tx_committed = tx_committed
+    for node in nodes:
+        node.start()
+    nodes[0].make_txn('put k v')
+
+    # peer restart
+    peers_restart = make_peers(args.transport, args.clustersize, 1)
+    managers = [Peer(i, peers_restart) for i in range(args.clustersize)]
+    for manager in managers:
+        manager.start()
+
+    def restart_peer():
+        index = args.clustersize - 1
+        managers[index].stop()
+        deferLater(reactor, args.downtime, start_peer, index)
+
+    def start_peer(index):
+        restarted_at = time.time()
+        managers[index] = Peer(index, peers_restart)
+        managers[index].start()
+        deferLater(reactor, 0.01, check_mesh, restarted_at)
+
+    def check_mesh(restarted_at):
+        if all(len(m.peers_connection) == args.clustersize - 1 for m in managers):
+            print('transport = %s, cluster size = %i: time to full mesh after peer restart = %s' %
+                  (args.transport, args.clustersize, str(round(time.time() - restarted_at, 3))))
+            reactor.stop()
+        else:
+            deferLater(reactor, 0.01, check_mesh, restarted_at)
+
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""This module is used to show that a piChain cluster keeps committing transactions while its membership changes (see
+`Node.change_membership`). It starts a cluster of nodes inside a single process connected over loopback connections.
+Transactions are passed to node 0 at a constant rate. Then a new node is started and added to the configuration and
+afterwards a node is stopped and removed (i.e a failed machine is replaced). The new node catches up with a snapshot of
+the app state (a counter of the committed transactions) since the blocks committed before have been deleted already.
+For each phase the number of committed transactions per second, the longest time without a commit and the 99th
+percentile of the commit latency are printed to the standard output.
+
+Note: set TESTING to False inside config.py to reach optimal performance.
+"""
+
+import argparse
+import io
+import os
+import shutil
+import time
+
+from twisted.internet import reactor
+from twisted.internet.task import deferLater, LoopingCall
+
+from piChain import Node, StateMachine
+
+
+# Transactions are passed to node 0 in this interval
+SEND_INTERVAL = 0.01
+
+
+class Counter(StateMachine):
+    """Counts the committed transactions."""
+    def __init__(self):
+        self.count = 0
+
+    def partition_key(self, command):
+        return None
+
+    def apply(self, commands):
+        self.count += len(commands)
+
+    def snapshot(self):
+        return io.BytesIO(str(self.count).encode())
+
+    def restore(self, stream):
+        self.count = int(stream.read().decode())
+
+
+def make_node(node_id, node_ids):
+    node = Node(node_id, make_peers(node_ids))
+    node.state_machine = Counter()
+    return node
+
+
+def make_peers(node_ids):
+    return {str(i): {'loopback': 'node_%i' % i} for i in node_ids}
+
+
+def run(rps, phase, cluster_size):
+    # delete .pichain folder
+    base_path = os.path.expanduser('~/.pichain')
+    if os.path.exists(base_path):
+        shutil.rmtree(base_path)
+
+    node_ids = list(range(cluster_size))
+    nodes = {i: make_node(i, node_ids) for i in node_ids}
+    per_send = max(1, int(rps * SEND_INTERVAL))
+    commits = []
+    phases = []
+
+    def send_batch():
+        for _ in range(per_send):
+            sent_at = time.time()
+            d = nodes[0].make_txn('put k v')
+            d.addCallback(lambda _, t=sent_at: commits.append((time.time(), time.time() - t)))
+
+    def change(label, peers):
+        started_at = time.time()
+        d = nodes[0].change_membership(peers)
+        d.addCallback(lambda _: phases.append((label, started_at, time.time())))
+
+    def add_node():
+        new_id = max(nodes) + 1
+        node_ids.append(new_id)
+        nodes[new_id] = make_node(new_id, node_ids)
+        nodes[new_id].start()
+        change('add node %i' % new_id, make_peers(node_ids))
+
+    def replace_node():
+        # node 1 fails and is removed from the configuration
+        nodes.pop(1).stop()
+        node_ids.remove(1)
+        change('remove node 1', make_peers(node_ids))
+
+    def report():
+        lc.stop()
+        start = commits[0][0]
+        bounds = [('before', start, phases[0][1])]
+        for (label, begin, end), following in zip(phases, phases[1:] + [None]):
+            bounds.append((label, begin, end))
+            bounds.append(('after ' + label, end, following[1] if following is not None else commits[-1][0]))
+        for label, begin, end in bounds:
+            window = [c for c in commits if begin <= c[0] <= end]
+            times = [begin] + [c[0] for c in window] + [end]
+            latencies = sorted(c[1] for c in window)
+            p99 = latencies[int(0.99 * (len(latencies) - 1))] if len(latencies) != 0 else 0
+            print('%-20s %6.2f s: %7.1f txs/s, longest time without commit = %5.1f ms, p99 latency = %5.1f ms' %
+                  (label, end - begin, len(window) / max(end - begin, 1e-6),
+                   1000 * max(b - a for a, b in zip(times, times[1:])), 1000 * p99))
+        print('voters per node: %s' % ', '.join('%i: %s' % (i, node.voters) for i, node in sorted(nodes.items())))
+        print('committed height per node: %s' %
+              ', '.join('%i: %i' % (i, node.blocktree.committed_height()) for i, node in sorted(nodes.items())))
+        print('committed txs counted per node: %s' %
+              ', '.join('%i: %i' % (i, node.state_machine.count) for i, node in sorted(nodes.items())))
+        reactor.stop()
+
+    for node in nodes.values():
+        node.start()
+
+    lc = LoopingCall(send_batch)
+    deferLater(reactor, 1, lc.start, SEND_INTERVAL)
+    deferLater(reactor, 1 + phase, add_node)
+    deferLater(reactor, 1 + 2 * phase, replace_node)
+    deferLater(reactor, 1 + 3 * phase, report)
+    reactor.run()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rps', type=int, default=500, help='Requests per second')
+    parser.add_argument('--phase', type=float, default=3, help='Seconds between two membership changes')
+    parser.add_argument('--clustersize', type=int, default=3)
+    args = parser.parse_args()
+    run(args.rps, args.phase, args.clustersize)
+
+
+if __name__ == "__main__":
+    main()
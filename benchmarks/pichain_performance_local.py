@@ -0,0 +1,94 @@
+"""This module is used to measure the protocol cost of piChain without the cost of the TCP stack. It starts a cluster of
+nodes inside a single process, connected over loopback connections (default), Unix domain sockets or TCP. A predefined
+number of transactions is passed to node 0 each second. After all transactions have been committed, the time elapsed
+is printed to the standard output.
+
+Note: set TESTING to False inside config.py to reach optimal performance.
+"""
+
+import argparse
+import os
+import shutil
+import time
+
+from twisted.internet import reactor
+from twisted.internet.task import deferLater
+
+from piChain import Node
+
+
+# Keeps track of how many transactions have been committed
+txn_count = 0
+# Variables used for timing
+start_time = None
+
+
+def make_peers(transport, cluster_size):
+    """
+    Args:
+        transport (str): loopback, unix or tcp.
+        cluster_size (int): number of nodes.
+
+    Returns:
+        dict: peers dictionary in which each node uses the given `transport`.
+    """
+    peers = {}
+    for i in range(cluster_size):
+        if transport == 'loopback':
+            peers.update({str(i): {'loopback': 'node_%i' % i}})
+        elif transport == 'unix':
+            path = '/tmp/pichain_node_%i.sock' % i
+            if os.path.exists(path):
+                os.remove(path)
+            peers.update({str(i): {'unix': path}})
+        else:
+            peers.update({str(i): {'ip': '127.0.0.1', 'port': 7000 + i}})
+    return peers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--transport', choices=['loopback', 'unix', 'tcp'], default='loopback')
+    parser.add_argument('--clustersize', type=int, default=3)
+    parser.add_argument('--rps', type=int, default=5000, help='Requests per second')
+    parser.add_argument('--iterations', type=int, default=10, help='Number of seconds transactions are sent')
+    args = parser.parse_args()
+
+    # delete .pichain folder
+    base_path = os.path.expanduser('~/.pichain')
+    if os.path.exists(base_path):
+        shutil.rmtree(base_path)
+
+    peers = make_peers(args.transport, args.clustersize)
+    nodes = [Node(i, peers) for i in range(args.clustersize)]
+
+    def tx_committed(commands):
+        global txn_count
+        txn_count += len(commands)
+        if txn_count == args.rps * args.iterations:
+            elapsed_time = round(time.time() - start_time, 3)
+            print('transport = %s, cluster size = %i: %i txns committed, elapsed time = %s' %
+                  (args.transport, args.clustersize, txn_count, str(elapsed_time)))
+            reactor.stop()
+
+    def send_batch():
+        for j in range(args.rps):
+            nodes[0].make_txn('put k%i v' % j)
+
+    def send_txns():
+        global start_time
+        start_time = time.time()
+        for i in range(args.iterations):
+            deferLater(reactor, i, send_batch)
+
+    nodes[0].tx_committed = tx_committed
+    for node in nodes:
+        node.start()
+
+    # give the nodes some time to connect
+    deferLater(reactor, 1, send_txns)
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
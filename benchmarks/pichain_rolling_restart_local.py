@@ -0,0 +1,131 @@
+"""This module is used to measure the unavailability of a piChain cluster during a rolling restart. It starts a cluster
+of nodes in separate processes (connected over TCP on localhost). Each node makes transactions at a constant rate. Then
+the nodes are restarted one after the other. With handoff the quick node hands its role over to the next node before it
+is stopped (see `Node.transfer_leadership`), otherwise it just stops. For each restart the longest time in which no node
+committed a block (the unavailability window) is printed to the standard output.
+
+Note: set TESTING to False inside config.py to reach optimal performance.
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+from twisted.internet import reactor
+from twisted.internet.task import LoopingCall
+
+from piChain import Node
+
+
+def make_peers(cluster_size):
+    return {str(i): {'ip': '127.0.0.1', 'port': 7400 + i} for i in range(cluster_size)}
+
+
+def run_node(node_index, cluster_size, rps, handoff):
+    """Run a single node that makes `rps` / `cluster_size` transactions per second and prints the time of each commit.
+    On SIGUSR1 the node stops (after handing its role over if `handoff` is True and it is the quick node).
+    """
+    node = Node(node_index, make_peers(cluster_size))
+    node.tx_committed = lambda commands: print('commit %f' % time.time(), flush=True)
+    counter = 0
+
+    def send_txn():
+        nonlocal counter
+        counter += 1
+        d = node.make_txn('put k_%i_%i v' % (node_index, counter))
+        # transactions lost during a restart are not of interest
+        d.addErrback(lambda failure: None)
+
+    def stop():
+        if handoff and node.state == 0:
+            node.transfer_leadership((node_index + 1) % cluster_size)
+        reactor.callLater(0.05, reactor.stop)
+
+    signal.signal(signal.SIGUSR1, lambda signum, frame: reactor.callFromThread(stop))
+    lc = LoopingCall(send_txn)
+    reactor.callLater(1, lc.start, cluster_size / rps)
+    node.start_server()
+
+
+def spawn(node_index, args, handoff):
+    log = open('/tmp/pichain_rolling_restart_%i.log' % node_index, 'a')
+    cmd = [sys.executable, os.path.abspath(__file__), '--node', str(node_index), '--clustersize',
+           str(args.clustersize), '--rps', str(args.rps)]
+    if handoff:
+        cmd.append('--handoff')
+    return subprocess.Popen(cmd, stdout=log, stderr=subprocess.DEVNULL)
+
+
+def commit_times(cluster_size):
+    times = []
+    for i in range(cluster_size):
+        with open('/tmp/pichain_rolling_restart_%i.log' % i) as f:
+            times.extend(float(line.split()[1]) for line in f if line.startswith('commit '))
+    return sorted(times)
+
+
+def longest_gap(times, start, stop):
+    window = [start] + [t for t in times if start < t < stop] + [stop]
+    return max(b - a for a, b in zip(window, window[1:]))
+
+
+def measure(args, handoff):
+    # delete .pichain folder and the logs of a previous run
+    base_path = os.path.expanduser('~/.pichain')
+    if os.path.exists(base_path):
+        shutil.rmtree(base_path)
+    for i in range(args.clustersize):
+        path = '/tmp/pichain_rolling_restart_%i.log' % i
+        if os.path.exists(path):
+            os.remove(path)
+
+    procs = [spawn(i, args, handoff) for i in range(args.clustersize)]
+    time.sleep(args.settle)
+
+    restarts = []
+    for i in range(args.clustersize):
+        stopped_at = time.time()
+        procs[i].send_signal(signal.SIGUSR1)
+        procs[i].wait()
+        time.sleep(args.downtime)
+        procs[i] = spawn(i, args, handoff)
+        time.sleep(args.settle)
+        restarts.append((stopped_at, time.time()))
+
+    for proc in procs:
+        proc.terminate()
+        proc.wait()
+
+    times = commit_times(args.clustersize)
+    gaps = [longest_gap(times, start, stop) for start, stop in restarts]
+    print('handoff = %s: longest time without a commit per restart = %s seconds' %
+          (handoff, ', '.join(str(round(gap, 3)) for gap in gaps)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clustersize', type=int, default=3)
+    parser.add_argument('--rps', type=int, default=100, help='Requests per second (of all nodes)')
+    parser.add_argument('--downtime', type=float, default=1, help='Seconds a restarted node is offline')
+    parser.add_argument('--settle', type=float, default=4, help='Seconds between two restarts')
+    parser.add_argument('--mode', choices=['handoff', 'crash', 'both'], default='both')
+    parser.add_argument('--node', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--handoff', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.node is not None:
+        run_node(args.node, args.clustersize, args.rps, args.handoff)
+        return
+
+    if args.mode in ['crash', 'both']:
+        measure(args, False)
+    if args.mode in ['handoff', 'both']:
+        measure(args, True)
+
+
+if __name__ == "__main__":
+    main()
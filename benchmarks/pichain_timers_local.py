@@ -0,0 +1,97 @@
+"""This module is used to measure the number of calls scheduled in the reactor and the CPU time used by a piChain
+cluster under load. It starts a cluster of nodes inside a single process connected over loopback connections.
+Transactions are passed to node 0 at a constant rate. The number of scheduled calls (see
+`IReactorTime.getDelayedCalls`) is sampled in regular intervals. After all transactions have been committed, the mean
+and max number of scheduled calls, the number of committed blocks and the CPU time per committed transaction are printed
+to the standard output.
+
+Note: set TESTING to False inside config.py to reach optimal performance.
+"""
+
+import argparse
+import os
+import shutil
+import time
+
+from twisted.internet import reactor
+from twisted.internet.task import deferLater, LoopingCall
+
+from piChain import Node
+
+
+# Transactions are passed to node 0 in this interval
+SEND_INTERVAL = 0.01
+
+# The number of scheduled calls is sampled in this interval
+SAMPLE_INTERVAL = 0.05
+
+
+def run(rps, duration, cluster_size):
+    # delete .pichain folder
+    base_path = os.path.expanduser('~/.pichain')
+    if os.path.exists(base_path):
+        shutil.rmtree(base_path)
+
+    peers = {str(i): {'loopback': 'node_%i' % i} for i in range(cluster_size)}
+    nodes = [Node(i, peers) for i in range(cluster_size)]
+
+    total = int(rps * duration)
+    per_send = max(1, int(rps * SEND_INTERVAL))
+    sent = 0
+    committed = 0
+    blocks = 0
+    samples = []
+    cpu_start = None
+
+    def tx_committed(txn_id):
+        nonlocal committed
+        committed += 1
+        if committed == total:
+            cpu = time.process_time() - cpu_start
+            print('rps = %i: scheduled calls mean = %s, max = %i, blocks = %i, CPU time per txn = %s us' %
+                  (rps, str(round(sum(samples) / len(samples), 1)), max(samples), blocks,
+                   str(round(1000000 * cpu / total, 1))))
+            reactor.stop()
+
+    def block_committed(commands):
+        nonlocal blocks
+        blocks += 1
+
+    def send_batch():
+        nonlocal sent, cpu_start
+        if cpu_start is None:
+            cpu_start = time.process_time()
+        for _ in range(per_send):
+            if sent == total:
+                lc.stop()
+                return
+            sent += 1
+            d = nodes[0].make_txn('put k%i v' % sent)
+            d.addCallback(tx_committed)
+
+    def sample():
+        if cpu_start is not None:
+            samples.append(len(reactor.getDelayedCalls()))
+
+    nodes[0].tx_committed = block_committed
+    for node in nodes:
+        node.start()
+
+    # give the nodes some time to connect
+    lc = LoopingCall(send_batch)
+    deferLater(reactor, 1, lc.start, SEND_INTERVAL)
+    LoopingCall(sample).start(SAMPLE_INTERVAL)
+    reactor.run()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rps', type=int, default=2000, help='Requests per second')
+    parser.add_argument('--duration', type=float, default=10, help='Number of seconds transactions are sent')
+    parser.add_argument('--clustersize', type=int, default=3)
+    args = parser.parse_args()
+    run(args.rps, args.duration, args.clustersize)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,7 +6,7 @@ import argparse
 from twisted.internet import reactor
 from twisted.internet.task import deferLater
 
-from piChain import Node
+from piChain import Node, CommittedLogFactory
 
 
 def tx_committed(commands):
@@ -23,8 +23,10 @@ def main():
     """Setup of a Node instance: A peers dictionary containing an (ip,port) pair for each node must be defined. With
     the `node_index` argument one can select the node that will run locally. Optionally one can set the `tx_committed`
     field of the Node instance which is a callable that is called once a block has been committed. By calling
-    `start_server()` on the Node instance the local node will try to connect to its peers. Transactions can be committed
-    by calling `make_txn(txn)` on the Node instance.
+    `start()` on the Node instance the local node will try to connect to its peers once the reactor runs
+    (`start_server()` would run the reactor right away). Transactions can be committed by calling `make_txn(txn)` on
+    the Node instance. The committed log is served on port 9000 + `node_index` to
+    downstream consumers (see `tail_log.py`).
     """
     parser = argparse.ArgumentParser()
     parser.add_argument("node_index", help='Index of node in the given peers dict.')
@@ -38,7 +40,8 @@ def main():
     }
     node = Node(int(node_index), peers)
     node.tx_committed = tx_committed
-    node.start_server()
+    node.start()
+    reactor.listenTCP(9000 + int(node_index), CommittedLogFactory(node))
 
     if node_index == '0':
         deferLater(reactor, 3, node.make_txn, 'sql_command1')
@@ -1,6 +1,15 @@
 """This module implements a distributed database as an example usage of the piChain package. It's a key-value storage
-that can handle keys and values that are arbitrary byte arrays. Supported operations are put(key,value), get(key) and
-delete(key).
+that can handle keys and values that are arbitrary byte arrays. Supported operations are put(key,value), get(key),
+sget(key, max_blocks) and delete(key). A get is linearizable, a sget may return a value that is at most `max_blocks`
+committed blocks (or `SGET_MAX_AGE` seconds) stale but can be served by any node without sending messages. The watermark
+command returns the committed height the local db reflects, the highest committed height the node heard of and how many
+seconds the db is behind.
+
+With --groups the keys are sharded among multiple consensus groups (see `MultiGroupNode`) s.t the quick nodes of the
+groups (and thus the load) are spread among the nodes. A key is always handled by the same group (see `route`).
+
+The committed operations are applied by a StateMachine per group. It also takes snapshots of the keys of its group s.t a
+node that fell too far behind (or a new node) can catch up without the history of the blocks.
 
 note: If you want to delete the local database and the internal datastructure piChain uses delete the ~/.pichain
 directory.
@@ -9,13 +18,19 @@ directory.
 import logging
 import argparse
 import os
+import struct
+import zlib
 
 import plyvel
 from twisted.internet.protocol import Factory, connectionDone
 from twisted.protocols.basic import LineReceiver
 from twisted.internet import reactor
 
-from piChain import Node
+from piChain import Node, MultiGroupNode, PlyvelStateMachine
+
+# default staleness bounds of a sget operation
+SGET_MAX_BLOCKS = 5
+SGET_MAX_AGE = 0.5
 
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -34,16 +49,23 @@ class DatabaseProtocol(LineReceiver):
 
     def connectionMade(self):
         self.factory.connections.update({self.transport.getPeer(): self})
+        # stop reading the operations of the client while a node does not admit new txs (see `Node.update_admission`)
+        for node in self.factory.nodes:
+            node.ingress_producers.add(self.transport)
         logger.debug('client connection made')
 
     def connectionLost(self, reason=connectionDone):
         self.factory.connections.pop(self.transport.getPeer())
+        for node in self.factory.nodes:
+            node.ingress_producers.discard(self.transport)
         logger.debug('client connection lost')
 
     def lineReceived(self, line):
         """ The `line` represents the database operation send by a client. Put and delete operations have to be
-        committed first by calling `make_txn(operation)` on the node instance stored in the factory. Get operations
-        can be directly executed locally.
+        committed first by calling `make_txn(operation)` on the node instance stored in the factory. The client is
+        answered once the operation has been committed (or right away if the node does not admit new operations, see
+        `NodeBusyError`). Get operations are executed locally once the local db is up to date (see
+        `Node.read_barrier`).
 
         Args:
             line (bytes): received command str encoded in bytes.
@@ -52,18 +74,63 @@ class DatabaseProtocol(LineReceiver):
         logger.debug('received command from client: %s', txn_command)
 
         c_list = txn_command.split()
-        if c_list[0] == 'put' or c_list[0] == 'delete':
-            self.factory.node.make_txn(txn_command)
+        if c_list[0] == 'put':
+            d = self.factory.route(c_list[1]).make_txn(txn_command)
+            d.addCallback(self.reply, 'stored key-value pair = ' + c_list[1] + ': ' + c_list[2])
+            d.addErrback(self.reply_error)
+
+        elif c_list[0] == 'delete':
+            d = self.factory.route(c_list[1]).make_txn(txn_command)
+            d.addCallback(self.reply, 'deleted key = ' + c_list[1])
+            d.addErrback(self.reply_error)
 
         elif c_list[0] == 'get':
-            # get command is directly locally executed and will not be committed
-            key = c_list[1]
-            value = self.factory.db.get(key.encode())
-            if value is None:
-                message = 'key "%s" does not exist' % key
+            # get command is executed locally (without being committed) once all operations committed before the get
+            # have been executed locally (linearizable read)
+            d = self.factory.route(c_list[1]).read_barrier()
+            d.addCallback(self.reply_get, c_list[1])
+            d.addErrback(self.reply_error)
+
+        elif c_list[0] == 'sget':
+            # bounded staleness read: executed locally once the local db is fresh enough
+            max_blocks = int(c_list[2]) if len(c_list) > 2 else SGET_MAX_BLOCKS
+            d = self.factory.route(c_list[1]).bounded_read(max_blocks, SGET_MAX_AGE)
+            d.addCallback(self.reply_get, c_list[1])
+            d.addErrback(self.reply_error)
+
+        elif c_list[0] == 'watermark':
+            for group_id, node in enumerate(self.factory.nodes):
+                height, known_height, staleness = node.watermark()
+                message = 'group %i: applied height = %i, known height = %i, behind for %s seconds' % \
+                          (group_id, height, known_height, str(round(staleness, 3)))
                 self.sendLine(message.encode())
-            else:
-                self.sendLine(value)
+
+    def reply(self, txn_id, message):
+        """Is called once the operation of the client has been committed (a get served afterwards reflects it).
+
+        Args:
+            txn_id (int): id of the committed transaction.
+            message (str): message sent to the client.
+        """
+        self.sendLine(message.encode())
+
+    def reply_get(self, height, key):
+        """Is called once the local db can be read (see `Node.read_barrier` and `Node.bounded_read`).
+
+        Args:
+            height (int): committed height of the local node.
+            key (str): requested key.
+        """
+        value = self.factory.db.get(key.encode())
+        if value is None:
+            message = 'key "%s" does not exist' % key
+            self.sendLine(message.encode())
+        else:
+            self.sendLine(value)
+
+    def reply_error(self, failure):
+        logger.debug('operation failed: %s', str(failure.value))
+        self.sendLine(('operation failed: ' + str(failure.value)).encode())
 
     def rawDataReceived(self, data):
         pass
@@ -76,27 +143,33 @@ class DatabaseFactory(Factory):
     Attributes:
         connections (dict): Maps an IAddress (representing an address of a remote peer) to a DatabaseProtocol instance
             (representing the connection between the local node and the peer).
-        node (Node): A Node instance representing the local node.
+        node (ConnectionManager): A Node (or MultiGroupNode if there are multiple groups) instance representing the
+            local node.
+        nodes (list): Node instances of the consensus groups, indexed by group id.
         db (pyvel db): A plyvel db instance used to store the key-value pairs (python implementation of levelDB).
     """
-    def __init__(self, node_index, c_size):
+    def __init__(self, node_index, c_size, group_count=1):
         """Setup of a Node instance: A peers dictionary containing an (ip,port) pair for each node must be defined. The
-        `node_index` argument defines the node that will run locally. The `tx_committed` field of the Node instance is a
-        callable that is called once a block has been committed. By calling `start_server()` on the Node instance the
-        local node will try to connect to its peers.
+        `node_index` argument defines the node that will run locally. The `state_machine` field of the Node instance is
+        used to apply the commands of the committed blocks on worker threads. By calling `start_server()` on the Node
+        instance the local node will try to connect to its peers.
 
         Args:
             node_index (int):  Index of node in the given peers dict.
             c_size (int): Cluster size.
+            group_count (int): Number of consensus groups the keys are sharded among.
         """
         self.connections = {}
         peers = {}
         for i in range(0, c_size):
             peers.update({str(i): {'ip': 'localhost', 'port': (7000 + i)}})
 
-        self.node = Node(node_index, peers)
-
-        self.node.tx_committed = self.tx_committed
+        if group_count == 1:
+            self.node = Node(node_index, peers)
+            self.nodes = [self.node]
+        else:
+            self.node = MultiGroupNode(node_index, peers, group_count)
+            self.nodes = self.node.groups
 
         # create a db instance
         base_path = os.path.expanduser('~/.pichain/distributed_DB')
@@ -105,34 +178,135 @@ class DatabaseFactory(Factory):
         path = base_path + '/node_' + str(node_index)
         self.db = plyvel.DB(path, create_if_missing=True)
 
+        # the groups handle disjoint sets of keys, so their commands can be executed in any order among each other
+        for group_id, node in enumerate(self.nodes):
+            node.state_machine = DatabaseStateMachine(self, group_id)
+
     def buildProtocol(self, addr):
         return DatabaseProtocol(self)
 
-    def broadcast(self, line):
-        for con in self.connections.values():
-            con.sendLine(line.encode())
+    def route(self, key):
+        """
+        Args:
+            key (str): a key of the database.
 
-    def tx_committed(self, commands):
-        """Called once a transaction has been committed. Since the delete and put operations have now been committed,
-        they can be executed locally.
+        Returns:
+            Node: the node of the group `key` belongs to (based on a hash of the key that is the same on all nodes).
+        """
+        return self.nodes[self.group_of(key)]
 
+    def group_of(self, key):
+        """
         Args:
-            commands (list): list of commands inside committed block (one per Transaction)
+            key (str): a key of the database.
+
+        Returns:
+            int: id of the group `key` belongs to.
+        """
+        return zlib.crc32(key.encode()) % len(self.nodes)
+
 
+class SnapshotStream:
+    """Binary stream of the key-value pairs of a group read from a db snapshot. Each pair is encoded as the lengths of
+    the key and value (4 bytes each) followed by the key and value.
+
+    Args:
+        snapshot (plyvel.Snapshot): consistent view of the db.
+        owns (Callable): returns True if a key (str) belongs to the group.
+    """
+    def __init__(self, snapshot, owns):
+        self.snapshot = snapshot
+        self.iterator = snapshot.iterator()
+        self.owns = owns
+        self.buffer = bytearray()
+
+    def read(self, size):
+        while len(self.buffer) < size:
+            item = next(self.iterator, None)
+            if item is None:
+                break
+            key, value = item
+            if self.owns(key.decode()):
+                self.buffer += struct.pack('>II', len(key), len(value)) + key + value
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def close(self):
+        self.snapshot.close()
+
+
+class DatabaseStateMachine(PlyvelStateMachine):
+    """Applies the committed operations of a consensus group to the local db. Operations on different keys are
+    independent of each other s.t they are applied on multiple threads in parallel. The committed height up to which
+    the operations have been applied is stored in the db under a key of the group (starting with a zero byte, which is
+    not part of the keys of the clients) in the same write batch as the operations.
+
+    Args:
+        factory (DatabaseFactory): owner of the db.
+        group_id (int): id of the group.
+    """
+    def __init__(self, factory, group_id):
+        super().__init__(factory.db, b'\x00applied_height_' + str(group_id).encode())
+        self.factory = factory
+        self.group_id = group_id
+
+    def owns(self, key):
+        return not key.startswith('\x00') and self.factory.group_of(key) == self.group_id
+
+    def partition_key(self, command):
+        """
+        Args:
+            command (str): a committed put or delete operation.
+
+        Returns:
+            str: the key modified by `command` (operations on different keys are independent of each other).
+        """
+        return command.split()[1]
+
+    def execute(self, batch, command):
+        """Called on a worker thread once the block containing `command` has been committed. Since the delete and put
+        operations have now been committed, they can be executed locally (the clients are answered by the
+        DatabaseProtocol instances). The writes are staged and written together with those of the other operations of
+        the applied blocks.
+
+        Args:
+            batch (StagedWrites): the writes of the operation are staged in it.
+            command (str): a committed put or delete operation.
+        """
+        c_list = command.split()
+        if c_list[0] == 'put':
+            key = c_list[1]
+            value = c_list[2]
+            batch.put(key.encode(), value.encode())
+        elif c_list[0] == 'delete':
+            key = c_list[1]
+            batch.delete(key.encode())
+
+    def snapshot(self):
+        """
+        Returns:
+            SnapshotStream: the key-value pairs of this group (read lazily from a db snapshot).
+        """
+        return SnapshotStream(self.factory.db.snapshot(), self.owns)
+
+    def restore(self, stream):
+        """Replace the key-value pairs of this group by the ones of a snapshot.
+
+        Args:
+            stream: binary file-like object containing a snapshot (see `SnapshotStream`).
         """
-        for command in commands:
-            c_list = command.split()
-            if c_list[0] == 'put':
-                key = c_list[1]
-                value = c_list[2]
-                self.db.put(key.encode(), value.encode())
-                message = 'stored key-value pair = ' + key + ': ' + value
-                self.broadcast(message)
-            elif c_list[0] == 'delete':
-                key = c_list[1]
-                self.db.delete(key.encode())
-                message = 'deleted key = ' + key
-                self.broadcast(message)
+        db = self.factory.db
+        with db.write_batch() as wb:
+            for key, _ in db.iterator():
+                if self.owns(key.decode()):
+                    wb.delete(key)
+            while True:
+                header = stream.read(8)
+                if len(header) < 8:
+                    break
+                key_size, value_size = struct.unpack('>II', header)
+                wb.put(stream.read(key_size), stream.read(value_size))
 
 
 def main():
@@ -140,11 +314,12 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("node_index", help='Index of node in the given peers dict.')
     parser.add_argument("clustersize")
+    parser.add_argument("--groups", type=int, default=1, help='Number of consensus groups the keys are sharded among.')
     args = parser.parse_args()
     node_index = args.node_index
     cluster_size = args.clustersize
     # setup node instance
-    db_factory = DatabaseFactory(int(node_index), int(cluster_size))
+    db_factory = DatabaseFactory(int(node_index), int(cluster_size), args.groups)
 
     # Any of the nodes may receive commands
     if node_index == '0':
@@ -0,0 +1,60 @@
+"""This module shows how a downstream system (e.g a search indexer or a cache) can tail the committed log of a node
+that serves it with a `CommittedLogFactory`. The committed txs are printed to the standard output. After a lost
+connection the client reconnects and resumes with the block following the last one it received.
+"""
+
+import argparse
+import struct
+
+import cbor
+from twisted.internet import reactor
+from twisted.internet.protocol import ReconnectingClientFactory
+from twisted.protocols.basic import IntNStringReceiver
+
+from piChain.config import MAX_MESSAGE_SIZE
+
+
+class TailProtocol(IntNStringReceiver):
+    """Subscribes to the committed log from the next height of the factory and prints the received entries."""
+    # little endian, unsigned int
+    structFormat = '<I'
+    prefixLength = struct.calcsize(structFormat)
+    MAX_LENGTH = MAX_MESSAGE_SIZE
+
+    def connectionMade(self):
+        self.factory.resetDelay()
+        self.sendString(cbor.dumps(self.factory.next_height))
+
+    def stringReceived(self, string):
+        entries = cbor.loads(string)
+        if isinstance(entries, str):
+            print('subscription failed: %s' % entries)
+            self.factory.stopTrying()
+            return
+        for height, block_id, txn_id, content in entries:
+            print('%i %i %i %s' % (height, block_id, txn_id, content))
+        self.factory.next_height = entries[-1][0] + 1
+
+
+class TailFactory(ReconnectingClientFactory):
+    """
+    Args:
+        next_height (int): committed height of the next block to receive.
+    """
+    protocol = TailProtocol
+
+    def __init__(self, next_height):
+        self.next_height = next_height
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', type=int, help='Port the node serves its committed log on.')
+    parser.add_argument('--start', type=int, default=1, help='Committed height of the first block.')
+    args = parser.parse_args()
+    reactor.connectTCP('localhost', args.port, TailFactory(args.start))
+    reactor.run()
+
+
+if __name__ == "__main__":
+    main()
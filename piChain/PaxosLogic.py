@@ -2,18 +2,31 @@
 It implements the Node class which represents a piChain node and specifies how it should behave.
 """
 
+import asyncio
 import random
 import logging
 import time
 import json
+import tempfile
+from collections import deque
 
-from twisted.internet.task import deferLater
+from twisted.internet import defer
+from twisted.internet.task import deferLater, LoopingCall
 
 from piChain.PaxosNetwork import ConnectionManager
 from piChain.blocktree import Blocktree
+from piChain.rtt import RttEstimator
+from piChain.failure_detector import PhiAccrualDetector
+from piChain.timers import Timer
+from piChain.apply import ApplyPipeline
 from piChain.messages import PaxosMessage, Block, RequestBlockMessage, RespondBlockMessage, Transaction, \
-    AckCommitMessage
-from piChain.config import ACCUMULATION_TIME, MAX_COMMIT_TIME, MAX_TXN_COUNT, TESTING, RECOVERY_BLOCKS_COUNT
+    SyncRequestMessage, SyncResponseMessage, ReadIndexMessage, LeadershipTransferMessage, HeartbeatMessage, \
+    SnapshotRequestMessage, SnapshotChunkMessage
+from piChain.config import ACCUMULATION_TIME, MAX_COMMIT_TIME, BLOCK_SIZE, TESTING, RECOVERY_BLOCKS_COUNT, \
+    SYNC_CHUNK_SIZE, SYNC_WINDOW, SYNC_STRIPE_MIN_BLOCKS, ADAPTIVE_BATCHING, MAX_ACCUMULATION_TIME, \
+    BATCH_TARGET_COUNT, BATCH_TARGET_BYTES, MAX_MESSAGE_SIZE, TXN_TIMEOUT, TXN_RESUBMITS, LEASE_DURATION, \
+    LEASE_CLOCK_DRIFT, READ_TIMEOUT, HEARTBEAT_INTERVAL, PHI_THRESHOLD, SNAPSHOT_CHUNK_SIZE, LOG_RETENTION_BLOCKS, \
+    PENDING_TXS_HIGH, PENDING_TXS_LOW, PENDING_BYTES_HIGH, PENDING_BYTES_LOW
 
 
 # variables representing the state of a node
@@ -23,6 +36,24 @@ SLOW = 2
 
 EPSILON = 0.001
 
+# upper bound of the bytes a block or message adds to the serialized txs or blocks it contains (fields, type prefix)
+MESSAGE_OVERHEAD = 128
+# upper bound of the bytes the cbor encoding adds to each serialized txn or block inside a list
+ITEM_OVERHEAD = 5
+
+# upper bound of the bytes the envelopes add to a serialized block once it is sent: the message carrying it (BLK, RSB,
+# SRS or SNC) and the GroupMessage wrapping that message in multi-group mode
+ENVELOPE_OVERHEAD = 2 * MESSAGE_OVERHEAD + ITEM_OVERHEAD
+
+# hard limit of the bytes of a message s.t it still fits into a single message once wrapped into a GroupMessage
+MAX_PAYLOAD_SIZE = MAX_MESSAGE_SIZE - MESSAGE_OVERHEAD
+
+# hard limit of the bytes of the serialized txs of a block s.t the block fits into a single message once wrapped
+MAX_BLOCK_SIZE = MAX_MESSAGE_SIZE - MESSAGE_OVERHEAD - ENVELOPE_OVERHEAD
+
+# weight of a new sample in the moving averages of the txn inter-arrival time and the commit duration
+EWMA_WEIGHT = 0.125
+
 # genesis block
 GENESIS = Block(-1, None, [], 0)
 GENESIS.depth = 0
@@ -34,6 +65,71 @@ if not TESTING:
     logging.disable(logging.DEBUG)
 
 
+class SyncStripe:
+    """A range of committed heights that is fetched from a single peer during a synchronization.
+
+    Args:
+        start (int): committed height of the first block.
+        stop (int): committed height following the last block (None if the stripe reaches up to the head block).
+
+    Attributes:
+        peer_node_id (str): peer the stripe is fetched from (None if not yet assigned).
+        blocks (list): blocks received so far.
+        done (bool): True if the peer sent the last chunk of the stripe.
+        committed_block (int): block id of the last committed block of the peer (only set once done).
+    """
+    def __init__(self, start, stop):
+        self.start = start
+        self.stop = stop
+        self.peer_node_id = None
+        self.blocks = []
+        self.done = False
+        self.committed_block = None
+
+
+class SnapshotTransfer:
+    """A snapshot of the app state that is streamed from a peer to a node that fell too far behind.
+
+    Args:
+        peer_node_id (str): node id of the peer the snapshot is sent to (or received from).
+        stream: binary file-like object the snapshot is read from (sender) or written to (receiver).
+
+    Attributes:
+        block (Block): last committed block whose txs are contained in the snapshot (only known to the sender).
+        height (int): committed height of `block`.
+        credit (int): number of chunks the receiver is still willing to receive.
+    """
+    def __init__(self, peer_node_id, stream):
+        self.peer_node_id = peer_node_id
+        self.stream = stream
+        self.block = None
+        self.height = None
+        self.credit = 0
+
+
+class PendingTxn:
+    """A transaction made by this node that has not been committed yet.
+
+    Args:
+        txn (Transaction): the transaction.
+        deferred (Deferred): fires with the txn id once the transaction has been committed.
+
+    Attributes:
+        resubmits (int): number of times the transaction has been resubmitted so far.
+        timeout_call (IDelayedCall): call of `Node.txn_timeout` (None if cancelled).
+    """
+    def __init__(self, txn, deferred):
+        self.txn = txn
+        self.deferred = deferred
+        self.resubmits = 0
+        self.timeout_call = None
+
+
+class NodeBusyError(Exception):
+    """A transaction has not been admitted since too many transactions are pending (see `Node.update_admission`). The
+    app should try again later."""
+
+
 class Node(ConnectionManager):
     """This class represents a piChain node. It is a subclass of the ConnectionManager class defined in the networking
     module. This allows to directly call functions like broadcast and respond from the networking module and to override
@@ -42,13 +138,23 @@ class Node(ConnectionManager):
     Args:
         node_index (int): the index of this node into the peers dictionary. The entry defines its ip address and port.
         peers_dict (dict): a dict containing the (ip, port) pairs for all nodes (see examples folder for its structure).
+        group_id (int): id of the consensus group if this node is one of multiple groups sharing the connections (see
+            multigroup.py). None if it is the only group.
 
     Attributes:
         state (int): 0,1 or 2 corresponds to QUICK, MEDIUM or SLOW.
+        learner (bool): True if this node is a learner (see `ConnectionManager.learners`). A learner receives the
+            committed blocks from the node that committed them but never votes, never creates blocks and never becomes
+            the quick node. A node removed from the configuration acts like a learner.
+        voters (list): sorted ids of the nodes that are not learners.
         blocktree (Blocktree): The blocktree which this node owns.
         known_txs (set): all txs seen so far. Set of txn ids.
         new_txs (list): txs not yet in a block, behaving like a queue.
+        new_txs_size (int): number of bytes of the serialized txs in `new_txs` (including cbor overhead).
+        last_arrival (float): time the last new txn has been received.
+        arrival_interval (float): moving average of the time between two new txs (None before the second txn).
         oldest_txn (Transaction): txn which started a timeout.
+        patience_timer (Timer): calls `timeout_over` with `oldest_txn` once the patience of this node is over.
         s_max_block_depth (int):  depth of deepest block seen in round 1 (like T_max).
         s_prop_block (Block): stored block from a valid propose message.
         s_supp_block (Block): block supporting proposed block (like T_store).
@@ -61,29 +167,115 @@ class Node(ConnectionManager):
         c_quick_proposing (bool): a node may skip round 1 if his ticket is still valid.
         c_commit_running (bool): True if a commit currently running.
         c_current_committable_block (Block): block to still be committed
+        c_commit_started_at (float): time the running commit has been started.
+        c_commit_duration (float): moving average of the time a commit takes (None before the first commit).
         tx_committed (Callable): method given by app service that is called once a transaction has been committed.
-        rtts (dict): Mapping from peer_node_id to RTT. Used to estimate expected round trip time.
-        expected_rtt (float): based on this rtt the timeouts are computed.
+        tx_applied (Callable): optional method given by app service that is called on a worker thread with the commands
+            of one or more committed blocks (in commit order). Unlike `tx_committed` a slow app does not stall the
+            reactor. The reads of this node wait until the committed txs have been applied (see `applied_height`).
+        state_machine (StateMachine): optional app whose `apply` method is used instead of `tx_applied`. The commands
+            of the committed blocks are applied on `APPLY_WORKERS` threads in parallel (sharded by their partition key).
+        apply_pipeline (ApplyPipeline): queue of the committed blocks waiting to be passed to `tx_applied` or
+            `state_machine` (None until the first block is committed with one of them set).
+        on_block_tentative (Callable): optional method given by app service that is called with a Block once it is
+            on the path to the head block (it will most likely be committed). Allows to speculatively prepare the work
+            of its transactions.
+        on_block_committed (Callable): optional method given by app service that is called with a Block once it has
+            been committed (after `tx_committed` has been called with its commands).
+        on_block_reverted (Callable): optional method given by app service that is called with a Block passed to
+            `on_block_tentative` before that is not on the path to the head block anymore (fork switch). Blocks are
+            reverted children before parents.
+        s_lease_holder (str): node id of the node this node granted a lease to (see `LEASE_DURATION`).
+        s_lease_expires (float): time the lease granted to `s_lease_holder` expires. Like all lease times it is read
+            from the monotonic clock s.t a step of the wall clock (e.g by NTP) can not extend a lease.
+        c_lease_expires (float): time the lease of this node expires (only valid if this node is QUICK).
+        c_lease_seq (int): sequence number of the last LEASE message.
+        c_lease_votes (int): number of LEASE_ACK messages received for `c_lease_seq`.
+        c_lease_sent (float): time the last LEASE message was broadcast.
+        c_lease_valid (bool): False if a LEASE_ACK message showed that this node missed a commit.
+        c_lease_waiters (list): Deferreds of reads waiting for this node to renew its lease.
+        read_requests (dict): Mapping from request_id to the Deferred of a read waiting for the read index of the quick
+            node.
+        read_request_counter (int): used to create unique request ids.
+        height_waiters (list): (height, Deferred) pairs of reads waiting until the committed height is reached.
+        known_height (int): highest committed height this node heard of (from COMMIT messages and the committed
+            heights reported by the peers).
+        heard_heights (deque): (height, time) pairs of the committed heights this node heard of but did not apply yet
+            (see `applied_height`), with the time it first heard of them.
+        staleness_waiters (list): (max_blocks, max_age, Deferred) tuples of bounded staleness reads waiting for this
+            node to catch up.
+        peer_heights (dict): Mapping from peer_node_id to the last committed height reported by the peer (piggybacked on
+            TRY_OK, PROPOSE_ACK and pong messages). Used to perform genesis block changes.
+        log_subscribers (set): readers of the committed log (see `CommittedLogProtocol`). The blocks from their
+            `next_height` on are not deleted at a genesis block change.
+        pending_txs (dict): Mapping from txn_id to PendingTxn. Contains the txs made by this node (see `make_txn`) that
+            have not been committed yet.
+        busy (bool): True while this node does not admit new txs (see `update_admission`).
+        busy_since (float): time this node stopped admitting new txs (None if it is not busy).
+        busy_periods (int): number of times this node stopped admitting new txs so far.
+        busy_time (float): number of seconds this node did not admit new txs so far (without the running busy period).
+        rejected_txs (int): number of txs `make_txn` did not admit so far.
+        ingress_producers (set): producers of txs registered by the app (e.g the transports of its client connections).
+            They are paused while this node is busy.
+        rtts (dict): Mapping from peer_node_id to RttEstimator. Used to estimate expected round trip time. Only contains
+            connected peers.
+        expected_rtt (float): based on this rtt the timeouts are computed. It is the RTT needed to reach a majority.
+        c_request_times (dict): Mapping from request_seq to the time (monotonic clock) the TRY or PROPOSE message with
+            this sequence number was broadcast. Used to sample RTTs from the paxos traffic.
         slow_timeout_backoff (float): fix additional timeout backoff of a slow node (u.a.r only set once).
-        n (int): total numberof nodes.
-        retry_commit_timeout_queued (bool): is there a timeout in queue that will retry to commit.
+        lc_heartbeat (LoopingCall): calls `heartbeat` every `HEARTBEAT_INTERVAL` once the node has been started.
+        quick_node_id (str): node id of the node this node receives heartbeats from (None if unknown).
+        quick_detector (PhiAccrualDetector): failure detector fed by the heartbeats of `quick_node_id`.
+        quick_suspected_at (float): time this node started to suspect the quick node to have crashed (None if it does
+            not suspect it).
+        n (int): number of voters (the learners do not count towards the quorums). Changes with the configuration
+            (see `change_membership`).
+        commit_timer (Timer): calls `commit_timeout` if the running commit did not finish in time.
+        retry_commit_timer (Timer): calls `start_commit_process` to retry to commit `c_current_committable_block`.
+        sync_sessions (dict): Mapping from peer_node_id to a deque of block ids that still have to be streamed to this
+            peer during a synchronization.
+        sync_credits (dict): Mapping from peer_node_id to the number of chunks the peer is still willing to receive.
+        sync_heights (dict): Mapping from peer_node_id to the committed height reported by the peer during a
+            synchronization (None if not syncing).
+        sync_target (int): highest committed height reported by a peer once the synchronization has been planned.
+        sync_stripes (list): SyncStripe instances sorted by start height. The missing range of blocks that is fetched
+            in parallel from multiple peers.
+        snapshot_sessions (dict): Mapping from peer_node_id to the SnapshotTransfer streamed to this peer.
+        snapshot_transfer (SnapshotTransfer): snapshot that is currently received from a peer (None if there is none).
+        started_at (float): time this node has been started (None if not started yet).
+        time_to_first_commit (float): time it took from the start until this node committed its first block.
     """
-    def __init__(self, node_index, peers_dict):
+    def __init__(self, node_index, peers_dict, group_id=None):
 
         super().__init__(node_index, peers_dict)
 
+        self.group_id = group_id
         self.state = SLOW
 
-        # ensure that exactly one node will be QUICK in beginning
-        if self.id == 0:
-            self.state = QUICK
+        self.blocktree = Blocktree(node_index, group_id)
 
-        self.blocktree = Blocktree(node_index)
+        # a committed membership change replaces the peers dict given at construction
+        peers = self.blocktree.db.get(b'peers')
+        if peers is not None:
+            self.set_peers(json.loads(peers.decode()))
+        self.learner = None
+        self.voters = None
+        self.n = None
+        self.update_roles()
+
+        # ensure that exactly one node will be QUICK in beginning (spread the groups among the voters). A restarted node
+        # does not claim the role since another node may have taken it over in the meantime.
+        if self.id == self.voters[(group_id or 0) % len(self.voters)] and self.blocktree.committed_height() == 0:
+            self.state = QUICK
 
         # Transaction variables
         self.known_txs = set()
         self.new_txs = []
+        self.new_txs_size = 0
         self.oldest_txn = None
+        self.patience_timer = Timer()
+        self.last_arrival = None
+        self.arrival_interval = None
 
         # node acting as server
         self.s_max_block_depth = 0
@@ -100,16 +292,72 @@ class Node(ConnectionManager):
         self.c_quick_proposing = False
         self.c_commit_running = False
         self.c_current_committable_block = None
+        self.c_commit_started_at = None
+        self.c_commit_duration = None
 
         self.tx_committed = None
+        self.tx_applied = None
+        self.state_machine = None
+        self.apply_pipeline = None
+        self.on_block_tentative = None
+        self.on_block_committed = None
+        self.on_block_reverted = None
+        self.pending_txs = {}
+
+        # admission control
+        self.busy = False
+        self.busy_since = None
+        self.busy_periods = 0
+        self.busy_time = 0
+        self.rejected_txs = 0
+        self.ingress_producers = set()
+
+        # lease and read variables
+        self.s_lease_holder = None
+        self.s_lease_expires = 0
+        self.c_lease_expires = 0
+        self.c_lease_seq = 0
+        self.c_lease_votes = 0
+        self.c_lease_sent = None
+        self.c_lease_valid = True
+        self.c_lease_waiters = []
+        self.read_requests = {}
+        self.read_request_counter = 0
+        self.height_waiters = []
+        self.known_height = 0
+        self.heard_heights = deque()
+        self.staleness_waiters = []
+        self.peer_heights = {}
+        self.log_subscribers = set()
 
         # timeout/timing variables
         self.rtts = {}
         self.expected_rtt = 1
+        self.c_request_times = {}
         self.slow_timeout_backoff = None
-        self.retry_commit_timeout_queued = False
-
-        self.n = len(self.peers)
+        self.commit_timer = Timer()
+        self.retry_commit_timer = Timer()
+
+        # failure detection variables
+        self.lc_heartbeat = LoopingCall(self.heartbeat)
+        self.quick_node_id = None
+        self.quick_detector = None
+        self.quick_suspected_at = None
+
+        # synchronization variables
+        self.sync_sessions = {}
+        self.sync_credits = {}
+        self.sync_heights = None
+        self.sync_target = None
+        self.sync_stripes = []
+
+        # snapshot variables
+        self.snapshot_sessions = {}
+        self.snapshot_transfer = None
+
+        # bootstrap measurements
+        self.started_at = None
+        self.time_to_first_commit = None
 
         # load server variables (after crash)
         for key, value in self.blocktree.db:
@@ -122,6 +370,24 @@ class Node(ConnectionManager):
                 block = self.blocktree.nodes.get(int(value.decode()))
                 self.s_supp_block = block
 
+    def start(self):
+        """Start the node (see `ConnectionManager.start`), remember the start time, start the heartbeats and apply the
+        committed blocks the state machine did not persist before a restart (see `replay_unapplied`)."""
+        self.started_at = time.time()
+        self.lc_heartbeat.clock = self.reactor
+        self.lc_heartbeat.start(HEARTBEAT_INTERVAL, now=False)
+        self.replay_unapplied()
+        super().start()
+
+    def stop(self):
+        """Stop the heartbeats and timers and close all connections (see `ConnectionManager.stop`)."""
+        if self.lc_heartbeat.running:
+            self.lc_heartbeat.stop()
+        self.patience_timer.cancel()
+        self.commit_timer.cancel()
+        self.retry_commit_timer.cancel()
+        super().stop()
+
     def receive_paxos_message(self, message, sender):
         """React on a received paxos `message`. This method implements the main functionality of the paxos algorithm.
 
@@ -130,7 +396,15 @@ class Node(ConnectionManager):
             sender (Connection): Connection instance of the sender (None if sender is this Node).
         """
         logger.debug('receive message type = %s', message.msg_type)
+        if self.learner and message.msg_type in ('TRY', 'PROPOSE', 'LEASE'):
+            # learners never vote
+            return
+
         if message.msg_type == 'TRY':
+            if self.lease_conflict(sender):
+                # promised not to accept messages from other nodes until the lease granted to the quick node expires
+                return
+
             # make sure last commited block of sender is also committed by this node
             if message.last_committed_block not in self.blocktree.committed_blocks:
                 last_committed_block = self.get_block(message.last_committed_block)
@@ -158,6 +432,7 @@ class Node(ConnectionManager):
 
                 # create a TRY_OK message
                 try_ok = PaxosMessage('TRY_OK', message.request_seq)
+                try_ok.height = self.blocktree.committed_height()
                 if self.s_prop_block is not None:
                     try_ok.prop_block = self.s_prop_block.block_id
                 if self.s_supp_block is not None:
@@ -168,6 +443,12 @@ class Node(ConnectionManager):
                     self.receive_paxos_message(try_ok, None)
 
         elif message.msg_type == 'TRY_OK':
+            self.sample_request_rtt(message, sender)
+            if sender is not None:
+                self.update_peer_height(sender.peer_node_id, message.height)
+            if not self.is_voter(sender):
+                return
+
             # check if message is not outdated
             if message.request_seq != self.c_request_seq:
                 # outdated message
@@ -196,8 +477,9 @@ class Node(ConnectionManager):
                 # the compromise block will be the block we are going to propose in the end
                 self.c_com_block = self.c_new_block
 
-                # check if we need to support another block instead of the new block
-                if self.c_prop_block:
+                # check if we need to support another block instead of the new block (not needed if the new block is
+                # a descendant of it, e.g if the previous quick node got it committed before handing its role over)
+                if self.c_prop_block and not self.blocktree.ancestor(self.c_prop_block, self.c_new_block):
                     self.c_com_block = self.c_prop_block
 
                 # create PROPOSE message
@@ -205,10 +487,14 @@ class Node(ConnectionManager):
                 propose.com_block = self.c_com_block.block_id
                 propose.new_block = self.c_new_block.block_id
 
+                self.record_request_time(self.c_request_seq)
                 self.broadcast(propose, 'PROPOSE')
                 self.receive_paxos_message(propose, None)
 
         elif message.msg_type == 'PROPOSE':
+            if self.lease_conflict(sender):
+                return
+
             # if did not receive a try message with a deeper new block in mean time can store proposed block on server
             new_block = self.get_block(message.new_block)
             if new_block is None:
@@ -229,9 +515,11 @@ class Node(ConnectionManager):
                     block_id_bytes = str(self.s_supp_block.block_id).encode()
                     self.blocktree.db.put(b's_supp_block', block_id_bytes)
 
-                # create a PROPOSE_ACK message
+                # create a PROPOSE_ACK message (which grants a lease to the sender)
+                self.grant_lease(sender)
                 propose_ack = PaxosMessage('PROPOSE_ACK', message.request_seq)
                 propose_ack.com_block = message.com_block
+                propose_ack.height = self.blocktree.committed_height()
 
                 if sender is not None:
                     self.respond(propose_ack, sender)
@@ -239,6 +527,12 @@ class Node(ConnectionManager):
                     self.receive_paxos_message(propose_ack, None)
 
         elif message.msg_type == 'PROPOSE_ACK':
+            self.sample_request_rtt(message, sender)
+            if sender is not None:
+                self.update_peer_height(sender.peer_node_id, message.height)
+            if not self.is_voter(sender):
+                return
+
             # check if message is not outdated
             if message.request_seq != self.c_request_seq:
                 # outdated message
@@ -253,43 +547,133 @@ class Node(ConnectionManager):
                 com_block = self.get_block(message.com_block)
                 if com_block is None:
                     return
+                # a majority acknowledged the PROPOSE message and thus granted a lease
+                sent = self.c_request_times.get(message.request_seq)
+                if sent is not None:
+                    self.c_lease_expires = sent + (1 - LEASE_CLOCK_DRIFT) * LEASE_DURATION
+
                 commit = PaxosMessage('COMMIT', self.c_request_seq)
                 commit.com_block = message.com_block
+                commit.height = self.blocktree.height_after_commit(com_block)
                 self.broadcast(commit, 'COMMIT')
+                height = self.blocktree.committed_height()
                 self.commit(com_block)
+                self.stream_to_learners(height, commit)
 
-                # allow new paxos instance
+                # allow new paxos instance. Quick proposing is only possible once the own block got committed: if a
+                # compromise block was committed instead, the acceptors may not have reset their max block depth yet
                 self.c_commit_running = False
-                self.c_quick_proposing = True
+                self.commit_timer.cancel()
+                if self.c_new_block is not None and com_block == self.c_new_block:
+                    self.c_quick_proposing = True
+                if self.c_commit_started_at is not None:
+                    self.update_commit_duration(time.time() - self.c_commit_started_at)
+                self.start_next_commit()
 
         elif message.msg_type == 'COMMIT':
+            self.update_known_height(message.height)
             com_block = self.get_block(message.com_block)
             if com_block is None:
                 return
             self.commit(com_block)
 
+        elif message.msg_type == 'LEASE':
+            if self.lease_conflict(sender):
+                return
+            self.grant_lease(sender)
+
+            # tell the sender about the blocks this node committed or accepted s.t it can check it did not miss any
+            lease_ack = PaxosMessage('LEASE_ACK', message.request_seq)
+            lease_ack.last_committed_block = self.blocktree.committed_block.block_id
+            if self.s_prop_block is not None:
+                lease_ack.prop_block = self.s_prop_block.block_id
+            if sender is not None:
+                self.respond(lease_ack, sender)
+            else:
+                self.receive_paxos_message(lease_ack, None)
+
+        elif message.msg_type == 'LEASE_ACK':
+            if message.request_seq != self.c_lease_seq or not self.is_voter(sender):
+                # outdated message
+                return
+
+            # make sure last committed block of sender is also committed by this node
+            if message.last_committed_block not in self.blocktree.committed_blocks:
+                last_committed_block = self.blocktree.nodes.get(message.last_committed_block)
+                if last_committed_block is not None:
+                    self.commit(last_committed_block)
+                if message.last_committed_block not in self.blocktree.committed_blocks:
+                    self.c_lease_valid = False
+
+            # a block accepted by the sender may have been committed by another node
+            if message.prop_block is not None:
+                prop_block = self.blocktree.nodes.get(message.prop_block)
+                if prop_block is None or (prop_block != self.blocktree.committed_block and
+                                          not self.blocktree.ancestor(prop_block, self.blocktree.committed_block)):
+                    self.c_lease_valid = False
+
+            self.c_lease_votes += 1
+            if self.c_lease_votes > self.n / 2:
+                # ignore further answers
+                self.c_lease_seq += 1
+                if self.c_lease_valid:
+                    self.c_lease_expires = self.c_lease_sent + (1 - LEASE_CLOCK_DRIFT) * LEASE_DURATION
+                    self.serve_lease_waiters()
+                elif len(self.c_lease_waiters) != 0:
+                    # try again once the missing commit is known
+                    deferLater(self.reactor, self.expected_rtt, self.renew_lease)
+
     def receive_transaction(self, txn):
         """React on a received `txn` depending on state.
 
         Args:
             txn (Transaction): Transaction received.
         """
+        if self.learner:
+            # the txs made on a learner are put into blocks by the voters
+            return
+
         # check if txn has already been seen
         if txn.txn_id not in self.known_txs:
             logger.debug('txn has not yet been seen')
             # add txn to set of seen txs
             self.known_txs.add(txn.txn_id)
 
+            self.update_arrival_interval()
+
             # timeout handling
             self.new_txs.append(txn)
+            self.new_txs_size += txn.get_size() + ITEM_OVERHEAD
             if len(self.new_txs) == 1:
                 self.oldest_txn = txn
                 # start a timeout
                 logger.debug('start timeout')
-                deferLater(self.reactor, self.get_patience(), self.timeout_over, txn)
+                self.patience_timer.arm(self.reactor, self.get_patience(), self.timeout_over, txn)
+
+            # create a block early if enough txs have been accumulated
+            if ADAPTIVE_BATCHING and self.state == QUICK and \
+                    (len(self.new_txs) >= BATCH_TARGET_COUNT or self.new_txs_size >= BATCH_TARGET_BYTES):
+                self.timeout_over(self.new_txs[0])
+
+            self.update_admission()
         else:
             logger.debug('txn has already been seen')
 
+    def stream_to_learners(self, height, commit):
+        """Send the blocks this node committed above `height` followed by the COMMIT message to the learners. Only
+        the node that committed the blocks sends them, so the learners add no load to the other voters. A learner that
+        missed blocks (e.g while it was disconnected) requests them or synchronizes like any other node.
+
+        Args:
+            height (int): committed height before the commit.
+            commit (PaxosMessage): the COMMIT message broadcast to the voters.
+        """
+        if len(self.learners) == 0:
+            return
+        for block_id in self.blocktree.committed_blocks[height + 1:]:
+            self.send_to_learners(RespondBlockMessage([self.blocktree.nodes.get(block_id)]))
+        self.send_to_learners(commit)
+
     def receive_block(self, block):
         """React on a received `block`.
 
@@ -328,32 +712,492 @@ class Node(ConnectionManager):
         """
         if self.blocktree.nodes.get(req.block_id) is not None:
             blocks = [self.blocktree.nodes.get(req.block_id)]
+            size = MESSAGE_OVERHEAD + blocks[0].get_size() + ITEM_OVERHEAD
 
-            # add five ancestors to blocks
+            # add five ancestors to blocks (as long as they fit into the message)
             b = self.blocktree.nodes.get(req.block_id)
             i = 0
             while i < RECOVERY_BLOCKS_COUNT and b is not None and b != self.blocktree.genesis:
                 i = i + 1
                 b = self.blocktree.nodes.get(b.parent_block_id)
                 if b is not None and b != self.blocktree.genesis:
+                    size += b.get_size() + ITEM_OVERHEAD
+                    if size > MAX_PAYLOAD_SIZE:
+                        break
                     blocks.append(b)
 
             # send blocks back
             respond = RespondBlockMessage(blocks)
             self.respond(respond, sender)
 
-    def receive_respond_blocks_message(self, resp):
-        """Receive the blocks that are missing from a peer. Can directly be added to `self.nodes`.
+    def receive_respond_blocks_message(self, resp, sender):
+        """Receive the blocks that are missing from a peer. Can directly be added to `self.nodes`. If the blocks do
+        not close the gap to the blocks stored locally, this node fell far behind and starts a synchronization with
+        the sender.
 
         Args:
             resp (RespondBlockMessage): may contain the missing blocks s.t the node can recover.
+            sender (Connection): Connection instance form the sender.
         """
         blocks = resp.blocks
         for b in blocks:
             self.blocktree.add_block(b)
 
+        # the last block is the oldest ancestor of the missing block
+        if len(blocks) != 0 and blocks[-1] != self.blocktree.genesis and \
+                self.blocktree.nodes.get(blocks[-1].parent_block_id) is None:
+            self.start_sync()
+
+    def start_sync(self):
+        """Probe all peers for their committed height. Once they answered, the missing range of blocks is split into
+        stripes which are fetched in parallel (see `plan_sync`).
+        """
+        if self.sync_heights is not None or len(self.sync_stripes) != 0:
+            return
+        logger.debug('start synchronization')
+        self.sync_heights = {}
+        self.broadcast(SyncRequestMessage(0), 'SRQ')
+        deferLater(self.reactor, 2 * self.expected_rtt, self.plan_sync)
+
+    def plan_sync(self):
+        """Split the range of blocks between the committed height of this node and the highest committed height
+        reported by a peer into stripes and assign them to the peers.
+        """
+        if self.sync_heights is None or len(self.sync_stripes) != 0:
+            return
+
+        height = self.blocktree.committed_height()
+        target = max(self.sync_heights.values(), default=-1)
+        if target <= height:
+            self.sync_heights = None
+            return
+
+        # each peer fetches a stripe of at least SYNC_STRIPE_MIN_BLOCKS blocks
+        self.sync_target = target
+        missing = target - height
+        count = max(1, min(len(self.sync_heights), missing // SYNC_STRIPE_MIN_BLOCKS))
+        stripe_size = -(-missing // count)
+        start = height + 1
+        while start + stripe_size <= target:
+            self.sync_stripes.append(SyncStripe(start, start + stripe_size))
+            start += stripe_size
+        # the last stripe also contains the uncommitted blocks up to the head block of the peer
+        self.sync_stripes.append(SyncStripe(start, None))
+
+        logger.debug('synchronize %s blocks in %s stripes', str(missing), str(len(self.sync_stripes)))
+        self.assign_sync_stripes()
+
+    def assign_sync_stripes(self):
+        """Assign each stripe that is not fetched yet to an idle peer whose committed height covers the stripe. The
+        highest stripes are assigned first s.t they get the peers with the highest committed height.
+        """
+        busy = set()
+        for stripe in self.sync_stripes:
+            if stripe.peer_node_id is not None and not stripe.done:
+                busy.add(stripe.peer_node_id)
+
+        peers = sorted(self.sync_heights.items(), key=lambda item: item[1], reverse=True)
+        for stripe in reversed(self.sync_stripes):
+            if stripe.peer_node_id is not None:
+                continue
+            needed = stripe.start if stripe.stop is None else stripe.stop - 1
+            for peer_node_id, peer_height in peers:
+                connection = self.peers_connection.get(peer_node_id)
+                if peer_node_id in busy or peer_height < needed or connection is None:
+                    continue
+                stripe.peer_node_id = peer_node_id
+                busy.add(peer_node_id)
+                self.respond(SyncRequestMessage(SYNC_WINDOW, stripe.start, stripe.stop), connection)
+                break
+
+        if len(busy) == 0:
+            # all stripes are done or no peer is left that could fetch the remaining ones
+            self.finish_sync()
+
+    def finish_sync(self):
+        """Stitch the stripes together, verifying that each block is the child of its predecessor. The verified blocks
+        are written to disk in a single batch and the blocks committed by the peers are committed locally.
+        """
+        height = self.blocktree.committed_height()
+        blocks = []
+        complete = True
+        for stripe in self.sync_stripes:
+            blocks.extend(stripe.blocks)
+            if not stripe.done or (stripe.stop is not None and len(stripe.blocks) != stripe.stop - stripe.start):
+                complete = False
+                break
+        committed_block_id = self.sync_stripes[-1].committed_block if complete else None
+        target = self.sync_target
+
+        self.sync_heights = None
+        self.sync_stripes = []
+
+        # verify parent links
+        verified = []
+        parent_id = self.blocktree.committed_block.block_id
+        for b in blocks:
+            if b.parent_block_id != parent_id:
+                logger.debug('synchronized block %s does not link to its predecessor', str(b.block_id))
+                complete = False
+                break
+            verified.append(b)
+            parent_id = b.block_id
+
+        logger.debug('synchronization finished: %s blocks received', str(len(verified)))
+        if len(verified) == 0:
+            return
+        self.blocktree.add_blocks(verified)
+
+        if complete and self.blocktree.nodes.get(committed_block_id) is not None:
+            self.commit(self.blocktree.nodes.get(committed_block_id))
+            self.receive_block(verified[-1])
+        else:
+            # only the blocks up to the highest committed height reported by a peer are known to be committed
+            committed_count = min(len(verified), target - height)
+            if committed_count > 0:
+                self.commit(verified[committed_count - 1])
+
+    def receive_sync_request_message(self, req, sender):
+        """A peer that fell far behind probes the committed height of this node, requests a stripe of blocks or grants
+        more credit for an already running stripe. Stream the blocks back in chunks as long as there is credit.
+
+        Args:
+            req (SyncRequestMessage): Received SyncRequestMessage.
+            sender (Connection): Connection instance form the sender.
+        """
+        peer_node_id = sender.peer_node_id
+        if req.credit == 0:
+            height = self.blocktree.committed_height()
+            self.respond(SyncResponseMessage([], None, False, height), sender)
+            return
+
+        if req.start is not None:
+            block_ids = self.blocktree.committed_range(req.start, req.stop)
+            if block_ids is None:
+                # cannot serve this stripe
+                height = self.blocktree.committed_height()
+                self.respond(SyncResponseMessage([], None, True, height), sender)
+                return
+            self.sync_sessions.update({peer_node_id: deque(block_ids)})
+            self.sync_credits.update({peer_node_id: 0})
+
+        if peer_node_id not in self.sync_sessions:
+            return
+        self.sync_credits[peer_node_id] += req.credit
+        self.send_sync_chunks(sender)
+
+    def send_sync_chunks(self, sender):
+        """Send chunks of at most `SYNC_CHUNK_SIZE` bytes to the peer as long as it has credit left.
+
+        Args:
+            sender (Connection): Connection instance of the peer that is synchronizing.
+        """
+        peer_node_id = sender.peer_node_id
+        block_ids = self.sync_sessions.get(peer_node_id)
+        while block_ids is not None and self.sync_credits.get(peer_node_id) > 0:
+            blocks = []
+            size = 0
+            while len(block_ids) != 0:
+                b = self.blocktree.nodes.get(block_ids[0])
+                if b is None:
+                    # block has been deleted in the meantime (genesis block change)
+                    block_ids.clear()
+                    break
+                b_size = b.get_size() + ITEM_OVERHEAD
+                if len(blocks) != 0 and size + b_size > SYNC_CHUNK_SIZE:
+                    break
+                blocks.append(b)
+                size += b_size
+                block_ids.popleft()
+
+            done = len(block_ids) == 0
+            committed_block = None
+            if done:
+                committed_block = self.blocktree.committed_block.block_id
+                self.sync_sessions.pop(peer_node_id)
+                self.sync_credits.pop(peer_node_id)
+                block_ids = None
+            else:
+                self.sync_credits[peer_node_id] -= 1
+
+            height = self.blocktree.committed_height()
+            self.respond(SyncResponseMessage(blocks, committed_block, done, height), sender)
+
+    def receive_sync_response_message(self, resp, sender):
+        """Receive the committed height of a peer (answer to a probe) or a chunk of blocks of a stripe. For each chunk
+        one more credit is granted to the peer. Once all stripes are done they are stitched together.
+
+        Args:
+            resp (SyncResponseMessage): Received SyncResponseMessage.
+            sender (Connection): Connection instance form the sender.
+        """
+        peer_node_id = sender.peer_node_id
+        stripe = self.get_sync_stripe(peer_node_id)
+        if stripe is None:
+            if self.sync_heights is not None and len(self.sync_stripes) == 0 and not resp.done:
+                # answer to a probe
+                self.sync_heights.update({peer_node_id: resp.height})
+                # the probe has been broadcast to the voters only
+                if len(self.sync_heights) == len([p for p in self.peers_connection if p not in self.learners]):
+                    self.plan_sync()
+            return
+
+        stripe.blocks.extend(resp.blocks)
+        if not resp.done:
+            self.respond(SyncRequestMessage(1), sender)
+            return
+
+        if len(stripe.blocks) == 0 and stripe.start == self.blocktree.committed_height() + 1 and \
+                resp.height is not None and resp.height >= stripe.start and self.state_machine is not None:
+            # the peer committed the blocks but deleted them (genesis block change): catch up with a snapshot
+            logger.debug('blocks are not available anymore, request a snapshot')
+            self.sync_heights = None
+            self.sync_stripes = []
+            self.request_snapshot(sender)
+            return
+
+        stripe.done = True
+        stripe.committed_block = resp.committed_block
+        if stripe.stop is not None and len(stripe.blocks) < stripe.stop - stripe.start:
+            # peer could not serve the whole stripe: fetch the rest from another peer
+            self.split_sync_stripe(stripe)
+        self.assign_sync_stripes()
+
+    def request_snapshot(self, sender):
+        """Ask a peer for a snapshot of the app state (see `StateMachine.snapshot`). The chunks are written to a
+        temporary file.
+
+        Args:
+            sender (Connection): Connection instance of the peer.
+        """
+        if self.snapshot_transfer is not None:
+            return
+        self.snapshot_transfer = SnapshotTransfer(sender.peer_node_id, tempfile.TemporaryFile())
+        self.respond(SnapshotRequestMessage(SYNC_WINDOW, True), sender)
+
+    def receive_snapshot_request_message(self, req, sender):
+        """A peer that fell too far behind asks for a snapshot of the app state or grants more credit. The snapshot is
+        taken once no commands are applied (s.t it matches the applied height) and streamed back in chunks as long as
+        there is credit.
+
+        Args:
+            req (SnapshotRequestMessage): Received SnapshotRequestMessage.
+            sender (Connection): Connection instance of the sender.
+        """
+        peer_node_id = sender.peer_node_id
+        if req.start:
+            session = self.snapshot_sessions.pop(peer_node_id, None)
+            if session is not None:
+                session.stream.close()
+            if self.state_machine is None or self.get_apply_pipeline().failure is not None:
+                # no snapshot can be taken (the app state is not known to match a committed height)
+                self.respond(SnapshotChunkMessage(b'', True, None, None), sender)
+                return
+            self.get_apply_pipeline().when_idle(self.start_snapshot_session, req.credit, sender)
+            return
+
+        session = self.snapshot_sessions.get(peer_node_id)
+        if session is not None:
+            session.credit += req.credit
+            self.send_snapshot_chunks(sender)
+
+    def start_snapshot_session(self, credit, sender):
+        """Take a snapshot tagged with the last applied block and start streaming it to the peer.
+
+        Args:
+            credit (int): number of chunks the peer is willing to receive.
+            sender (Connection): Connection instance of the peer.
+        """
+        height = self.applied_height()
+        block = self.blocktree.nodes.get(self.blocktree.committed_blocks[height])
+        if block is None or self.peers_connection.get(sender.peer_node_id) is None or \
+                self.apply_pipeline.failure is not None:
+            # the peer falls back to another source (the app state is not known to match a committed height once
+            # applying failed)
+            self.respond(SnapshotChunkMessage(b'', True, None, None), sender)
+            return
+
+        session = SnapshotTransfer(sender.peer_node_id, self.state_machine.snapshot())
+        session.block = block
+        session.height = height
+        session.credit = credit
+        self.snapshot_sessions.update({sender.peer_node_id: session})
+        logger.debug('send snapshot at committed height %s', str(height))
+        self.send_snapshot_chunks(sender)
+
+    def send_snapshot_chunks(self, sender):
+        """Send chunks of `SNAPSHOT_CHUNK_SIZE` bytes to the peer as long as it has credit left.
+
+        Args:
+            sender (Connection): Connection instance of the peer.
+        """
+        while True:
+            # the session is looked up again since responding may end it (e.g over a loopback connection)
+            session = self.snapshot_sessions.get(sender.peer_node_id)
+            if session is None or session.credit <= 0:
+                return
+            data = session.stream.read(SNAPSHOT_CHUNK_SIZE)
+            session.credit -= 1
+            if len(data) < SNAPSHOT_CHUNK_SIZE:
+                self.snapshot_sessions.pop(sender.peer_node_id)
+                session.stream.close()
+                if len(data) + session.block.get_size() + ENVELOPE_OVERHEAD > MAX_MESSAGE_SIZE:
+                    # the rest of the data and the block do not fit into a single message
+                    self.respond(SnapshotChunkMessage(data, False, None, None), sender)
+                    data = b''
+                self.respond(SnapshotChunkMessage(data, True, session.block, session.height), sender)
+                return
+            self.respond(SnapshotChunkMessage(data, False, None, None), sender)
+
+    def receive_snapshot_chunk_message(self, message, sender):
+        """Receive a chunk of the snapshot requested from the peer and grant one more credit. Once the last chunk
+        arrived the snapshot is installed.
+
+        Args:
+            message (SnapshotChunkMessage): Received SnapshotChunkMessage.
+            sender (Connection): Connection instance of the sender.
+        """
+        transfer = self.snapshot_transfer
+        if transfer is None or transfer.peer_node_id != sender.peer_node_id:
+            return
+        transfer.stream.write(message.data)
+        if not message.done:
+            self.respond(SnapshotRequestMessage(1), sender)
+            return
+
+        self.snapshot_transfer = None
+        if message.block is None or message.height <= self.blocktree.committed_height():
+            # the peer can not serve a snapshot or this node caught up in the meantime
+            transfer.stream.close()
+            return
+        transfer.stream.seek(0)
+        self.install_snapshot(message.block, message.height, transfer.stream)
+
+    def install_snapshot(self, block, height, stream):
+        """Make `block` the committed and genesis block of this node and restore the app state from `stream`. All other
+        blocks are deleted (the missing blocks committed after `block` are synchronized afterwards).
+
+        Args:
+            block (Block): last committed block whose txs are contained in the snapshot.
+            height (int): committed height of `block`.
+            stream: binary file-like object containing the snapshot.
+        """
+        logger.info('install snapshot at committed height %s', str(height))
+        pipeline = self.get_apply_pipeline()
+        blocktree = self.blocktree
+        for block_id in list(blocktree.nodes):
+            if block_id != GENESIS.block_id:
+                blocktree.nodes.pop(block_id)
+                blocktree.db.delete(str(block_id).encode())
+        blocktree.add_block(block)
+
+        blocktree.genesis = block
+        blocktree.genesis_height = height
+        blocktree.committed_block = block
+        blocktree.head_block = block
+        # the ids of the blocks below the snapshot are unknown
+        blocktree.committed_blocks = [None] * height + [block.block_id]
+        block_id_bytes = str(block.block_id).encode()
+        with blocktree.db.write_batch() as wb:
+            wb.put(b'genesis', block_id_bytes)
+            wb.put(b'committed_block', block_id_bytes)
+            wb.put(b'head_block', block_id_bytes)
+            wb.put(b'committed_blocks', json.dumps(blocktree.committed_blocks).encode())
+            wb.delete(b's_max_block_depth')
+            wb.delete(b's_prop_block')
+            wb.delete(b's_supp_block')
+        self.s_supp_block = None
+        self.s_prop_block = None
+        self.s_max_block_depth = 0
+
+        # the txs of the deleted blocks are forgotten s.t they are accepted again if they were not committed (their
+        # makers resubmit them). The txs of `block` have been committed: their makers are notified.
+        committed_txs = {txn.txn_id for txn in block.txs}
+        self.new_txs = [txn for txn in self.new_txs if txn.txn_id not in committed_txs]
+        self.new_txs_size = sum(txn.get_size() + ITEM_OVERHEAD for txn in self.new_txs)
+        self.known_txs = committed_txs | {txn.txn_id for txn in self.new_txs}
+        for txn in block.txs:
+            pending = self.pending_txs.pop(txn.txn_id, None)
+            if pending is not None:
+                self.cancel_txn_timeout(pending)
+                pending.deferred.callback(txn.txn_id)
+        self.readjust_timeout()
+
+        pipeline.restore(self.state_machine.restore, stream, height)
+        self.update_known_height(height)
+        self.start_sync()
+
+    def get_sync_stripe(self, peer_node_id):
+        """
+        Args:
+            peer_node_id (str): node id of a peer.
+
+        Returns:
+            SyncStripe: the stripe that is currently fetched from the peer (None if there is no such stripe).
+        """
+        for stripe in self.sync_stripes:
+            if stripe.peer_node_id == peer_node_id and not stripe.done:
+                return stripe
+        return None
+
+    def split_sync_stripe(self, stripe):
+        """Shrink `stripe` to the blocks received so far and add a new, unassigned stripe for the remaining blocks.
+        The peer of `stripe` will not be asked for further stripes.
+
+        Args:
+            stripe (SyncStripe): stripe that could not be fetched completely.
+        """
+        rest = SyncStripe(stripe.start + len(stripe.blocks), stripe.stop)
+        stripe.stop = rest.start
+        stripe.done = True
+        self.sync_stripes.insert(self.sync_stripes.index(stripe) + 1, rest)
+        self.sync_heights.pop(stripe.peer_node_id, None)
+
+    def peer_connected(self, peer_node_id):
+        """A learner that connects while this node is busy is paused right away (see `update_admission`).
+
+        Args:
+            peer_node_id (str): node id of the peer.
+        """
+        super().peer_connected(peer_node_id)
+        if self.busy and peer_node_id in self.learners:
+            self.peers_connection.get(peer_node_id).transport.pauseProducing()
+
+    def peer_disconnected(self, peer_node_id):
+        """Clean up the RTT estimate and the synchronization state kept for the peer with `peer_node_id`. If the peer is
+        the quick node, it is suspected to have crashed.
+
+        Args:
+            peer_node_id (str): node id of the peer.
+        """
+        self.sync_sessions.pop(peer_node_id, None)
+        self.sync_credits.pop(peer_node_id, None)
+        session = self.snapshot_sessions.pop(peer_node_id, None)
+        if session is not None:
+            session.stream.close()
+        if self.snapshot_transfer is not None and self.snapshot_transfer.peer_node_id == peer_node_id:
+            self.snapshot_transfer.stream.close()
+            self.snapshot_transfer = None
+
+        # do not wait for the failure detector if the connection to the quick node is lost
+        if peer_node_id == self.quick_node_id and self.quick_suspected_at is None:
+            logger.info('Suspect quick node %s to have crashed (connection lost)', peer_node_id)
+            self.suspect_quick_node()
+
+        # a disconnected peer must not influence the timeouts anymore
+        if self.rtts.pop(peer_node_id, None) is not None:
+            self.update_expected_rtt()
+
+        if self.sync_heights is not None:
+            stripe = self.get_sync_stripe(peer_node_id)
+            self.sync_heights.pop(peer_node_id, None)
+            if stripe is not None:
+                self.split_sync_stripe(stripe)
+                self.assign_sync_stripes()
+
     def receive_pong_message(self, message, peer_node_id):
-        """Receive PongMessage and update RRT's accordingly.
+        """Receive PongMessage and update RRT's accordingly. The ping interval to the peer is adapted to how much its
+        RTT varies. The pong message also carries the committed height of the peer.
 
         Args:
             message (PongMessage): Received PongMessage
@@ -362,58 +1206,132 @@ class Node(ConnectionManager):
         """
         rtt = round(time.time() - message.time, 3)  # in seconds
         logger.debug('PongMessage received, rtt = %s', str(rtt))
+        self.add_rtt_sample(peer_node_id, rtt)
+        self.update_peer_height(peer_node_id, message.height)
+
+        connection = self.peers_connection.get(peer_node_id)
+        if connection is not None:
+            connection.lc_ping.interval = self.rtts.get(peer_node_id).ping_interval()
+
+    def record_request_time(self, request_seq):
+        """Remember when the TRY or PROPOSE message with `request_seq` was broadcast s.t the answers can be used as RTT
+        samples.
 
-        # update RTT's
-        self.rtts.update({peer_node_id: rtt})
-        self.expected_rtt = max(self.rtts.values()) + 0.1
+        Args:
+            request_seq (int): request sequence number of the message.
+        """
+        self.c_request_times.update({request_seq: time.monotonic()})
+
+        # only keep the most recent requests (answers to older ones are not expected anymore)
+        for seq in [seq for seq in self.c_request_times if seq < request_seq - 4]:
+            self.c_request_times.pop(seq)
+
+    def sample_request_rtt(self, message, sender):
+        """Use a TRY_OK or PROPOSE_ACK message as RTT sample (piggybacked on the paxos traffic).
 
-    def receive_ack_commit_message(self, message):
-        """Check if all nodes acknowledged this block, if true make it the new genesis block and delete the blocks
-        below the new genesis block from db and blocktree.
+        Args:
+            message (PaxosMessage): Received TRY_OK or PROPOSE_ACK message.
+            sender (Connection): Connection instance of the sender (None if sender is this Node).
+        """
+        sent = self.c_request_times.get(message.request_seq)
+        if sender is not None and sent is not None:
+            self.add_rtt_sample(sender.peer_node_id, round(time.monotonic() - sent, 3))
 
-        Note: A node may miss acks because he is down and then once online again, if he commits the missed blocks, the
-        other nodes will perform a genesis block change while he doesn't. No problem since a temporary inconsistency
-        between genesis blocks does not matter.
+    def add_rtt_sample(self, peer_node_id, rtt):
+        """Update the RTT estimate of a peer and recompute `expected_rtt`.
 
         Args:
-            message (AckCommitMessage): Received AckCommitMessage.
+            peer_node_id (str): node id of the peer.
+            rtt (float): measured round trip time in seconds.
         """
-        # update the count how many times the block has been committed
-        block_id = message.block_id
-        old_count = self.blocktree.ack_commits.get(block_id)
-        if old_count is None:
-            self.blocktree.ack_commits.update({block_id: 1})
+        if peer_node_id not in self.rtts:
+            self.rtts.update({peer_node_id: RttEstimator()})
+        self.rtts.get(peer_node_id).add_sample(rtt)
+        self.update_expected_rtt()
+
+    def update_expected_rtt(self):
+        """Compute `expected_rtt` as the RTT needed to reach a majority: a node needs answers from n // 2 peers (it
+        answers itself), thus the (n // 2)-th smallest RTT estimate is relevant.
+        """
+        estimates = sorted(estimator.estimate() for peer_node_id, estimator in self.rtts.items()
+                           if peer_node_id not in self.learners)
+        if len(estimates) == 0:
+            return
+
+        quorum = self.n // 2
+        if 0 < quorum <= len(estimates):
+            rtt = estimates[quorum - 1]
         else:
-            new_count = old_count + 1
-            self.blocktree.ack_commits.update({block_id: new_count})
+            rtt = estimates[-1]
+        self.expected_rtt = rtt + 0.1
+
+    def committed_height(self):
+        """
+        Returns:
+            int: committed height of this node (sent to the peers in pong messages).
+        """
+        return self.blocktree.committed_height()
+
+    def update_peer_height(self, peer_node_id, height):
+        """Is called if a peer reported its committed `height` (piggybacked on TRY_OK, PROPOSE_ACK and pong messages).
+
+        Args:
+            peer_node_id (str): node id of the peer (None if unknown).
+            height (int): committed height of the peer (None if unknown).
+        """
+        if peer_node_id is None or height is None:
+            return
+        # the genesis block change does not wait for the learners (they catch up with a snapshot if needed)
+        if peer_node_id in self.peers and peer_node_id not in self.learners:
+            self.peer_heights.update({peer_node_id: height})
+        self.update_known_height(height)
+        self.change_genesis_block()
+
+    def change_genesis_block(self):
+        """Make the deepest block that has been committed by all nodes the new genesis block and delete the blocks
+        below the new genesis block from db and blocktree. Nothing happens as long as this node did not hear of the
+        committed height of every peer.
+
+        Note: A node that is down keeps reporting the last committed height it sent, thus no genesis block change is
+        performed until it is online again and catches up.
+        """
+        if len(self.peer_heights) < self.n - 1:
+            return
+        # the blocks this node did not apply yet are kept s.t they can be applied again after a restart, the same holds
+        # for the blocks the subscribers of the committed log did not read yet
+        height = min(list(self.peer_heights.values()) + [self.applied_height()] +
+                     [s.next_height - 1 for s in self.log_subscribers])
+        height = min(height, self.blocktree.committed_height() - LOG_RETENTION_BLOCKS)
+        if height <= self.blocktree.genesis_height:
+            return
 
-        # check if all nodes have committed this block
-        if self.blocktree.ack_commits.get(block_id) == self.n:
-            logger.debug('perform genesis block change')
+        block_id = self.blocktree.committed_blocks[height]
+        logger.debug('perform genesis block change')
 
-            # this block will be the new genesis block
-            self.blocktree.genesis = self.blocktree.nodes.get(block_id)
-            logger.debug('new genesis block id = %s', str(self.blocktree.genesis.block_id))
+        # this block will be the new genesis block
+        self.blocktree.genesis = self.blocktree.nodes.get(block_id)
+        self.blocktree.genesis_height = height
+        logger.debug('new genesis block id = %s', str(self.blocktree.genesis.block_id))
 
-            # write it to db
-            block_id_bytes = str(self.blocktree.genesis.block_id).encode()
-            self.blocktree.db.put(b'genesis', block_id_bytes)
+        # write it to db
+        block_id_bytes = str(self.blocktree.genesis.block_id).encode()
+        self.blocktree.db.put(b'genesis', block_id_bytes)
 
-            # delete inside blocktree.nodes dict and on disk
-            parent = self.blocktree.genesis
-            while parent is not None and parent.parent_block_id is not None:
-                parent_block_id = parent.parent_block_id
-                self.blocktree.db.delete(str(parent_block_id).encode())
-                parent = self.blocktree.nodes.pop(parent_block_id, None)
-                # also delete txns
-                if parent is not None:
-                    for txn in parent.txs:
-                        self.known_txs.discard(txn.txn_id)
+        # delete inside blocktree.nodes dict and on disk
+        parent = self.blocktree.genesis
+        while parent is not None and parent.parent_block_id is not None:
+            parent_block_id = parent.parent_block_id
+            self.blocktree.db.delete(str(parent_block_id).encode())
+            parent = self.blocktree.nodes.pop(parent_block_id, None)
+            # also delete txns
+            if parent is not None:
+                for txn in parent.txs:
+                    self.known_txs.discard(txn.txn_id)
 
-            self.blocktree.nodes.update({GENESIS.block_id: GENESIS})
+        self.blocktree.nodes.update({GENESIS.block_id: GENESIS})
 
-            # force deletion in leveldb
-            self.blocktree.db.compact_range()
+        # force deletion in leveldb
+        self.blocktree.db.compact_range()
 
     def move_to_block(self, target):
         """Change to `target` block as new `head_block`. If `target` is found on a forked path, have to broadcast txs
@@ -429,19 +1347,24 @@ class Node(ConnectionManager):
         if (not self.blocktree.ancestor(target, self.blocktree.head_block)) and target != self.blocktree.head_block:
             common_ancestor = self.blocktree.common_ancestor(self.blocktree.head_block, target)
             to_broadcast = set()
+            reverted = []
+            adopted = []
             # go from head_block to common ancestor: add txs to to_broadcast
             b = self.blocktree.head_block
             while b != common_ancestor:
                 to_broadcast |= set(b.txs)
+                reverted.append(b)
                 b = self.blocktree.nodes.get(b.parent_block_id)
             # go from target to common ancestor: remove txs from to_broadcast and new_txs, add to known_txs
             b = target
             while b != common_ancestor:
+                adopted.append(b)
                 for tx in b.txs:
                     self.known_txs.add(tx.txn_id)
                 for tx in b.txs:
                     if tx in self.new_txs:
                         self.new_txs.remove(tx)
+                        self.new_txs_size -= tx.get_size() + ITEM_OVERHEAD
                 to_broadcast -= set(b.txs)
                 b = self.blocktree.nodes.get(b.parent_block_id)
 
@@ -452,6 +1375,14 @@ class Node(ConnectionManager):
             block_id_bytes = str(target.block_id).encode()
             self.blocktree.db.put(b'head_block', block_id_bytes)
 
+            # let the app service speculatively undo and apply the blocks
+            if self.on_block_reverted is not None:
+                for b in reverted:
+                    self.on_block_reverted(b)
+            if self.on_block_tentative is not None:
+                for b in reversed(adopted):
+                    self.on_block_tentative(b)
+
             # broadcast txs in to_broadcast
             for tx in to_broadcast:
                 self.broadcast(tx, 'TXN')
@@ -475,6 +1406,7 @@ class Node(ConnectionManager):
            block != self.blocktree.committed_block:
             if block.creator_id != self.id:
                 self.c_quick_proposing = False
+                self.c_lease_expires = 0
 
             last_committed_block = self.blocktree.committed_block
             self.blocktree.committed_block = block
@@ -484,11 +1416,6 @@ class Node(ConnectionManager):
             block_id_bytes = str(block.block_id).encode()
             self.blocktree.db.put(b'committed_block', block_id_bytes)
 
-            # broadcast confirmation of committing this block
-            acm = AckCommitMessage(block.block_id)
-            self.broadcast(acm, 'ACM')
-            self.receive_ack_commit_message(acm)
-
             # iterate over blocks from currently committed block to last committed block
             # need to commit all those blocks (not just currently committed block)
             block_list = []
@@ -502,37 +1429,83 @@ class Node(ConnectionManager):
 
             block_list.reverse()
 
+            # write changes to disk (once for all committed blocks)
+            for b in block_list:
+                self.blocktree.committed_blocks.append(b.block_id)
+            block_ids_str = json.dumps(self.blocktree.committed_blocks)
+            block_ids_bytes = block_ids_str.encode()
+            self.blocktree.db.put(b'committed_blocks', block_ids_bytes)
+
+            if self.time_to_first_commit is None and self.started_at is not None:
+                self.time_to_first_commit = time.time() - self.started_at
+                logger.info('First block committed %s seconds after start', str(round(self.time_to_first_commit, 3)))
+
+            height = self.blocktree.committed_height() - len(block_list)
+            if self.apply_pipeline is None and (self.state_machine is not None or self.tx_applied is not None):
+                self.get_apply_pipeline(height)
+
             for b in block_list:
+                height += 1
                 # write committed block to stdout (-> testing purpose)
                 print('block = %s:', str(b.block_id))
 
-                self.blocktree.committed_blocks.append(b.block_id)
-                # write changes to disk
-                block_ids_str = json.dumps(self.blocktree.committed_blocks)
-                block_ids_bytes = block_ids_str.encode()
-                self.blocktree.db.put(b'committed_blocks', block_ids_bytes)
-
                 logger.debug('committing a block: with block id = %s', str(b.block_id))
-                logger.debug('committed blocks so far: %s', str(self.blocktree.committed_blocks))
 
-                # call callable of app service
+                # call callable of app service (a membership change takes effect instead)
                 commands = []
                 for txn in b.txs:
-                    commands.append(txn.content)
+                    if txn.membership:
+                        self.commit_membership(txn)
+                    else:
+                        commands.append(txn.content)
                 if self.tx_committed is not None:
                     self.tx_committed(commands)
+                if self.apply_pipeline is not None:
+                    self.apply_pipeline.put(height, commands)
+                if self.on_block_committed is not None:
+                    self.on_block_committed(b)
+
+                # notify the makers of the txs
+                if len(self.pending_txs) != 0:
+                    for txn in b.txs:
+                        pending = self.pending_txs.pop(txn.txn_id, None)
+                        if pending is not None:
+                            self.cancel_txn_timeout(pending)
+                            pending.deferred.callback(txn.txn_id)
 
             # reinitialize server variables
             self.s_supp_block = None
             self.s_prop_block = None
             self.s_max_block_depth = 0
             self.c_commit_running = False
+            self.commit_timer.cancel()
 
             # write changes to disk (delete s_max_block, s_prop_block and s_supp_block)
             self.blocktree.db.delete(b's_max_block_depth')
             self.blocktree.db.delete(b's_prop_block')
             self.blocktree.db.delete(b's_supp_block')
 
+            # notify the reads waiting for this committed height
+            if len(self.height_waiters) != 0:
+                self.serve_height_waiters()
+            self.update_known_height(self.blocktree.committed_height())
+
+            if self.quick_suspected_at is not None and self.state == QUICK and block.creator_id == self.id:
+                # write the failover time (since the last heartbeat of the previous quick node) to stdout
+                # (-> testing purpose)
+                last_heartbeat = self.quick_detector.last_heartbeat if self.quick_detector else self.quick_suspected_at
+                failover_time = time.time() - last_heartbeat
+                logger.info('Took over as quick node %s seconds after the last heartbeat of node %s',
+                            str(round(failover_time, 3)), self.quick_node_id)
+                print('failover = %s:', str(round(failover_time, 3)))
+                self.quick_suspected_at = None
+
+            # the committed txs are not pending anymore
+            self.update_admission()
+
+            # the committed blocks may now have been committed by all nodes
+            self.change_genesis_block()
+
     def reach_genesis_block(self, block):
         """Check if there is a path from `block` to `GENESIS` block. If a block on the path is not contained in
         `self.nodes`, we need to request it from other peers.
@@ -567,24 +1540,34 @@ class Node(ConnectionManager):
         d = self.blocktree.head_block.depth
 
         # create block
-        self.blocktree.counter += 1
-        if len(self.new_txs) < MAX_TXN_COUNT:
-            b = Block(self.id, self.blocktree.head_block.block_id, self.new_txs, self.blocktree.counter)
+        counter = self.blocktree.next_counter()
+        max_size = min(BLOCK_SIZE, MAX_BLOCK_SIZE)
+        if self.new_txs_size <= max_size:
+            b = Block(self.id, self.blocktree.head_block.block_id, self.new_txs, counter)
             # create a new, empty list (do not use clear!)
             self.new_txs = []
+            self.new_txs_size = 0
         else:
             logger.debug('Cannot fit all transactions in the block that is beeing created. Remaining transactions '
                          'will be included in the next block.')
-            txns_include = self.new_txs[:MAX_TXN_COUNT]
-            b = Block(self.id, self.blocktree.head_block.block_id, txns_include, self.blocktree.counter)
-            self.new_txs = self.new_txs[MAX_TXN_COUNT:]
-            self.readjust_timeout()
+            # include as many txs as fit (at least one)
+            count = 0
+            size = 0
+            for txn in self.new_txs:
+                txn_size = txn.get_size() + ITEM_OVERHEAD
+                if count != 0 and size + txn_size > max_size:
+                    break
+                count += 1
+                size += txn_size
+            txns_include = self.new_txs[:count]
+            b = Block(self.id, self.blocktree.head_block.block_id, txns_include, counter)
+            self.new_txs = self.new_txs[count:]
+            self.new_txs_size -= size
+        self.readjust_timeout()
 
         # compute its depth (will be fixed -> depth field is only set once)
         b.depth = d + len(b.txs)
 
-        self.blocktree.db.put(b'counter', str(self.blocktree.counter).encode())
-
         # add block to blocktree
         self.blocktree.add_block(b)
 
@@ -622,7 +1605,67 @@ class Node(ConnectionManager):
 
             patience = (2. + EPSILON) * self.expected_rtt + self.slow_timeout_backoff * self.expected_rtt
 
-        return patience + ACCUMULATION_TIME
+        return patience + self.get_accumulation_time()
+
+    def get_accumulation_time(self):
+        """Returns the time a node accumulates txs before creating a new block (part of its patience).
+
+        With adaptive batching the time is 0 if the node is idle. It grows with the fraction of a block (see
+        `BATCH_TARGET_COUNT`) that arrives within a round trip and covers the remaining time of a running commit (txs
+        can not be committed before it finished anyway). It is capped by `MAX_ACCUMULATION_TIME`.
+
+        Returns:
+            float: accumulation time.
+        """
+        if not ADAPTIVE_BATCHING:
+            return ACCUMULATION_TIME
+
+        window = 0
+        if self.arrival_interval is not None:
+            arrival_rate = 1 / self.arrival_interval if self.arrival_interval > 0 else float('inf')
+            window = min(1, arrival_rate * self.expected_rtt / BATCH_TARGET_COUNT) * self.expected_rtt
+
+        if self.c_commit_running and self.c_commit_started_at is not None:
+            commit_duration = self.c_commit_duration if self.c_commit_duration is not None else 2 * self.expected_rtt
+            window = max(window, commit_duration - (time.time() - self.c_commit_started_at))
+
+        return min(window, MAX_ACCUMULATION_TIME)
+
+    def update_arrival_interval(self):
+        """Update the moving average of the time between two new txs."""
+        now = time.time()
+        if self.last_arrival is not None:
+            interval = now - self.last_arrival
+            if self.arrival_interval is None:
+                self.arrival_interval = interval
+            else:
+                self.arrival_interval = (1 - EWMA_WEIGHT) * self.arrival_interval + EWMA_WEIGHT * interval
+        self.last_arrival = now
+
+    def update_commit_duration(self, duration):
+        """Update the moving average of the time a commit takes.
+
+        Args:
+            duration (float): time the last commit took.
+        """
+        if self.c_commit_duration is None:
+            self.c_commit_duration = duration
+        else:
+            self.c_commit_duration = (1 - EWMA_WEIGHT) * self.c_commit_duration + EWMA_WEIGHT * duration
+
+    def start_next_commit(self):
+        """Is called once the quick node finished a commit. With adaptive batching, a block that has been created while
+        the commit was running is committed right away and txs that arrived meanwhile are put into a new block (instead
+        of waiting until their accumulation time is over).
+        """
+        if not ADAPTIVE_BATCHING or self.state != QUICK:
+            return
+
+        b = self.c_current_committable_block
+        if b is not None and b.block_id not in self.blocktree.committed_blocks:
+            self.start_commit_process()
+        elif len(self.new_txs) != 0:
+            self.timeout_over(self.new_txs[0])
 
     def timeout_over(self, txn):
         """This function is called once a timeout is over. Will check if in the meantime the node received
@@ -634,6 +1677,12 @@ class Node(ConnectionManager):
         """
         logger.debug('timeout_over called')
         if txn in self.new_txs:
+            if self.state == QUICK and self.apply_pipeline is not None and self.apply_pipeline.full():
+                # the app falls behind: accumulate the txs until it caught up (see `blocks_applied`)
+                logger.debug('apply queue is full, postpone block creation')
+                self.apply_pipeline.stalled = True
+                return
+
             # create a new block
             b = self.create_block()
             self.move_to_block(b)
@@ -643,23 +1692,31 @@ class Node(ConnectionManager):
 
     def start_commit_process(self):
         """Commit `self.current_committable_block`."""
-        self.retry_commit_timeout_queued = False
+        self.retry_commit_timer.cancel()
 
         if self.c_current_committable_block.block_id in self.blocktree.committed_blocks:
             # this block has already been committed
             return
 
+        if self.state == QUICK and not self.c_commit_running and self.lease_conflict(None):
+            # this node promised another node (e.g a crashed quick node) not to accept TRY messages until the lease
+            # expires, the peers most likely as well: wait until then instead of until the commit times out
+            delay = self.s_lease_expires - time.monotonic() + self.expected_rtt
+            self.retry_commit_timer.arm(self.reactor, delay, self.start_commit_process)
+
         #  if quick node then start a new instance of paxos
-        if self.state == QUICK and not self.c_commit_running:
+        elif self.state == QUICK and not self.c_commit_running:
             logger.debug('start an new instance of paxos')
             self.c_commit_running = True
+            self.c_commit_started_at = time.time()
             self.c_votes = 0
             self.c_request_seq += 1
             self.c_supp_block = None
             self.c_prop_block = None
 
             # set commit_running to False if after expected time needed for commit process still equals True
-            deferLater(self.reactor, 2 * self.expected_rtt + MAX_COMMIT_TIME, self.commit_timeout, self.c_request_seq)
+            self.commit_timer.arm(self.reactor, 2 * self.expected_rtt + MAX_COMMIT_TIME, self.commit_timeout,
+                                  self.c_request_seq)
 
             if not self.c_quick_proposing:
                 self.c_new_block = self.c_current_committable_block
@@ -668,6 +1725,7 @@ class Node(ConnectionManager):
                 try_msg = PaxosMessage('TRY', self.c_request_seq)
                 try_msg.last_committed_block = self.blocktree.committed_block.block_id
                 try_msg.new_block = self.c_new_block.block_id
+                self.record_request_time(self.c_request_seq)
                 self.broadcast(try_msg, 'TRY')
                 self.receive_paxos_message(try_msg, None)
             else:
@@ -676,22 +1734,73 @@ class Node(ConnectionManager):
                 propose = PaxosMessage('PROPOSE', self.c_request_seq)
                 propose.com_block = self.c_current_committable_block.block_id
                 propose.new_block = GENESIS.block_id
+                self.record_request_time(self.c_request_seq)
                 self.broadcast(propose, 'PROPOSE')
                 self.receive_paxos_message(propose, None)
 
         elif self.state == QUICK and self.c_commit_running:
             # try to commit block later
             logger.debug('commit is already running, try to commit later')
-            if not self.retry_commit_timeout_queued:
-                self.retry_commit_timeout_queued = True
-                deferLater(self.reactor, 2 * self.expected_rtt + MAX_COMMIT_TIME, self.start_commit_process)
+            self.retry_commit_timer.arm(self.reactor, 2 * self.expected_rtt + MAX_COMMIT_TIME,
+                                        self.start_commit_process)
 
     def readjust_timeout(self):
-        """Is called if `new_txs` changed and thus the `oldest_txn` may be removed."""
-        if len(self.new_txs) != 0 and self.new_txs[0] != self.oldest_txn:
-                self.oldest_txn = self.new_txs[0]
-                # start a new timeout
-                deferLater(self.reactor, self.get_patience(), self.timeout_over, self.new_txs[0])
+        """Is called if `new_txs` changed and thus the `oldest_txn` may be removed (and the node may admit new txs
+        again)."""
+        if len(self.new_txs) == 0:
+            # no txn is waiting for a block anymore
+            self.patience_timer.cancel()
+        elif self.new_txs[0] != self.oldest_txn:
+            self.oldest_txn = self.new_txs[0]
+            # move the timeout to the new oldest txn
+            self.patience_timer.arm(self.reactor, self.get_patience(), self.timeout_over, self.oldest_txn)
+        self.update_admission()
+
+    def pending_load(self):
+        """
+        Returns:
+            tuple: (number of txs that have not been committed yet: waiting for a block, in a block on the path to the
+                head block or made by this node, number of bytes of the serialized txs waiting for a block).
+        """
+        uncommitted = max(0, self.blocktree.head_block.depth - self.blocktree.committed_block.depth)
+        return max(len(self.new_txs) + uncommitted, len(self.pending_txs)), self.new_txs_size
+
+    def update_admission(self):
+        """Stop admitting new txs once the pending txs reach `PENDING_TXS_HIGH` or `PENDING_BYTES_HIGH` and admit them
+        again once they fell back to `PENDING_TXS_LOW` and `PENDING_BYTES_LOW`. While this node is busy, `make_txn`
+        fails with a NodeBusyError and the `ingress_producers` as well as the connections of the learners are paused
+        (their txs back up in the TCP buffers of the senders). The connections of the voters are never paused since the
+        votes and blocks needed to commit the pending txs arrive over them, the voters admit their txs themselves.
+
+        Note: in multi-group mode the groups share the connections, so the admission of the learners is per connection,
+        not per group: a learner connection is paused while at least one group is busy, which throttles the txs of the
+        learner in the other groups too (see `GroupTransport`). `make_txn` and the `ingress_producers` are per group.
+        """
+        count, size = self.pending_load()
+        if not self.busy and (count >= PENDING_TXS_HIGH or size >= PENDING_BYTES_HIGH):
+            logger.info('Stop admitting new txs: %i txs (%i bytes) are pending', count, size)
+            self.busy = True
+            self.busy_since = time.time()
+            self.busy_periods += 1
+            for producer in self.paused_producers():
+                producer.pauseProducing()
+        elif self.busy and count <= PENDING_TXS_LOW and size <= PENDING_BYTES_LOW:
+            logger.info('Admit new txs again after %s seconds', str(round(time.time() - self.busy_since, 3)))
+            self.busy = False
+            self.busy_time += time.time() - self.busy_since
+            self.busy_since = None
+            for producer in self.paused_producers():
+                producer.resumeProducing()
+
+    def paused_producers(self):
+        """
+        Returns:
+            list: the producers of txs paused while this node is busy (`ingress_producers` and the transports of the
+                connections of the learners).
+        """
+        learners = [connection.transport for peer_node_id, connection in self.peers_connection.items()
+                    if peer_node_id in self.learners]
+        return list(self.ingress_producers) + learners
 
     def commit_timeout(self, commit_counter):
         """Is called once a commit should have been finished. If it is still running, it will be 'terminated'. """
@@ -702,6 +1811,364 @@ class Node(ConnectionManager):
             logger.debug('try to commit again')
             self.start_commit_process()
 
+    def lease_conflict(self, sender):
+        """
+        Args:
+            sender (Connection): Connection instance of the sender of a TRY, PROPOSE or LEASE message (None if sender is
+                this Node).
+
+        Returns:
+            bool: True if this node granted a lease to another node than the sender that did not expire yet.
+        """
+        holder = sender.peer_node_id if sender is not None else str(self.id)
+        return self.s_lease_holder not in (None, holder) and time.monotonic() < self.s_lease_expires
+
+    def grant_lease(self, sender):
+        """Promise the sender not to accept TRY or PROPOSE messages from other nodes during `LEASE_DURATION`.
+
+        Args:
+            sender (Connection): Connection instance of the sender (None if sender is this Node).
+        """
+        self.s_lease_holder = sender.peer_node_id if sender is not None else str(self.id)
+        self.s_lease_expires = time.monotonic() + LEASE_DURATION
+
+    def has_lease(self):
+        """
+        Returns:
+            bool: True if this node is the quick node and holds a lease granted by a majority. No other node can commit
+                a block until the lease expires, thus the committed blocks of this node are up to date.
+        """
+        return self.state == QUICK and time.monotonic() < self.c_lease_expires
+
+    def renew_lease(self):
+        """Ask all nodes for a lease (a LEASE_ACK from a majority renews it)."""
+        if self.state != QUICK:
+            return
+        self.c_lease_seq += 1
+        self.c_lease_votes = 0
+        self.c_lease_valid = True
+        self.c_lease_sent = time.monotonic()
+
+        lease = PaxosMessage('LEASE', self.c_lease_seq)
+        self.broadcast(lease, 'LEASE')
+        self.receive_paxos_message(lease, None)
+
+    def serve_lease_waiters(self):
+        """Answer the reads that waited for this node to renew its lease with the committed height."""
+        waiters = self.c_lease_waiters
+        self.c_lease_waiters = []
+        for d in waiters:
+            d.callback(self.blocktree.committed_height())
+
+    def get_apply_pipeline(self, applied_height=None):
+        """Create the apply pipeline if it does not exist yet (requires `state_machine` or `tx_applied` to be set).
+
+        Args:
+            applied_height (int): committed height up to which the committed txs have been applied (default = the
+                committed height).
+
+        Returns:
+            ApplyPipeline: the apply pipeline of this node.
+        """
+        if self.apply_pipeline is None:
+            if applied_height is None:
+                applied_height = self.blocktree.committed_height()
+            if self.state_machine is not None:
+                self.apply_pipeline = ApplyPipeline(self, self.state_machine.apply, applied_height,
+                                                    self.state_machine.partition_key, self.state_machine.flush)
+            else:
+                self.apply_pipeline = ApplyPipeline(self, self.tx_applied, applied_height)
+        return self.apply_pipeline
+
+    def replay_unapplied(self):
+        """Pass the committed blocks whose txs have not been persisted by the state machine before a restart to the
+        apply pipeline (see `StateMachine.applied_height`). Is called once the node starts (`state_machine` must be set
+        before). Nothing happens if the state machine does not track its applied height.
+        """
+        if self.state_machine is None or self.apply_pipeline is not None:
+            return
+        applied_height = self.state_machine.applied_height()
+        if applied_height is None:
+            return
+        height = self.blocktree.committed_height()
+        pipeline = self.get_apply_pipeline(min(applied_height, height))
+        if applied_height < height:
+            logger.info('apply the committed blocks from height %s to %s again', str(applied_height + 1), str(height))
+        for h in range(applied_height + 1, height + 1):
+            block = self.blocktree.nodes.get(self.blocktree.committed_blocks[h])
+            if block is None:
+                logger.warning('committed block at height %s has been deleted and can not be applied', str(h))
+                continue
+            pipeline.put(h, [txn.content for txn in block.txs])
+
+    def applied_height(self):
+        """
+        Returns:
+            int: committed height up to which the committed txs have been passed to the app (equals the committed
+                height unless `tx_applied` is used).
+        """
+        if self.apply_pipeline is None:
+            return self.blocktree.committed_height()
+        return self.apply_pipeline.applied_height
+
+    def blocks_applied(self):
+        """Is called once committed blocks have been passed to `tx_applied`. Serves the reads waiting for them
+        (including the bounded staleness reads) and resumes the block creation if it has been postponed since the app
+        fell behind."""
+        if len(self.height_waiters) != 0:
+            self.serve_height_waiters()
+        self.update_known_height(self.applied_height())
+        if self.apply_pipeline.stalled and not self.apply_pipeline.full():
+            self.apply_pipeline.stalled = False
+            if self.state == QUICK and len(self.new_txs) != 0:
+                self.timeout_over(self.new_txs[0])
+
+    def serve_height_waiters(self):
+        """Answer the reads waiting for a committed height that has been reached (and applied)."""
+        height = self.applied_height()
+        ready = [w for w in self.height_waiters if w[0] <= height]
+        self.height_waiters = [w for w in self.height_waiters if w[0] > height]
+        for _, d in ready:
+            d.callback(height)
+
+    def update_known_height(self, height):
+        """Is called if this node heard of a committed `height` (or reached or applied it). Keeps track of how far and
+        since when the local state is behind (the committed blocks count once they have been applied).
+
+        Args:
+            height (int): committed height of a node (None if unknown).
+        """
+        if height is None:
+            return
+        applied_height = self.applied_height()
+        if height > self.known_height:
+            self.known_height = height
+            if height > applied_height:
+                self.heard_heights.append((height, time.time()))
+
+        while len(self.heard_heights) != 0 and self.heard_heights[0][0] <= applied_height:
+            self.heard_heights.popleft()
+
+        if len(self.staleness_waiters) != 0:
+            ready = [w for w in self.staleness_waiters if self.is_fresh(w[0], w[1])]
+            self.staleness_waiters = [w for w in self.staleness_waiters if w not in ready]
+            for _, _, d in ready:
+                d.callback(applied_height)
+
+    def receive_read_index_message(self, message, sender):
+        """The quick node answers a request for the read index (if it can obtain a lease), other nodes ignore it. An
+        answer is passed to the read waiting for it.
+
+        Args:
+            message (ReadIndexMessage): Message received.
+            sender (Connection): Connection instance of the sender.
+        """
+        if message.height is None:
+            if self.state == QUICK:
+                d = self.read_index()
+                d.addCallback(lambda height: self.respond(ReadIndexMessage(message.request_id, height), sender))
+                d.addErrback(lambda failure: logger.debug('could not obtain read index: %s', str(failure.value)))
+        else:
+            d = self.read_requests.pop(message.request_id, None)
+            if d is not None:
+                d.callback(message.height)
+
+    def receive_leadership_transfer_message(self, message, sender):
+        """The source of the message gave up its role as quick node (and its lease). The target of the transfer relays
+        the message to the other voters, promotes itself to QUICK right away and puts the txs it is waiting for into a
+        block, the other nodes are demoted to SLOW. Since the relayed message arrives over the same connection before
+        the TRY or PROPOSE messages of the target, a voter has released the lease of the source before it is asked to
+        vote (even if the message of the source is still on its way).
+
+        Args:
+            message (LeadershipTransferMessage): Message received.
+            sender (Connection): Connection instance of the sender (the source or the target).
+        """
+        if self.s_lease_holder == str(message.source_id):
+            self.s_lease_holder = None
+
+        # the heartbeats of the target are expected from now on (the sender is going to stop)
+        self.quick_node_id = str(message.target_id)
+        self.quick_detector = None
+        self.quick_suspected_at = None
+
+        if message.target_id != self.id:
+            self.state = SLOW
+            self.c_quick_proposing = False
+            return
+
+        # make sure the blocks committed by the sender are also committed by this node
+        if message.committed_block not in self.blocktree.committed_blocks:
+            committed_block = self.get_block(message.committed_block)
+            if committed_block is not None:
+                self.commit(committed_block)
+
+        logger.info('Took over as quick node from node %s', str(message.source_id))
+        self.broadcast(message, 'LTR')
+        self.state = QUICK
+        self.c_quick_proposing = False
+        if len(self.new_txs) != 0:
+            self.timeout_over(self.new_txs[0])
+
+    def heartbeat(self):
+        """Is called every `HEARTBEAT_INTERVAL`. The quick node broadcasts a heartbeat, the other nodes check if they
+        suspect the quick node to have crashed.
+        """
+        if self.state == QUICK:
+            self.broadcast(HeartbeatMessage(self.blocktree.committed_height()), 'HBT')
+        elif self.quick_detector is not None and self.quick_suspected_at is None:
+            phi = self.quick_detector.phi()
+            if phi > PHI_THRESHOLD:
+                logger.info('Suspect quick node %s to have crashed (phi = %s)', self.quick_node_id, str(round(phi, 1)))
+                self.suspect_quick_node()
+
+    def receive_heartbeat_message(self, message, sender):
+        """Feed the failure detector of the quick node with its heartbeat. A node that suspected the quick node and
+        pre-armed its promotion steps back.
+
+        Args:
+            message (HeartbeatMessage): Message received.
+            sender (Connection): Connection instance of the sender.
+        """
+        if sender.peer_node_id != self.quick_node_id or self.quick_detector is None:
+            self.quick_node_id = sender.peer_node_id
+            self.quick_detector = PhiAccrualDetector(HEARTBEAT_INTERVAL, HEARTBEAT_INTERVAL / 2)
+        self.quick_detector.heartbeat()
+
+        if self.quick_suspected_at is not None:
+            logger.info('Quick node %s is alive', self.quick_node_id)
+            self.quick_suspected_at = None
+            if self.state == MEDIUM:
+                self.state = SLOW
+        self.update_known_height(message.height)
+
+    def suspect_quick_node(self):
+        """The quick node is suspected to have crashed. Its successor (the next node in the order of the node ids this
+        node is connected to) pre-arms its promotion: it becomes MEDIUM s.t its next block makes it QUICK, and puts the
+        txs it is waiting for into a block right away. The other nodes stay SLOW to back it up.
+        """
+        self.quick_suspected_at = time.time()
+        if self.state == QUICK or self.quick_successor() != self.id:
+            return
+
+        logger.info('Pre-arm the promotion to quick node')
+        self.state = MEDIUM
+        if len(self.new_txs) != 0:
+            self.timeout_over(self.new_txs[0])
+
+    def quick_successor(self):
+        """
+        Returns:
+            int: id of the voter following `quick_node_id` (in the order of the node ids) among this node and the peers
+                it is connected to.
+        """
+        alive = {self.id} | {int(peer_node_id) for peer_node_id in self.peers_connection}
+        quick = int(self.quick_node_id)
+        following = [node_id for node_id in self.voters if node_id > quick] + \
+            [node_id for node_id in self.voters if node_id < quick]
+        for node_id in following:
+            if node_id in alive:
+                return node_id
+        return self.id
+
+    def update_roles(self):
+        """Derive `learner`, `voters` and `n` from the peers dict of the current configuration."""
+        self.learner = str(self.id) in self.learners or str(self.id) not in self.peers
+        self.voters = sorted(int(peer_node_id) for peer_node_id in self.peers if peer_node_id not in self.learners)
+        self.n = len(self.voters)
+
+    def is_voter(self, sender):
+        """
+        Args:
+            sender (Connection): Connection instance of the sender of a vote (None if sender is this Node).
+
+        Returns:
+            bool: True if the sender is a voter of the current configuration (votes of other nodes are not counted).
+        """
+        peer_node_id = str(self.id) if sender is None else sender.peer_node_id
+        return peer_node_id in self.peers and peer_node_id not in self.learners
+
+    def check_membership(self, peers_dict):
+        """Check a new configuration against the current one. Is used when a change is made and again when it is
+        committed (every node commits the changes in the same order, so they all come to the same result).
+
+        Args:
+            peers_dict (dict): peers dict of the new configuration.
+
+        Raises:
+            ValueError: if `peers_dict` is not a valid peers dict or more than one voter would be added or removed.
+        """
+        if not isinstance(peers_dict, dict):
+            raise ValueError('the peers dict of a membership change must be a dict')
+        for peer_node_id, entry in peers_dict.items():
+            if not isinstance(peer_node_id, str) or not peer_node_id.isdigit() or not isinstance(entry, dict):
+                raise ValueError('invalid peers dict entry of node %s' % str(peer_node_id))
+            if 'loopback' not in entry and 'unix' not in entry and ('ip' not in entry or 'port' not in entry):
+                raise ValueError('the peers dict entry of node %s has no address' % peer_node_id)
+        voters = {int(peer_node_id) for peer_node_id, entry in peers_dict.items() if not entry.get('learner')}
+        if len(voters) == 0 or len(voters ^ set(self.voters)) > 1:
+            raise ValueError('a membership change can add or remove at most one voter')
+
+    def commit_membership(self, txn):
+        """Is called once a membership change has been committed. A change that is not valid anymore (e.g since
+        another change has been committed in the meantime) is ignored by all nodes and its Deferred fails.
+
+        Args:
+            txn (Transaction): the committed membership change.
+        """
+        try:
+            peers_dict = json.loads(txn.content)
+            self.check_membership(peers_dict)
+        except (TypeError, ValueError) as e:
+            logger.warning('committed membership change %i ignored: %s', txn.txn_id, str(e))
+            pending = self.pending_txs.pop(txn.txn_id, None)
+            if pending is not None:
+                self.cancel_txn_timeout(pending)
+                pending.deferred.errback(ValueError(str(e)))
+            return
+        self.apply_membership(peers_dict)
+
+    def membership_in_flight(self):
+        """
+        Returns:
+            bool: True if a membership change this node knows of has not been committed yet (made by this node,
+                waiting for a block or in a block on the path to the head block).
+        """
+        if any(pending.txn.membership for pending in self.pending_txs.values()):
+            return True
+        if any(txn.membership for txn in self.new_txs):
+            return True
+        b = self.blocktree.head_block
+        while b is not None and b != self.blocktree.committed_block and b != self.blocktree.genesis:
+            if any(txn.membership for txn in b.txs):
+                return True
+            b = self.blocktree.nodes.get(b.parent_block_id)
+        return False
+
+    def apply_membership(self, peers_dict):
+        """Is called once a membership change has been committed. The new configuration is used from now on and
+        persisted (it replaces the peers dict given at construction after a restart). The connections to removed peers
+        are closed and the new peers are connected to. A node that has been removed stops voting.
+
+        Args:
+            peers_dict (dict): peers dict of the new configuration.
+        """
+        logger.info('new configuration committed: %s', str(peers_dict))
+        self.update_peers(peers_dict)
+        self.update_roles()
+        self.blocktree.db.put(b'peers', json.dumps(peers_dict).encode())
+
+        for peer_node_id in list(self.peer_heights):
+            if peer_node_id not in self.peers or peer_node_id in self.learners:
+                self.peer_heights.pop(peer_node_id)
+        if self.learner and self.state != SLOW:
+            logger.info('removed from the voters, demoted to slow')
+            self.state = SLOW
+            self.c_quick_proposing = False
+            self.c_lease_expires = 0
+        if self.started_at is not None and not self.stopped:
+            self.connect_to_nodes()
+
     def get_block(self, block_id):
         """Get block based on block_id.
 
@@ -726,8 +2193,327 @@ class Node(ConnectionManager):
 
         Args:
             command (str): command to be commited
+
+        Returns:
+            Deferred: fires with the txn id once the transaction has been committed. If it is not committed within
+                `TXN_TIMEOUT` it is resubmitted (up to `TXN_RESUBMITS` times), afterwards the Deferred fails with a
+                TimeoutError. Use `make_txn_future` to await the commit from asyncio code. Fails right away with a
+                NodeBusyError if this node does not admit new txs (see `update_admission`).
+
+        Raises:
+            ValueError: if the command is too large to fit into a block.
+        """
+        return self.submit_txn(Transaction(self.id, command, self.blocktree.counter + 1))
+
+    def submit_txn(self, txn):
+        """Broadcast `txn` (a command of the app or a membership change) and wait for its commit (see `make_txn`).
+
+        Args:
+            txn (Transaction): the new transaction.
+
+        Returns:
+            Deferred: fires with the txn id once the transaction has been committed.
+
+        Raises:
+            ValueError: if the transaction is too large to fit into a block.
         """
-        self.blocktree.counter += 1
-        txn = Transaction(self.id, command, self.blocktree.counter)
-        self.blocktree.db.put(b'counter', str(self.blocktree.counter).encode())
+        if txn.get_size() + ITEM_OVERHEAD > MAX_BLOCK_SIZE:
+            raise ValueError('command of %i bytes does not fit into a block' % txn.get_size())
+        if self.busy:
+            self.rejected_txs += 1
+            return defer.fail(NodeBusyError('%i transactions are pending' % self.pending_load()[0]))
+
+        self.blocktree.next_counter()
+
+        pending = PendingTxn(txn, defer.Deferred(lambda d: self.cancel_txn(txn.txn_id)))
+        pending.timeout_call = self.reactor.callLater(TXN_TIMEOUT, self.txn_timeout, txn.txn_id)
+        self.pending_txs.update({txn.txn_id: pending})
+
         self.broadcast(txn, 'TXN')
+        self.update_admission()
+        return pending.deferred
+
+    def change_membership(self, peers_dict):
+        """Change the configuration of the cluster without a restart, e.g to add a node or replace a failed one. The
+        new peers dict is committed through the log like a transaction and takes effect on each node once it commits
+        it. At most one voter can be added or removed per change s.t any majority of the old and the new voters
+        intersect (learners can be changed freely). A new node is started with the new peers dict and catches up like a
+        node that has been down.
+
+        Note: membership changes are not supported if multiple groups share the connections (see multigroup.py).
+
+        Args:
+            peers_dict (dict): peers dict of the new configuration.
+
+        Returns:
+            Deferred: fires with the txn id once the change has been committed (see `make_txn`). Fails with a
+                ValueError if the change is not valid anymore once it is committed (see `commit_membership`).
+
+        Raises:
+            ValueError: if `peers_dict` is not a valid peers dict, more than one voter would be added or removed,
+                another change has not been committed yet or this node is one of multiple groups.
+        """
+        if self.group_id is not None:
+            raise ValueError('membership changes are not supported in multi-group mode')
+        self.check_membership(peers_dict)
+        if self.membership_in_flight():
+            raise ValueError('another membership change has not been committed yet')
+        return self.submit_txn(Transaction(self.id, json.dumps(peers_dict), self.blocktree.counter + 1, True))
+
+    def make_txn_future(self, command, loop=None):
+        """Like `make_txn` but returns an asyncio Future (requires the asyncio reactor).
+
+        Args:
+            command (str): command to be commited
+            loop (AbstractEventLoop): event loop of the future (default = current event loop).
+
+        Returns:
+            Future: resolves to the txn id once the transaction has been committed.
+        """
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        return self.make_txn(command).asFuture(loop)
+
+    def txn_timeout(self, txn_id):
+        """Is called if a transaction made by this node has not been committed in time. The transaction is resubmitted
+        or, if it has been resubmitted `TXN_RESUBMITS` times already, its Deferred fails.
+
+        Args:
+            txn_id (int): id of the transaction.
+        """
+        pending = self.pending_txs.get(txn_id)
+        if pending is None:
+            return
+        pending.timeout_call = None
+
+        if pending.resubmits == TXN_RESUBMITS:
+            self.pending_txs.pop(txn_id)
+            pending.deferred.errback(defer.TimeoutError('transaction %i has not been committed' % txn_id))
+            return
+
+        pending.resubmits += 1
+        logger.debug('resubmit transaction with txn id = %s', str(txn_id))
+        self.resubmit_txn(pending.txn)
+        pending.timeout_call = self.reactor.callLater(TXN_TIMEOUT, self.txn_timeout, txn_id)
+
+    def resubmit_txn(self, txn):
+        """Send `txn` again to all peers (peers that already know it ignore it) and make sure this node includes it in
+        a block again if it is neither pending nor contained in a block on the path to the head block anymore.
+
+        Args:
+            txn (Transaction): transaction to be resubmitted.
+        """
+        data = txn.serialize()
+        for connection in self.peers_connection.values():
+            connection.sendString(data)
+
+        if txn in self.new_txs:
+            return
+        b = self.blocktree.head_block
+        while b is not None and b != self.blocktree.genesis:
+            if txn in b.txs:
+                return
+            b = self.blocktree.nodes.get(b.parent_block_id)
+
+        self.known_txs.discard(txn.txn_id)
+        self.receive_transaction(txn)
+
+    def cancel_txn(self, txn_id):
+        """Stop waiting for the commit of a transaction (the transaction may still be committed).
+
+        Args:
+            txn_id (int): id of the transaction.
+        """
+        pending = self.pending_txs.pop(txn_id, None)
+        if pending is not None:
+            self.cancel_txn_timeout(pending)
+
+    def read_index(self):
+        """Obtain the read index: the committed height this node must reach before it can serve a linearizable read.
+        The quick node answers itself (immediately if it holds a lease, otherwise once it renewed its lease). Other
+        nodes ask the quick node.
+
+        Returns:
+            Deferred: fires with the read index or fails with a TimeoutError after `READ_TIMEOUT`.
+        """
+        if self.state == QUICK:
+            if self.has_lease():
+                return defer.succeed(self.blocktree.committed_height())
+            d = defer.Deferred(lambda d: self.c_lease_waiters.remove(d))
+            self.c_lease_waiters.append(d)
+            if len(self.c_lease_waiters) == 1:
+                self.renew_lease()
+        else:
+            self.read_request_counter += 1
+            request_id = self.read_request_counter
+            d = defer.Deferred(lambda d: self.read_requests.pop(request_id, None))
+            self.read_requests.update({request_id: d})
+            self.broadcast(ReadIndexMessage(request_id), 'RIX')
+        d.addTimeout(READ_TIMEOUT, self.reactor)
+        return d
+
+    def wait_for_height(self, height):
+        """
+        Args:
+            height (int): committed height.
+
+        Returns:
+            Deferred: fires with the committed height of this node once it is at least `height` (all the committed
+                txs up to `height` have been passed to `tx_committed` and `tx_applied`).
+        """
+        if self.applied_height() >= height:
+            return defer.succeed(self.applied_height())
+        waiter = (height, defer.Deferred(lambda d: self.height_waiters.remove(waiter)))
+        self.height_waiters.append(waiter)
+        return waiter[1]
+
+    def read_barrier(self):
+        """Use this method to serve linearizable reads: once the returned Deferred fired, the local state reflects all
+        the txs that have been committed before this method was called. On the quick node holding a lease this costs
+        no messages at all.
+
+        Returns:
+            Deferred: fires with the committed height of this node or fails with a TimeoutError.
+        """
+        d = self.read_index()
+        d.addCallback(self.wait_for_height)
+        return d
+
+    def watermark(self):
+        """
+        Returns:
+            tuple: (committed height the local state reflects (see `applied_height`), highest committed height this
+                node heard of, seconds since this node heard of the oldest committed height it did not apply yet (0 if
+                it is up to date)).
+        """
+        staleness = 0
+        if len(self.heard_heights) != 0:
+            staleness = time.time() - self.heard_heights[0][1]
+        return self.applied_height(), self.known_height, staleness
+
+    def admission_metrics(self):
+        """
+        Returns:
+            dict: the load shedding of this node so far (e.g to be exported to a monitoring system): `pending_txs` and
+                `pending_bytes` (see `pending_load`), `busy`, `busy_periods`, `busy_time` (including the running busy
+                period) and `rejected_txs`.
+        """
+        count, size = self.pending_load()
+        busy_time = self.busy_time
+        if self.busy_since is not None:
+            busy_time += time.time() - self.busy_since
+        return {'pending_txs': count, 'pending_bytes': size, 'busy': self.busy, 'busy_periods': self.busy_periods,
+                'busy_time': busy_time, 'rejected_txs': self.rejected_txs}
+
+    def is_fresh(self, max_blocks=None, max_age=None):
+        """
+        Args:
+            max_blocks (int): max number of committed blocks this node may be behind.
+            max_age (float): max number of seconds this node may be behind.
+
+        Returns:
+            bool: True if the local state is within `max_blocks` or `max_age` of the highest committed height this node
+                heard of.
+        """
+        height, known_height, staleness = self.watermark()
+        if max_blocks is not None and known_height - height <= max_blocks:
+            return True
+        if max_age is not None and staleness <= max_age:
+            return True
+        return max_blocks is None and max_age is None
+
+    def bounded_read(self, max_blocks=None, max_age=None, timeout=READ_TIMEOUT):
+        """Use this method to serve reads with bounded staleness on any node (no messages are sent): the local state is
+        at most `max_blocks` committed blocks or `max_age` seconds behind the newest committed height this node heard
+        of.
+
+        Args:
+            max_blocks (int): max number of committed blocks the local state may be behind.
+            max_age (float): max number of seconds the local state may be behind.
+            timeout (float): time to wait for this node to catch up.
+
+        Returns:
+            Deferred: fires with the committed height the local state reflects (immediately if it is fresh enough, see
+                `applied_height`) or fails with a TimeoutError.
+        """
+        if self.is_fresh(max_blocks, max_age):
+            return defer.succeed(self.applied_height())
+
+        waiter = (max_blocks, max_age, defer.Deferred(lambda d: self.staleness_waiters.remove(waiter)))
+        self.staleness_waiters.append(waiter)
+        waiter[2].addTimeout(timeout, self.reactor)
+        return waiter[2]
+
+    def committed_block(self, height):
+        """
+        Args:
+            height (int): committed height of a block (its commit index).
+
+        Returns:
+            Block: the committed block at `height`.
+
+        Raises:
+            ValueError: if no block has been committed at `height` yet or it has been deleted (see
+                `change_genesis_block`).
+        """
+        block = None
+        if 0 < height <= self.blocktree.committed_height():
+            block = self.blocktree.nodes.get(self.blocktree.committed_blocks[height])
+        if block is None:
+            raise ValueError('no committed block at height %i' % height)
+        return block
+
+    def committed_log(self, start=1):
+        """Iterate over the committed txs in commit order, e.g to feed them to a downstream system. The blocks are
+        read lazily: the iterator stops once it reached the committed height at that time. Must be used on the reactor
+        thread.
+
+        Args:
+            start (int): committed height of the first block whose txs are yielded.
+
+        Yields:
+            tuple: (committed height of the block, block id, txn id, content) of each committed txn.
+
+        Raises:
+            ValueError: if a block from `start` on has been deleted.
+        """
+        height = start
+        while height <= self.blocktree.committed_height():
+            block = self.committed_block(height)
+            for txn in block.txs:
+                yield height, block.block_id, txn.txn_id, txn.content
+            height += 1
+
+    def transfer_leadership(self, target_id):
+        """Hand the role of the quick node over to the node with `target_id`, e.g before this node is restarted for
+        maintenance. This node gives up its lease and is demoted to SLOW, the target promotes itself to QUICK right away
+        (instead of waiting until the patience of a slow node expires).
+
+        Args:
+            target_id (int): id of the node that becomes the quick node.
+
+        Raises:
+            ValueError: if this node is not the quick node or `target_id` is not the id of a peer that is a voter.
+        """
+        if self.state != QUICK:
+            raise ValueError('only the quick node can transfer its role')
+        if str(target_id) not in self.peers or target_id == self.id:
+            raise ValueError('node %s is not a peer' % str(target_id))
+        if str(target_id) in self.learners:
+            raise ValueError('node %s is a learner' % str(target_id))
+
+        # give up the lease (the peers release it once they receive the LTR message from this node or the target)
+        self.c_lease_expires = 0
+        if self.s_lease_holder == str(self.id):
+            self.s_lease_holder = None
+        self.state = SLOW
+        self.c_quick_proposing = False
+
+        ltr = LeadershipTransferMessage(target_id, self.blocktree.committed_block.block_id, self.id)
+        self.broadcast(ltr, 'LTR')
+
+    @staticmethod
+    def cancel_txn_timeout(pending):
+        if pending.timeout_call is not None and pending.timeout_call.active():
+            pending.timeout_call.cancel()
+        pending.timeout_call = None
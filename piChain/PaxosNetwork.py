@@ -1,25 +1,39 @@
 """This module implements the networking between the nodes.
+
+Nodes are connected over TCP by default. A peers dict entry can instead name a Unix domain socket path (key 'unix') or
+a loopback name (key 'loopback'). Loopback connections pass the frames directly between `ConnectionManager` instances
+running in the same process and reactor, without any socket.
 """
 
 import logging
 import json
+import random
 import time
 import struct
 
+from zope.interface import implementer
 from twisted.internet.protocol import Factory, connectionDone
 from twisted.protocols.basic import IntNStringReceiver
-from twisted.internet.endpoints import TCP4ClientEndpoint, TCP4ServerEndpoint, connectProtocol
-from twisted.internet import reactor, task
+from twisted.internet.endpoints import TCP4ClientEndpoint, TCP4ServerEndpoint, UNIXClientEndpoint, \
+    UNIXServerEndpoint, connectProtocol
+from twisted.internet import reactor, defer, error
+from twisted.internet.interfaces import ITransport, IPushProducer
 from twisted.internet.task import LoopingCall
-from twisted.python import log
+from twisted.python import log, failure
 
 from piChain.messages import RequestBlockMessage, Transaction, Block, RespondBlockMessage, PaxosMessage, PingMessage, \
-    PongMessage, AckCommitMessage
+    PongMessage, SyncRequestMessage, SyncResponseMessage, ReadIndexMessage, GroupMessage, \
+    LeadershipTransferMessage, HeartbeatMessage, SnapshotRequestMessage, SnapshotChunkMessage
+from piChain.config import PING_INTERVAL_MIN, RECONNECT_DELAY_MIN, RECONNECT_DELAY_MAX, RECONNECT_JITTER, \
+    MAX_MESSAGE_SIZE
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+# loopback name -> ConnectionManager listening on it (in this process)
+LOOPBACK_MANAGERS = {}
+
 
 class Connection(IntNStringReceiver):
     """This class keeps track of information about a connection with another node. It is a subclass of
@@ -33,7 +47,11 @@ class Connection(IntNStringReceiver):
             among connections.
         node_id (str): Unique predefined id of the node on this side of the connection.
         peer_node_id (str): Unique predefined id of the node on the other side of the connection.
-        lc_ping (LoopingCall): keeps sending ping messages to other nodes to estimate correct round trip times.
+        dialed_node_id (str): id of the node this node connected to (None if the peer opened the connection).
+        lc_ping (LoopingCall): keeps sending ping messages to other nodes to estimate correct round trip times. The
+            interval is adapted by the connection manager based on how much the round trip times vary.
+        paused_groups (set): ids of the groups that paused the transport because they are busy (multi-group mode, see
+            `GroupTransport`).
     """
     # little endian, unsigned int
     structFormat = '<I'
@@ -43,10 +61,12 @@ class Connection(IntNStringReceiver):
         self.connection_manager = factory
         self.node_id = str(self.connection_manager.id)
         self.peer_node_id = None
+        self.dialed_node_id = None
         self.lc_ping = LoopingCall(self.send_ping)
+        self.paused_groups = set()
 
-        # init max message size to 10 Megabyte
-        self.MAX_LENGTH = 10000000
+        # init max message size (default = 10 Megabyte)
+        self.MAX_LENGTH = MAX_MESSAGE_SIZE
 
     def connectionMade(self):
         """Called once a connection with another node has been made."""
@@ -57,12 +77,16 @@ class Connection(IntNStringReceiver):
         logger.debug('Lost connection to %s with id %s: %s',
                      str(self.transport.getPeer()), self.peer_node_id, reason.getErrorMessage())
 
-        # remove peer_node_id from connection_manager.peers
-        if self.peer_node_id is not None and self.peer_node_id in self.connection_manager.peers_connection:
+        # remove peer_node_id from connection_manager.peers (unless another connection to the peer is used)
+        if self.peer_node_id is not None and \
+                self.connection_manager.peers_connection.get(self.peer_node_id) is self:
             self.connection_manager.peers_connection.pop(self.peer_node_id)
-            if not self.connection_manager.reconnect_loop.running:
-                logger.debug('Connection synchronization restart...')
-                self.connection_manager.reconnect_loop.start(10)
+            self.connection_manager.peer_disconnected(self.peer_node_id)
+
+        # try to reconnect
+        node_id = self.peer_node_id if self.peer_node_id is not None else self.dialed_node_id
+        if node_id is not None and node_id not in self.connection_manager.peers_connection:
+            self.connection_manager.schedule_reconnect(node_id)
 
         # stop the ping loop
         if self.lc_ping.running:
@@ -81,14 +105,7 @@ class Connection(IntNStringReceiver):
             # handle handshake message
             peer_node_id = msg['nodeid']
             logger.debug('Handshake from %s with peer_node_id = %s ', str(self.transport.getPeer()), peer_node_id)
-
-            if peer_node_id not in self.connection_manager.peers_connection:
-                self.connection_manager.peers_connection.update({peer_node_id: self})
-                self.peer_node_id = peer_node_id
-
-                # start ping loop
-                if not self.lc_ping.running:
-                    self.lc_ping.start(20, now=True)
+            self.register_peer(peer_node_id)
 
             # give peer chance to add connection
             self.send_hello_ack()
@@ -98,24 +115,34 @@ class Connection(IntNStringReceiver):
             # handle handshake acknowledgement
             peer_node_id = msg['nodeid']
             logger.debug('Handshake ACK from %s with peer_node_id = %s ', str(self.transport.getPeer()), peer_node_id)
-
-            if peer_node_id not in self.connection_manager.peers_connection:
-                self.connection_manager.peers_connection.update({peer_node_id: self})
-                self.peer_node_id = peer_node_id
-
-                # start ping loop
-                if not self.lc_ping.running:
-                    self.lc_ping.start(20, now=True)
+            self.register_peer(peer_node_id)
 
         elif msg_type == 'PIN':
             obj = PingMessage.unserialize(string)
-            pong = PongMessage(obj.time)
+            pong = PongMessage(obj.time, self.connection_manager.committed_height())
             data = pong.serialize()
             self.sendString(data)
 
         else:
             self.connection_manager.message_callback(msg_type, string, self)
 
+    def register_peer(self, peer_node_id):
+        """Use this connection to communicate with the peer with `peer_node_id` if there is no connection to it yet.
+        Messages received over a second connection to the peer are still attributed to it.
+
+        Args:
+            peer_node_id (str): id of the node on the other side of the connection.
+        """
+        self.peer_node_id = peer_node_id
+        if peer_node_id not in self.connection_manager.peers_connection:
+            self.connection_manager.peers_connection.update({peer_node_id: self})
+
+            # start ping loop
+            if not self.lc_ping.running:
+                self.lc_ping.start(PING_INTERVAL_MIN, now=True)
+
+            self.connection_manager.peer_connected(peer_node_id)
+
     def send_hello(self):
         """ Send hello/handshake message s.t other node gets to know this node.
         """
@@ -142,6 +169,153 @@ class Connection(IntNStringReceiver):
         pass
 
 
+class LoopbackAddress:
+    """Address of a loopback endpoint.
+
+    Args:
+        name (str): loopback name given in the peers dict.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, LoopbackAddress) and self.name == other.name
+
+    def __hash__(self):
+        return hash(self.name)
+
+    def __repr__(self):
+        return 'LoopbackAddress(%s)' % self.name
+
+
+@implementer(ITransport, IPushProducer)
+class LoopbackTransport:
+    """Transport that passes the written data to the protocol on the other side of the loopback connection. Data
+    written during one reactor iteration is delivered as a single chunk in the next one.
+
+    Args:
+        host (LoopbackAddress): address of this side.
+        peer (LoopbackAddress): address of the other side.
+        clock (IReactorTime): reactor used to schedule the delivery.
+
+    Attributes:
+        protocol (Protocol): protocol on this side of the connection.
+        other (LoopbackTransport): transport on the other side of the connection.
+        pending (list): data written but not yet delivered to the other side.
+        received (list): data delivered by the other side but not yet passed to `protocol` (while paused).
+        paused (bool): if True, data is not delivered to `protocol` until `resumeProducing` is called.
+        disconnecting (bool): True once `loseConnection` has been called.
+    """
+    def __init__(self, host, peer, clock):
+        self.host = host
+        self.peer = peer
+        self.clock = clock
+        self.protocol = None
+        self.other = None
+        self.pending = []
+        self.received = []
+        self.paused = False
+        self.disconnecting = False
+
+    def write(self, data):
+        if self.disconnecting:
+            return
+        if len(self.pending) == 0:
+            self.clock.callLater(0, self.flush)
+        self.pending.append(data)
+
+    def writeSequence(self, data):
+        for d in data:
+            self.write(d)
+
+    def flush(self):
+        """Deliver the pending data to the other side."""
+        data = b''.join(self.pending)
+        self.pending = []
+        self.other.deliver(data)
+
+    def deliver(self, data):
+        """Pass `data` to `protocol` (or keep it until `resumeProducing` is called).
+
+        Args:
+            data (bytes): data written by the other side.
+        """
+        if self.protocol is None:
+            return
+        self.received.append(data)
+        if not self.paused:
+            received = b''.join(self.received)
+            self.received = []
+            self.protocol.dataReceived(received)
+
+    def loseConnection(self):
+        if self.disconnecting:
+            return
+        self.disconnecting = True
+        self.other.disconnecting = True
+        if len(self.pending) != 0:
+            self.flush()
+        self.clock.callLater(0, self.connection_lost)
+        self.clock.callLater(0, self.other.connection_lost)
+
+    def abortConnection(self):
+        self.loseConnection()
+
+    def connection_lost(self):
+        if self.protocol is not None:
+            protocol = self.protocol
+            self.protocol = None
+            protocol.connectionLost(failure.Failure(error.ConnectionDone()))
+
+    def getPeer(self):
+        return self.peer
+
+    def getHost(self):
+        return self.host
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        if len(self.received) != 0:
+            self.deliver(b'')
+
+    def stopProducing(self):
+        self.loseConnection()
+
+
+def connect_loopback(client_protocol, name, clock):
+    """Connect `client_protocol` to the ConnectionManager listening on the loopback name `name`.
+
+    Args:
+        client_protocol (Protocol): protocol of the connecting side.
+        name (str): loopback name of the listening ConnectionManager.
+        clock (IReactorTime): reactor used to deliver the data.
+
+    Returns:
+        Deferred: fires with `client_protocol` once connected (errback if nobody listens on `name`).
+    """
+    server_factory = LOOPBACK_MANAGERS.get(name)
+    if server_factory is None:
+        return defer.fail(error.ConnectionRefusedError('nobody listens on loopback name %s' % name))
+
+    client_address = LoopbackAddress('client of ' + name)
+    server_address = LoopbackAddress(name)
+    server_protocol = server_factory.buildProtocol(client_address)
+
+    client_transport = LoopbackTransport(client_address, server_address, clock)
+    server_transport = LoopbackTransport(server_address, client_address, clock)
+    client_transport.other = server_transport
+    server_transport.other = client_transport
+    client_transport.protocol = client_protocol
+    server_transport.protocol = server_protocol
+
+    server_protocol.makeConnection(server_transport)
+    client_protocol.makeConnection(client_transport)
+    return defer.succeed(client_protocol)
+
+
 class ConnectionManager(Factory):
     """Keeps a consistent state among multiple `Connection` instances. Represents a node with a unique `node_id`.
 
@@ -151,48 +325,161 @@ class ConnectionManager(Factory):
         id (int): unique identifier of this factory which represents a node.
         message_callback (Callable): signature (msg_type, data, sender: Connection). Received strings are delegated
             to this callback if they are not handled inside Connection itself.
-        reconnect_loop (LoopingCall): keeps trying to connect to peers if connection to at least one is lost.
-        peers (dict): stores for each node an ip address and port.
+        peers (dict): stores for each node an ip address and port. An entry with `'learner': True` is a learner: it
+            receives the committed blocks but does not take part in the consensus.
+        learners (set): node ids of the learners.
         reactor (IReactor): The Twisted reactor event loop waits on and demultiplexes events and dispatches them to
             waiting event handlers. Must be parametrized for testing purpose (default = global reactor).
+        reconnect_delays (dict): Mapping from peer node id to the backoff delay used for the next reconnect attempt.
+        reconnect_calls (dict): Mapping from peer node id to the IDelayedCall of a scheduled reconnect attempt.
+        connecting (set): ids of the peers a connection attempt is currently running for.
+        listening_port (IListeningPort): port this node is listening on (None for loopback).
+        mesh_incomplete_since (float): time since when this node is not connected to all peers (None if it is).
+        time_to_full_mesh (float): time it took to connect to all peers after the start or the last lost connection.
+        stopped (bool): True once `stop` has been called (no reconnect attempts are made anymore).
     """
     def __init__(self, index, peer_dict):
         self.peers_connection = {}
         self.id = index
         self.message_callback = self.parse_msg
-        self.reconnect_loop = None
-        self.peers = peer_dict
+        self.peers = None
+        self.learners = None
+        self.set_peers(peer_dict)
         self.reactor = reactor
+        self.reconnect_delays = {}
+        self.reconnect_calls = {}
+        self.connecting = set()
+        self.listening_port = None
+        self.mesh_incomplete_since = None
+        self.time_to_full_mesh = None
+        self.stopped = False
 
     def buildProtocol(self, addr):
         return Connection(self)
 
+    def set_peers(self, peer_dict):
+        """
+        Args:
+            peer_dict (dict): the peers dict of the current configuration.
+        """
+        self.peers = peer_dict
+        self.learners = {peer_node_id for peer_node_id, entry in peer_dict.items() if entry.get('learner')}
+
+    def update_peers(self, peer_dict):
+        """Switch to a new configuration (see `Node.change_membership`). The connections to the peers that have been
+        removed are closed and not reopened. The new peers are connected to by `connect_to_nodes`.
+
+        Args:
+            peer_dict (dict): the peers dict of the new configuration.
+        """
+        removed = [peer_node_id for peer_node_id in self.peers if peer_node_id not in peer_dict]
+        self.set_peers(peer_dict)
+        for peer_node_id in removed:
+            self.reconnect_delays.pop(peer_node_id, None)
+            call = self.reconnect_calls.pop(peer_node_id, None)
+            if call is not None and call.active():
+                call.cancel()
+            connection = self.peers_connection.get(peer_node_id)
+            if connection is not None:
+                connection.transport.loseConnection()
+
     @staticmethod
     def got_protocol(p):
         """The callback to start the protocol exchange. We let connecting nodes start the hello handshake."""
         p.send_hello()
 
-    def connect_to_nodes(self, node_index):
-        """Connect to other peers if not yet connected to them. Ports, ips and node ids of them are all given/predefined.
+    def connect_to_nodes(self):
+        """Connect to all other peers. Ports, ips and node ids of them are all given/predefined. If a connection attempt
+        fails or a connection is lost, a reconnect is scheduled for this peer (see `schedule_reconnect`).
+        """
+        for peer_node_id in self.peers:
+            if peer_node_id != str(self.id):
+                self.try_connect(peer_node_id)
+
+    def try_connect(self, peer_node_id):
+        """Try to connect to a peer unless this node is already connected or connecting to it.
+
+        Args:
+            peer_node_id (str): node id of the peer.
+        """
+        self.reconnect_calls.pop(peer_node_id, None)
+        if self.stopped or peer_node_id in self.peers_connection or peer_node_id in self.connecting:
+            return
+
+        self.connecting.add(peer_node_id)
+        d = self.connect_to_peer(peer_node_id)
+        d.addCallback(self.dialed, peer_node_id)
+        d.addErrback(self.handle_connection_error, peer_node_id)
+
+    def dialed(self, p, peer_node_id):
+        """Is called once the connection to a peer has been opened by this node. Starts the hello handshake.
 
         Args:
-            node_index (str): index of this node into list of peers.
+            p (Connection): the opened connection.
+            peer_node_id (str): node id of the peer.
         """
-        self.connections_report()
-
-        activated = False
-        for index in range(len(self.peers)):
-            if str(index) != node_index and str(index) not in self.peers_connection:
-                activated = True
-                point = TCP4ClientEndpoint(reactor, self.peers.get(str(index)).get('ip'),
-                                           self.peers.get(str(index)).get('port'))
-                d = connectProtocol(point, Connection(self))
-                d.addCallback(self.got_protocol)
-                d.addErrback(self.handle_connection_error, str(index))
-
-        if not activated:
-            self.reconnect_loop.stop()
-            logger.info('Connection synchronization finished: Connected to all peers')
+        self.connecting.discard(peer_node_id)
+        p.dialed_node_id = peer_node_id
+        self.got_protocol(p)
+
+    def schedule_reconnect(self, peer_node_id):
+        """Schedule a reconnect attempt to a peer. The delay grows exponentially with each failed attempt (starting at
+        `RECONNECT_DELAY_MIN` up to `RECONNECT_DELAY_MAX`) and is jittered s.t peers do not retry in lockstep.
+
+        Args:
+            peer_node_id (str): node id of the peer.
+        """
+        if self.stopped or peer_node_id in self.reconnect_calls or peer_node_id not in self.peers:
+            return
+        if self.mesh_incomplete_since is None:
+            self.mesh_incomplete_since = time.time()
+
+        delay = self.reconnect_delays.get(peer_node_id, RECONNECT_DELAY_MIN)
+        self.reconnect_delays.update({peer_node_id: min(2 * delay, RECONNECT_DELAY_MAX)})
+        delay *= random.uniform(1 - RECONNECT_JITTER, 1 + RECONNECT_JITTER)
+
+        logger.debug('reconnect to peer %s in %s seconds', peer_node_id, str(round(delay, 3)))
+        self.reconnect_calls.update({peer_node_id: self.reactor.callLater(delay, self.try_connect, peer_node_id)})
+
+    def peer_connected(self, peer_node_id):
+        """Is called once the handshake with a peer is done. Resets the reconnect state of the peer (a peer that
+        connects to this node, e.g after a restart, is thus used immediately).
+
+        Args:
+            peer_node_id (str): node id of the peer.
+        """
+        self.reconnect_delays.pop(peer_node_id, None)
+        call = self.reconnect_calls.pop(peer_node_id, None)
+        if call is not None and call.active():
+            call.cancel()
+
+        if self.mesh_incomplete_since is not None and len(self.peers_connection) == len(self.peers) - 1:
+            self.time_to_full_mesh = time.time() - self.mesh_incomplete_since
+            self.mesh_incomplete_since = None
+            logger.info('Connected to all peers after %s seconds', str(round(self.time_to_full_mesh, 3)))
+            self.connections_report()
+
+    def connect_to_peer(self, peer_node_id):
+        """Open a connection to a peer over the transport given in its peers dict entry (TCP, Unix domain socket or
+        loopback).
+
+        Args:
+            peer_node_id (str): node id of the peer.
+
+        Returns:
+            Deferred: fires with the Connection instance once connected.
+        """
+        # the peer may have been removed from the configuration in the meantime
+        entry = self.peers.get(peer_node_id) or {}
+        if len(entry) == 0:
+            return defer.fail(error.ConnectError('node %s is not part of the configuration' % peer_node_id))
+        if 'loopback' in entry:
+            return connect_loopback(Connection(self), entry.get('loopback'), self.reactor)
+        if 'unix' in entry:
+            point = UNIXClientEndpoint(reactor, entry.get('unix'))
+        else:
+            point = TCP4ClientEndpoint(reactor, entry.get('ip'), entry.get('port'))
+        return connectProtocol(point, Connection(self))
 
     def connections_report(self):
         logger.debug('"""""""""""""""""')
@@ -204,22 +491,38 @@ class ConnectionManager(Factory):
 
     def broadcast(self, obj, msg_type):
         """
-        `obj` will be broadcast to all the peers.
+        `obj` will be broadcast to all the peers that are voters of the current configuration (see
+        `send_to_learners`).
 
         Args:
             obj: an instance of type Message, Block or Transaction.
             msg_type (str): 3 char description of message type.
         """
-        logger.debug('broadcast: %s', msg_type)
+        if msg_type != 'HBT':
+            logger.debug('broadcast: %s', msg_type)
 
         # go over all connections in self.peers and call sendString on them
         data = obj.serialize()
         for k, v in self.peers_connection.items():
-            v.sendString(data)
+            if k in self.peers and k not in self.learners:
+                v.sendString(data)
 
         if msg_type == 'TXN':
             self.receive_transaction(obj)
 
+    def send_to_learners(self, obj):
+        """
+        `obj` will be sent to all the learners this node is connected to.
+
+        Args:
+            obj: an instance of type Message or Block.
+        """
+        data = obj.serialize()
+        for peer_node_id in self.learners:
+            connection = self.peers_connection.get(peer_node_id)
+            if connection is not None:
+                connection.sendString(data)
+
     @staticmethod
     def respond(obj, sender):
         """
@@ -235,7 +538,7 @@ class ConnectionManager(Factory):
 
     def parse_msg(self, msg_type, msg, sender):
 
-        if msg_type != 'PON':
+        if msg_type not in ['PON', 'HBT']:
             logger.debug('parse_msg called with msg_type = %s', msg_type)
         if msg_type == 'RQB':
             obj = RequestBlockMessage.unserialize(msg)
@@ -248,20 +551,42 @@ class ConnectionManager(Factory):
             self.receive_block(obj)
         elif msg_type == 'RSB':
             obj = RespondBlockMessage.unserialize(msg)
-            self.receive_respond_blocks_message(obj)
+            self.receive_respond_blocks_message(obj, sender)
         elif msg_type == 'PAM':
             obj = PaxosMessage.unserialize(msg)
             self.receive_paxos_message(obj, sender)
         elif msg_type == 'PON':
             obj = PongMessage.unserialize(msg)
             self.receive_pong_message(obj, sender.peer_node_id)
-        elif msg_type == 'ACM':
-            obj = AckCommitMessage.unserialize(msg)
-            self.receive_ack_commit_message(obj)
-
-    @staticmethod
-    def handle_connection_error(failure, node_id):
+        elif msg_type == 'SRQ':
+            obj = SyncRequestMessage.unserialize(msg)
+            self.receive_sync_request_message(obj, sender)
+        elif msg_type == 'SRS':
+            obj = SyncResponseMessage.unserialize(msg)
+            self.receive_sync_response_message(obj, sender)
+        elif msg_type == 'SNQ':
+            obj = SnapshotRequestMessage.unserialize(msg)
+            self.receive_snapshot_request_message(obj, sender)
+        elif msg_type == 'SNC':
+            obj = SnapshotChunkMessage.unserialize(msg)
+            self.receive_snapshot_chunk_message(obj, sender)
+        elif msg_type == 'RIX':
+            obj = ReadIndexMessage.unserialize(msg)
+            self.receive_read_index_message(obj, sender)
+        elif msg_type == 'LTR':
+            obj = LeadershipTransferMessage.unserialize(msg)
+            self.receive_leadership_transfer_message(obj, sender)
+        elif msg_type == 'HBT':
+            obj = HeartbeatMessage.unserialize(msg)
+            self.receive_heartbeat_message(obj, sender)
+        elif msg_type == 'GRP':
+            obj = GroupMessage.unserialize(msg)
+            self.receive_group_message(obj, sender)
+
+    def handle_connection_error(self, failure, node_id):
         logger.debug('Peer not online (%s): peer node id = %s ', str(failure.type), node_id)
+        self.connecting.discard(node_id)
+        self.schedule_reconnect(node_id)
 
     # all the methods which will be called from parse_msg according to msg_type
     def receive_request_blocks_message(self, req, sender):
@@ -273,7 +598,7 @@ class ConnectionManager(Factory):
     def receive_block(self, block):
         raise NotImplementedError("To be implemented in subclass")
 
-    def receive_respond_blocks_message(self, resp):
+    def receive_respond_blocks_message(self, resp, sender):
         raise NotImplementedError("To be implemented in subclass")
 
     def receive_paxos_message(self, message, sender):
@@ -282,22 +607,99 @@ class ConnectionManager(Factory):
     def receive_pong_message(self, message, peer_node_id):
         raise NotImplementedError("To be implemented in subclass")
 
-    def receive_ack_commit_message(self, message):
+    def receive_sync_request_message(self, req, sender):
+        raise NotImplementedError("To be implemented in subclass")
+
+    def receive_sync_response_message(self, resp, sender):
         raise NotImplementedError("To be implemented in subclass")
 
+    def receive_snapshot_request_message(self, req, sender):
+        raise NotImplementedError("To be implemented in subclass")
+
+    def receive_snapshot_chunk_message(self, message, sender):
+        raise NotImplementedError("To be implemented in subclass")
+
+    def receive_read_index_message(self, message, sender):
+        raise NotImplementedError("To be implemented in subclass")
+
+    def receive_leadership_transfer_message(self, message, sender):
+        raise NotImplementedError("To be implemented in subclass")
+
+    def receive_heartbeat_message(self, message, sender):
+        raise NotImplementedError("To be implemented in subclass")
+
+    def receive_group_message(self, message, sender):
+        raise NotImplementedError("To be implemented in subclass")
+
+    def committed_height(self):
+        """Can be overridden in a subclass to tell the peers the committed height of this node (in pong messages).
+
+        Returns:
+            int: committed height of this node (None if unknown).
+        """
+        return None
+
+    def peer_disconnected(self, peer_node_id):
+        """Is called once the connection to the peer with `peer_node_id` has been lost. Can be overridden in a subclass
+        to clean up state that is kept per peer.
+
+        Args:
+            peer_node_id (str): node id of the peer.
+        """
+        pass
+
     # methods used by the app (part of external interface)
 
-    def start_server(self):
-        """First starts a server listening on a port given in peers dict. Then connect to other peers.
+    def start(self):
+        """First starts a server listening on the port, Unix domain socket or loopback name given in peers dict. Then
+        connect to other peers. Does not run the reactor s.t multiple nodes can be started in the same process.
         """
-        endpoint = TCP4ServerEndpoint(reactor, self.peers.get(str(self.id)).get('port'))
-        d = endpoint.listen(self)
-        d.addErrback(log.err)
+        # a node that has been removed from the configuration (see `Node.change_membership`) does not listen anymore
+        entry = self.peers.get(str(self.id)) or {}
+        if len(entry) == 0:
+            logger.warning('node %s is not part of the configuration, not listening', str(self.id))
+        elif 'loopback' in entry:
+            LOOPBACK_MANAGERS.update({entry.get('loopback'): self})
+        else:
+            if 'unix' in entry:
+                endpoint = UNIXServerEndpoint(reactor, entry.get('unix'))
+            else:
+                endpoint = TCP4ServerEndpoint(reactor, entry.get('port'))
+            d = endpoint.listen(self)
+            d.addCallback(self.listening)
+            d.addErrback(log.err)
 
         # "client part" -> connect to all servers -> add handshake callback
-        self.reconnect_loop = task.LoopingCall(self.connect_to_nodes, str(self.id))
         logger.debug('Connection synchronization start...')
-        deferred = self.reconnect_loop.start(0.1, True)
-        deferred.addErrback(log.err)
+        self.mesh_incomplete_since = time.time()
+        self.connect_to_nodes()
+
+    def listening(self, port):
+        """Is called once the server part of this node listens on its port (or Unix domain socket)."""
+        self.listening_port = port
+
+    def stop(self):
+        """Stop listening, cancel all scheduled reconnect attempts and close all connections.
+        """
+        # the entry of this node may have been removed from the configuration since it has been started
+        for name in [name for name, manager in LOOPBACK_MANAGERS.items() if manager is self]:
+            LOOPBACK_MANAGERS.pop(name)
+        if self.listening_port is not None:
+            self.listening_port.stopListening()
+            self.listening_port = None
+
+        # prevent reconnect attempts
+        self.stopped = True
+        for call in self.reconnect_calls.values():
+            if call.active():
+                call.cancel()
+        self.reconnect_calls = {}
+
+        for connection in list(self.peers_connection.values()):
+            connection.transport.loseConnection()
 
+    def start_server(self):
+        """Start the node (see `start`) and run the reactor.
+        """
+        self.start()
         reactor.run()
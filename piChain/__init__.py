@@ -1 +1,4 @@
-from piChain.PaxosLogic import Node
+from piChain.PaxosLogic import Node, NodeBusyError
+from piChain.multigroup import MultiGroupNode
+from piChain.state_machine import StateMachine, PlyvelStateMachine
+from piChain.subscription import CommittedLogFactory
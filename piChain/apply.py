@@ -0,0 +1,226 @@
+"""This module implements the ApplyPipeline class which passes the committed txs of a node to the app on a worker
+thread. A slow app thus does not stall the reactor (and the consensus) anymore. The commands of multiple committed
+blocks are passed to the app in a single call. If the app implements the StateMachine interface, the commands are
+sharded by their partition key among multiple workers."""
+
+import logging
+from collections import deque
+
+from twisted.internet import threads, defer
+
+from piChain.config import APPLY_QUEUE_SIZE, APPLY_BATCH_SIZE, APPLY_WORKERS
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class ApplyPipeline:
+    """Bounded queue of committed blocks that are applied in commit order by calling `callback` on a thread of the
+    reactor thread pool. At most one call is running at any time unless a `partition_key` is given: the commands of the
+    blocks are then sharded among `APPLY_WORKERS` parallel calls (commands with the same key are passed to the same
+    call). The next blocks are only applied once all shards have been applied (apply barrier). `flush` is then called
+with the committed height of the applied blocks. If applying or flushing fails, the pipeline stops (see
+`apply_failed`).
+
+    Args:
+        node (Node): the node whose committed blocks are applied. It is notified on the reactor thread once blocks have
+            been applied (see `Node.blocks_applied`).
+        callback (Callable): called on a worker thread with the commands of one or more committed blocks.
+        applied_height (int): committed height up to which the blocks have already been applied.
+        partition_key (Callable): returns the partition key of a command (see `StateMachine.partition_key`). None if
+            the commands can not be applied in parallel.
+        flush (Callable): called on a worker thread with the committed height of the last applied block once the
+            blocks of a call (or all of its shards) have been applied (see `StateMachine.flush`).
+
+    Attributes:
+        queue (deque): (committed height, commands) pairs of the committed blocks that have not been applied yet.
+        running (bool): True if `callback` is currently running.
+        applied_height (int): committed height of the last applied block (the applied-index watermark).
+        stalled (bool): True if the quick node stopped creating blocks since the queue is full.
+        idle_waiters (list): (function, args) pairs called once no commands are applied anymore.
+        failure (Failure): the error that stopped the pipeline (None as long as all blocks have been applied).
+    """
+    def __init__(self, node, callback, applied_height, partition_key=None, flush=None):
+        self.node = node
+        self.callback = callback
+        self.partition_key = partition_key
+        self.flush = flush
+        self.queue = deque()
+        self.running = False
+        self.applied_height = applied_height
+        self.stalled = False
+        self.idle_waiters = []
+        self.failure = None
+
+    def put(self, height, commands):
+        """Append a committed block to the queue.
+
+        Args:
+            height (int): committed height of the block.
+            commands (list): commands of the txs of the block.
+        """
+        if self.failure is not None:
+            # the block is applied again after a restart (see `Node.replay_unapplied`)
+            return
+        self.queue.append((height, commands))
+        if not self.running:
+            self.apply_next()
+
+    def full(self):
+        """
+        Returns:
+            bool: True if at least `APPLY_QUEUE_SIZE` blocks are waiting to be applied.
+        """
+        return len(self.queue) >= APPLY_QUEUE_SIZE
+
+    def apply_next(self):
+        """Pass the commands of up to `APPLY_BATCH_SIZE` queued blocks to `callback` on a worker thread (or multiple
+        ones)."""
+        commands = []
+        height = self.applied_height
+        while len(self.queue) != 0 and height - self.applied_height < APPLY_BATCH_SIZE:
+            height, block_commands = self.queue.popleft()
+            commands.extend(block_commands)
+
+        self.running = True
+        if self.partition_key is None:
+            d = self.run(commands)
+        else:
+            d = self.apply_partitioned(commands)
+        if self.flush is not None:
+            d.addCallback(lambda _: self.run_flush(height))
+        d.addCallbacks(self.applied, self.apply_failed, callbackArgs=(height,))
+
+    def run(self, commands):
+        """
+        Args:
+            commands (list): commands passed to `callback`.
+
+        Returns:
+            Deferred: fires on the reactor thread once `callback` returned.
+        """
+        return threads.deferToThreadPool(self.node.reactor, self.node.reactor.getThreadPool(), self.callback, commands)
+
+    def run_flush(self, height):
+        """
+        Args:
+            height (int): committed height passed to `flush`.
+
+        Returns:
+            Deferred: fires on the reactor thread once `flush` returned.
+        """
+        return threads.deferToThreadPool(self.node.reactor, self.node.reactor.getThreadPool(), self.flush, height)
+
+    def apply_partitioned(self, commands):
+        """Shard `commands` by their partition key among `APPLY_WORKERS` parallel calls. A command without a key is
+        applied alone once all previous commands have been applied.
+
+        Args:
+            commands (list): commands in commit order.
+
+        Returns:
+            Deferred: fires once all `commands` have been applied.
+        """
+        segments = []
+        shards = [[] for _ in range(APPLY_WORKERS)]
+        for command in commands:
+            key = self.partition_key(command)
+            if key is None:
+                segments.append(shards)
+                segments.append([[command]])
+                shards = [[] for _ in range(APPLY_WORKERS)]
+            else:
+                shards[hash(key) % APPLY_WORKERS].append(command)
+        segments.append(shards)
+
+        d = defer.succeed(None)
+        for shards in segments:
+            d.addCallback(self.apply_shards, shards)
+        return d
+
+    def apply_shards(self, _, shards):
+        """
+        Args:
+            shards (list): lists of commands that are applied in parallel.
+
+        Returns:
+            Deferred: fires once all `shards` have been applied.
+        """
+        return defer.gatherResults([self.run(shard) for shard in shards if len(shard) != 0], consumeErrors=True)
+
+    def when_idle(self, function, *args):
+        """Call `function` with `args` on the reactor thread once no commands are applied (right away if idle). It is
+        also called once the pipeline has been stopped by a failure (see `failure`) s.t it can give up.
+
+        Args:
+            function (Callable): e.g takes a snapshot of the app state.
+            *args: arguments `function` is called with.
+        """
+        if self.running:
+            self.idle_waiters.append((function, args))
+        else:
+            function(*args)
+
+    def restore(self, restore, stream, height):
+        """Replace the app state by a snapshot once no commands are applied. The queued blocks up to `height` are
+        dropped (their txs are contained in the snapshot).
+
+        Args:
+            restore (Callable): called on a worker thread with `stream` (see `StateMachine.restore`).
+            stream: binary file-like object containing the snapshot (closed once restored).
+            height (int): committed height of the last block whose txs are contained in the snapshot.
+        """
+        self.when_idle(self.start_restore, restore, stream, height)
+
+    def start_restore(self, restore, stream, height):
+        if self.failure is not None:
+            stream.close()
+            return
+        self.running = True
+        while len(self.queue) != 0 and self.queue[0][0] <= height:
+            self.queue.popleft()
+
+        d = threads.deferToThreadPool(self.node.reactor, self.node.reactor.getThreadPool(), restore, stream)
+        if self.flush is not None:
+            d.addCallback(lambda _: self.run_flush(height))
+        d.addBoth(self.close_stream, stream)
+        d.addCallbacks(self.applied, self.apply_failed, callbackArgs=(height,))
+
+    @staticmethod
+    def close_stream(result, stream):
+        stream.close()
+        return result
+
+    def applied(self, _, height):
+        """Is called on the reactor thread once `callback` (or a restore) returned.
+
+        Args:
+            height (int): committed height of the last applied block.
+        """
+        self.running = False
+        self.applied_height = height
+        while len(self.idle_waiters) != 0 and not self.running:
+            function, args = self.idle_waiters.pop(0)
+            function(*args)
+        if len(self.queue) != 0 and not self.running:
+            self.apply_next()
+        self.node.blocks_applied()
+
+    def apply_failed(self, failure):
+        """Is called on the reactor thread if `callback`, `flush` or a restore failed. The pipeline stops: the failed
+        blocks are not marked as applied since the app state would silently diverge from the other nodes. The reads of
+        this node keep waiting for them and the blocks are kept on disk s.t they are applied again after a restart from
+        the last persisted applied height (see `StateMachine.applied_height`). The functions waiting for the pipeline to
+        be idle are called s.t they can give up (e.g a snapshot session answers that no snapshot can be served).
+
+        Args:
+            failure (Failure): the error.
+        """
+        logger.error('applying the committed txs failed, stop applying: %s', str(failure.value))
+        self.failure = failure
+        self.running = False
+        self.queue.clear()
+        waiters = self.idle_waiters
+        self.idle_waiters = []
+        for function, args in waiters:
+            function(*args)
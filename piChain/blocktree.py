@@ -8,6 +8,7 @@ import os
 import plyvel
 
 from piChain.messages import Block
+from piChain.config import ID_LEASE_SIZE
 
 # genesis block
 GENESIS = Block(-1, None, [], 0)
@@ -20,6 +21,8 @@ class Blocktree:
     Args:
           node_index (int): index of node owning this blocktree (to avoid concurrency problems with multiple local
             nodes).
+          group_id (int): id of the consensus group this blocktree belongs to if the node runs multiple groups (None
+            otherwise).
 
     Attributes:
         genesis (Block): the genesis block (adjusted over time to safe memory).
@@ -28,9 +31,10 @@ class Blocktree:
         committed_blocks (list): ids of all committed blocks so far.
         nodes (dict): dictionary from block_id to instance of type Block. Contains all blocks seen so far.
         counter (int): gobal counter used for txn_id and block_id
-        ack_commits (dict): dict from block_id to int that counts how many times a block has been committed.
+        counter_limit (int): highest counter value reserved on disk (see `next_counter`).
+        genesis_height (int): committed height of the genesis block.
     """
-    def __init__(self, node_index):
+    def __init__(self, node_index, group_id=None):
         self.genesis = GENESIS
         self.head_block = GENESIS
         self.committed_block = GENESIS
@@ -38,11 +42,14 @@ class Blocktree:
         self.nodes = {}
         self.nodes.update({GENESIS.block_id: GENESIS})
         self.counter = 0
-        self.ack_commits = {}
+        self.counter_limit = 0
+        self.genesis_height = 0
 
         # create a db instance (s.t blocks can be recovered after a crash)
         base_path = os.path.expanduser('~/.pichain')
         path = base_path + '/node_' + str(node_index)
+        if group_id is not None:
+            path += '_group_' + str(group_id)
         if not os.path.exists(path):
             os.makedirs(path)
         self.db = plyvel.DB(path, create_if_missing=True)
@@ -64,7 +71,9 @@ class Blocktree:
                 block = self.nodes.get(int(value.decode()))
                 self.head_block = block
             elif key == b'counter':
+                # continue with the next range (the ids up to the reserved limit may have been used before a crash)
                 self.counter = int(value.decode())
+                self.counter_limit = self.counter
             elif key == b'genesis':
                 block = self.nodes.get(int(value.decode()))
                 self.genesis = block
@@ -72,6 +81,22 @@ class Blocktree:
                 block_ids = json.loads(value.decode())
                 self.committed_blocks = block_ids
 
+        if self.genesis.block_id in self.committed_blocks:
+            self.genesis_height = self.committed_blocks.index(self.genesis.block_id)
+
+    def next_counter(self):
+        """Increment the counter used for txn and block ids. Ids are reserved in ranges of `ID_LEASE_SIZE` s.t only one
+        write to disk is needed per range.
+
+        Returns:
+            int: the incremented counter.
+        """
+        self.counter += 1
+        if self.counter > self.counter_limit:
+            self.counter_limit = self.counter + ID_LEASE_SIZE - 1
+            self.db.put(b'counter', str(self.counter_limit).encode())
+        return self.counter
+
     def ancestor(self, block_a, block_b):
         """Check if `block_a` is ancestor of `block_b`. Both blocks must be included in `self.nodes`.
 
@@ -150,3 +175,82 @@ class Blocktree:
             block_id_bytes = block_id_str.encode()
             block_bytes = block.serialize()
             self.db.put(block_id_bytes, block_bytes)
+
+    def add_blocks(self, blocks):
+        """Add multiple `blocks` to `self.nodes` and write them to disk in a single batch.
+
+        Args:
+            blocks (list): Blocks to be added (parents before children).
+
+        """
+        with self.db.write_batch() as wb:
+            for block in blocks:
+                if block.depth is None and self.nodes.get(block.parent_block_id) is not None:
+                    parent = self.nodes.get(block.parent_block_id)
+                    block.depth = parent.depth + len(block.txs)
+
+                if self.nodes.get(block.block_id) is None:
+                    self.nodes.update({block.block_id: block})
+                    wb.put(str(block.block_id).encode(), block.serialize())
+
+    def committed_height(self):
+        """
+        Returns:
+            int: the committed height of this blocktree i.e the index of `committed_block` in `committed_blocks`.
+        """
+        return len(self.committed_blocks) - 1
+
+    def committed_range(self, start, stop):
+        """Return the ids of the committed blocks with a committed height in [`start`, `stop`). If `stop` is None, the
+        ids of all committed blocks from `start` on are returned followed by the ids of the blocks on the path from
+        `committed_block` to `head_block`.
+
+        Args:
+            start (int): committed height of the first block.
+            stop (int): committed height following the last block (or None).
+
+        Returns:
+            list: block ids (parents before children) or None if the range is not available (not committed yet or
+                deleted by a genesis block change).
+        """
+        if start < 1 or start > len(self.committed_blocks):
+            return None
+        if stop is not None and stop > len(self.committed_blocks):
+            return None
+        block_ids = self.committed_blocks[start:stop]
+
+        if stop is None:
+            # append the uncommitted blocks from committed_block to head_block
+            head_path = []
+            b = self.head_block
+            while b is not None and b != self.committed_block:
+                head_path.append(b.block_id)
+                b = self.nodes.get(b.parent_block_id)
+            if b is not None:
+                head_path.reverse()
+                block_ids = block_ids + head_path
+
+        for b_id in block_ids:
+            if self.nodes.get(b_id) is None:
+                return None
+        return block_ids
+
+    def height_after_commit(self, block):
+        """
+        Args:
+            block (Block): a descendant of `committed_block` (or `committed_block` itself).
+
+        Returns:
+            int: the committed height of this blocktree once `block` is committed (None if `block` is not a
+                descendant of `committed_block`).
+        """
+        count = 0
+        b = block
+        while b is not None and b != self.committed_block:
+            if b == self.genesis:
+                return None
+            count += 1
+            b = self.nodes.get(b.parent_block_id)
+        if b is None:
+            return None
+        return self.committed_height() + count
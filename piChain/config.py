@@ -7,12 +7,27 @@
 
 
 ACCUMULATION_TIME = 0.1
-"""float: Time the quick node accumulates transactions befor creating a block.
+"""float: Time the quick node accumulates transactions befor creating a block (only used if ADAPTIVE_BATCHING is
+False).
 
 dependencies: the higher the RPS rate, the higher this value should be.
 default = 0.1 seconds
 """
 
+ADAPTIVE_BATCHING = True
+"""bool: If set to true the time transactions are accumulated adapts to the load: a block is created immediately if the
+node is idle, the accumulation time grows with the arrival rate of transactions and the duration of a running commit and
+a block is created early once BATCH_TARGET_COUNT or BATCH_TARGET_BYTES is reached.
+
+default = True
+"""
+
+MAX_ACCUMULATION_TIME = 0.1
+"""float: Max time transactions are accumulated before creating a block if ADAPTIVE_BATCHING is True.
+
+default = 0.1 seconds
+"""
+
 
 MAX_COMMIT_TIME = 2
 """float: Max allowed time a node has to commit a block.
@@ -23,16 +38,167 @@ on the local processing time only.
 default = 2 seconds
 """
 
+TXN_TIMEOUT = 10
+"""float: Time after which a transaction made by this node that has not been committed yet is resubmitted (it may have
+been lost, e.g because the quick node crashed before putting it into a block).
+
+dependencies: must be larger than the time a commit usually takes (see MAX_COMMIT_TIME).
+default = 10 seconds
+"""
+
+TXN_RESUBMITS = 2
+"""int: Number of times a transaction is resubmitted before its Deferred (see `Node.make_txn`) fails with a timeout.
+
+default = 2
+"""
+
+LEASE_DURATION = 1
+"""float: Time a node promises not to accept TRY or PROPOSE messages from other nodes after it acknowledged a PROPOSE or
+LEASE message of a quick node. During this time the quick node can serve linearizable reads locally.
+
+dependencies: the higher this value, the longer it takes until another node can commit blocks once the quick node
+crashed.
+default = 1 second
+"""
+
+LEASE_CLOCK_DRIFT = 0.1
+"""float: Max relative drift between the clocks of two nodes. The quick node considers its lease to be valid for
+(1 - LEASE_CLOCK_DRIFT) * LEASE_DURATION only.
+
+default = 0.1
+"""
+
+READ_TIMEOUT = 2
+"""float: Time after which a linearizable read fails if the read index could not be obtained.
+
+default = 2 seconds
+"""
+
+#
+# Networking
+#
+
+
+RECONNECT_DELAY_MIN = 0.1
+"""float: Time a node waits before it retries to connect to a peer after the first failed attempt or a lost connection.
+
+default = 0.1 seconds
+"""
+
+RECONNECT_DELAY_MAX = 5
+"""float: Max time a node waits between two attempts to connect to a peer. The delay doubles with each failed attempt.
+
+dependencies: the higher this value, the longer a restarted node may be ignored by its peers (until it connects to
+them itself).
+default = 5 seconds
+"""
+
+RECONNECT_JITTER = 0.5
+"""float: Relative jitter applied to the reconnect delays s.t peers do not retry in lockstep.
+
+default = 0.5 (i.e the delay is multiplied by a random value in [0.5, 1.5])
+"""
+
+#
+# Round trip time estimation
+#
+
+
+RTT_WINDOW = 100
+"""int: Number of recent RTT samples per peer that are kept to compute percentiles.
+
+default = 100 samples
+"""
+
+RTT_PERCENTILE = 95
+"""float: Percentile of the recent RTT samples a timeout must at least cover.
+
+default = 95
+"""
+
+PING_INTERVAL_MIN = 1
+"""float: Min time between two ping messages sent to the same peer. Is used if the RTT to the peer varies a lot.
+
+default = 1 second
+"""
+
+PING_INTERVAL_MAX = 20
+"""float: Max time between two ping messages sent to the same peer. Is used if the RTT to the peer is stable.
+
+default = 20 seconds
+"""
+
+#
+# Failure detection
+#
+
+
+HEARTBEAT_INTERVAL = 0.1
+"""float: Time between two heartbeat messages the quick node broadcasts. The other nodes use them to detect a crash of
+the quick node (without waiting for a transaction to time out).
+
+dependencies: the smaller this value, the faster a crash of the quick node is detected.
+default = 0.1 seconds
+"""
+
+HEARTBEAT_WINDOW = 100
+"""int: Number of recent intervals between the heartbeats of the quick node that are kept to compute the suspicion
+level phi.
+
+default = 100 intervals
+"""
+
+PHI_THRESHOLD = 8
+"""float: Suspicion level phi at which a node considers the quick node crashed. It then shortens its patience s.t it
+takes over the role of the quick node with the next transaction (or right away if it has pending transactions).
+
+dependencies: the lower this value, the faster a crash is detected but the more likely a slow quick node is suspected.
+default = 8 (chance of a mistake = 1e-8)
+"""
+
 #
 # Paxos Logic (Data sizes)
 #
 
 
-MAX_TXN_COUNT = 7500
-"""int: Max number of transactions allowed in a block.
+MAX_MESSAGE_SIZE = 10000000
+"""int: Max number of bytes of a message sent over a connection. Larger messages are rejected by the receiver, which
+drops the connection.
+
+default = 10 Megabyte
+"""
+
+BLOCK_SIZE = 1500000
+"""int: Max number of bytes of the serialized transactions of a block. Transactions that do not fit are included in the
+next block. The size is further limited s.t a block always fits into a single message, including the envelopes of the
+messages carrying it in multi-group mode (see MAX_MESSAGE_SIZE).
 
-dependencies: depends on transaction size.
-default = 7500 transactions (this is based on transactions that are of size = 200 bytes)
+dependencies: the higher the RPS rate and txn sizes, the higher this value should be.
+default = 1.5 Megabyte (7500 transactions of size = 200 bytes)
+"""
+
+BATCH_TARGET_COUNT = 5000
+"""int: Number of transactions after which the quick node creates a block without waiting any longer (only used if
+ADAPTIVE_BATCHING is True).
+
+default = 5000 transactions
+"""
+
+BATCH_TARGET_BYTES = 1000000
+"""int: Number of bytes of serialized transactions after which the quick node creates a block without waiting any longer
+(only used if ADAPTIVE_BATCHING is True).
+
+dependencies: must be smaller than BLOCK_SIZE.
+default = 1 Megabyte
+"""
+
+ID_LEASE_SIZE = 10000
+"""int: Number of txn and block ids a node reserves with a single write to disk. Ids stay unique after a crash since a
+restarted node continues with the next range.
+
+dependencies: the higher this value, the fewer disk writes are needed to make transactions and blocks (ids of a reserved
+range are skipped after a crash).
+default = 10000 ids
 """
 
 RECOVERY_BLOCKS_COUNT = 5
@@ -42,6 +208,120 @@ dependencies: depends on number of transactions send per second and how long cra
 default = 5
 """
 
+SYNC_CHUNK_SIZE = 1000000
+"""int: Max number of bytes of blocks send in one chunk if a node that fell far behind synchronizes with a peer.
+
+dependencies: must be smaller than MAX_MESSAGE_SIZE.
+default = 1 Megabyte
+"""
+
+SYNC_WINDOW = 4
+"""int: Number of chunks that may be in flight during a synchronization (flow control).
+
+dependencies: the higher the bandwidth-delay product between the nodes, the higher this value should be.
+default = 4 chunks
+"""
+
+SYNC_STRIPE_MIN_BLOCKS = 100
+"""int: Min number of blocks fetched from a single peer during a synchronization. The missing range of blocks is split
+into stripes that are fetched from multiple peers in parallel.
+
+dependencies: the smaller the blocks, the higher this value should be.
+default = 100 blocks
+"""
+
+SNAPSHOT_CHUNK_SIZE = 1000000
+"""int: Number of bytes of a snapshot of the app state sent in one chunk if a node fell too far behind to synchronize
+block by block (see `StateMachine.snapshot`). SYNC_WINDOW chunks may be in flight.
+
+dependencies: must be smaller than MAX_MESSAGE_SIZE.
+default = 1 Megabyte
+"""
+
+#
+# Apply pipeline
+#
+
+
+APPLY_QUEUE_SIZE = 1000
+"""int: Number of committed blocks that may wait to be passed to `tx_applied` (see `Node.tx_applied`). Once as many
+blocks are waiting, the quick node stops creating blocks until the app caught up (backpressure).
+
+dependencies: the slower the app applies the committed txs, the higher this value should be.
+default = 1000 blocks
+"""
+
+APPLY_BATCH_SIZE = 100
+"""int: Max number of committed blocks whose commands are passed to `tx_applied` in a single call.
+
+default = 100 blocks
+"""
+
+APPLY_WORKERS = 4
+"""int: Number of worker threads the commands of the committed blocks are sharded among by their partition key if the
+app implements the StateMachine interface (see `Node.state_machine`).
+
+dependencies: should not exceed the number of cores nor the size of the reactor thread pool (default = 10 threads).
+default = 4 workers
+"""
+
+#
+# Admission control
+#
+
+
+PENDING_TXS_HIGH = 100000
+"""int: Number of pending txs (not committed yet) at which a node stops admitting new txs: `make_txn` fails with a
+NodeBusyError and the producers of txs registered with the node are paused (see `Node.update_admission`).
+
+dependencies: the higher the RPS rate and the longer a commit may take, the higher this value should be.
+default = 100000 transactions
+"""
+
+PENDING_TXS_LOW = 50000
+"""int: Number of pending txs a node that stopped admitting new txs has to fall back to before it admits them again.
+
+dependencies: must be smaller than PENDING_TXS_HIGH.
+default = 50000 transactions
+"""
+
+PENDING_BYTES_HIGH = 50000000
+"""int: Number of bytes of the serialized txs waiting for a block at which a node stops admitting new txs.
+
+dependencies: the larger the txs, the higher this value should be.
+default = 50 Megabyte
+"""
+
+PENDING_BYTES_LOW = 25000000
+"""int: Number of bytes of the serialized txs waiting for a block a node that stopped admitting new txs has to fall back
+to before it admits them again.
+
+dependencies: must be smaller than PENDING_BYTES_HIGH.
+default = 25 Megabyte
+"""
+
+#
+# Committed log subscriptions
+#
+
+
+SUBSCRIPTION_BATCH_SIZE = 1000000
+"""int: Max number of bytes of committed txs sent to a subscriber of the committed log in one frame (see
+`CommittedLogFactory`). Blocks are never split among frames, so a frame holds at least one block.
+
+dependencies: must be smaller than MAX_MESSAGE_SIZE.
+default = 1 Megabyte
+"""
+
+LOG_RETENTION_BLOCKS = 0
+"""int: Number of committed blocks below the committed height that are not deleted at a genesis block change s.t a
+subscriber of the committed log can resume after a lost connection (the blocks not read yet by connected subscribers
+are kept anyway).
+
+dependencies: the higher the RPS rate and the longer subscribers may be disconnected, the higher this value should be.
+default = 0 blocks
+"""
+
 #
 # Logging and Debug
 #
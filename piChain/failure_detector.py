@@ -0,0 +1,68 @@
+"""This module implements a phi accrual failure detector (see Hayashibara et al., The phi Accrual Failure Detector). It
+is used by the slow and medium nodes to detect a crash of the quick node based on its heartbeats."""
+
+import math
+import time
+from collections import deque
+
+from piChain.config import HEARTBEAT_WINDOW
+
+
+class PhiAccrualDetector:
+    """Keeps a window of the intervals between the heartbeats of a single node and computes the suspicion level phi
+    that the node crashed. The intervals are assumed to be normally distributed. A phi of 1 corresponds to a chance of
+    10 % that the next heartbeat is still going to arrive, a phi of 2 to a chance of 1 % and so on.
+
+    Args:
+        interval (float): expected time between two heartbeats (used until enough intervals have been sampled).
+        min_std_deviation (float): lower bound of the standard deviation of the intervals s.t a regular flow of
+            heartbeats does not make the detector too sensitive.
+
+    Attributes:
+        intervals (deque): the `HEARTBEAT_WINDOW` most recent intervals.
+        last_heartbeat (float): time the last heartbeat has been received (None before the first heartbeat).
+    """
+    def __init__(self, interval, min_std_deviation):
+        self.min_std_deviation = min_std_deviation
+        self.intervals = deque(maxlen=HEARTBEAT_WINDOW)
+        self.last_heartbeat = None
+
+        # bootstrap with the expected interval (a standard deviation of a quarter of it)
+        self.intervals.append(interval - interval / 4)
+        self.intervals.append(interval + interval / 4)
+
+    def heartbeat(self, now=None):
+        """Record the arrival of a heartbeat.
+
+        Args:
+            now (float): arrival time (default = current time).
+        """
+        now = time.time() if now is None else now
+        if self.last_heartbeat is not None:
+            self.intervals.append(now - self.last_heartbeat)
+        self.last_heartbeat = now
+
+    def phi(self, now=None):
+        """
+        Args:
+            now (float): time at which the suspicion level is computed (default = current time).
+
+        Returns:
+            float: the suspicion level (0 before the first heartbeat).
+        """
+        if self.last_heartbeat is None:
+            return 0
+        now = time.time() if now is None else now
+
+        mean = sum(self.intervals) / len(self.intervals)
+        variance = sum((i - mean) ** 2 for i in self.intervals) / len(self.intervals)
+        std_deviation = max(math.sqrt(variance), self.min_std_deviation)
+
+        # logistic approximation of the cumulative distribution function of the normal distribution (y is bounded to
+        # avoid a floating point overflow, phi is > 250 at the bound anyway)
+        y = (now - self.last_heartbeat - mean) / std_deviation
+        y = max(-20, min(20, y))
+        e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        if now - self.last_heartbeat > mean:
+            return -math.log10(e / (1 + e))
+        return -math.log10(1 - 1 / (1 + e))
@@ -8,7 +8,7 @@ class PaxosMessage:
     """ A paxos message used to commit a block.
 
     Args:
-        msg_type (str): TRY, TRY_OK, PROPOSE, PROPOSE_ACK or COMMIT.
+        msg_type (str): TRY, TRY_OK, PROPOSE, PROPOSE_ACK, COMMIT, LEASE or LEASE_ACK.
         request_seq (int): each message contains a request sequence number s.t outdated messaged can be detected.
 
     Attributes:
@@ -17,6 +17,8 @@ class PaxosMessage:
         supp_block (int): block_id of support block (supporting the proposed block).
         com_block (int): block_id of compromise block.
         last_committed_block (int): block_id of last committed block (for faster recovery in case of partition).
+        height (int): committed height of the sender once `com_block` is committed (COMMIT) or committed height of the
+            sender (TRY_OK, PROPOSE_ACK).
     """
     def __init__(self, msg_type, request_seq):
         self.msg_type = msg_type
@@ -28,13 +30,14 @@ class PaxosMessage:
         self.supp_block = None
         self.com_block = None
         self.last_committed_block = None
+        self.height = None
 
     def serialize(self):
         """
         Returns (bytes): bytes representing the object.
         """
-        obj_list = [self.last_committed_block, self.com_block, self.supp_block, self.prop_block, self.new_block,
-                    self.request_seq, self.msg_type]
+        obj_list = [self.height, self.last_committed_block, self.com_block, self.supp_block, self.prop_block,
+                    self.new_block, self.request_seq, self.msg_type]
         obj_bytes = cbor.dumps(obj_list)
         return b'PAM' + obj_bytes
 
@@ -56,6 +59,7 @@ class PaxosMessage:
         setattr(obj, 'supp_block', obj_list.pop())
         setattr(obj, 'com_block', obj_list.pop())
         setattr(obj, 'last_committed_block', obj_list.pop())
+        setattr(obj, 'height', obj_list.pop())
         return obj
 
 
@@ -125,33 +129,315 @@ class RespondBlockMessage:
         return obj
 
 
-class AckCommitMessage:
-    """Is broadcast once a node commits a block to perform genesis block change once all nodes committed a block.
+class ReadIndexMessage:
+    """Is broadcast by a node that wants to serve a linearizable read. The quick node answers with its committed height
+    (the read index) once it holds a valid lease.
 
     Args:
-        block_id (int): block id of committed block.
+        request_id (int): used by the requesting node to match the answer to the request.
+        height (int): committed height of the quick node (None in the request).
     """
-    def __init__(self, block_id):
-        self.block_id = block_id
+    def __init__(self, request_id, height=None):
+        self.request_id = request_id
+        self.height = height
 
     def serialize(self):
         """
         Returns (bytes): bytes representing the object.
         """
-        return b'ACM' + cbor.dumps(self.block_id)
+        obj_list = [self.height, self.request_id]
+        return b'RIX' + cbor.dumps(obj_list)
 
     @staticmethod
     def unserialize(msg):
         """
         Args:
-            msg (bytes): AckCommitMessage represented in bytes.
+            msg (bytes): ReadIndexMessage represented in bytes.
 
         Returns:
-             AckCommitMessage: original AckCommitMessage instance.
+             ReadIndexMessage: original ReadIndexMessage instance.
         """
-        block_id = cbor.loads(msg[3:])
-        obj = AckCommitMessage.__new__(AckCommitMessage)
-        setattr(obj, 'block_id', block_id)
+        obj_list = cbor.loads(msg[3:])
+        obj = ReadIndexMessage.__new__(ReadIndexMessage)
+        setattr(obj, 'request_id', obj_list.pop())
+        setattr(obj, 'height', obj_list.pop())
+        return obj
+
+
+class LeadershipTransferMessage:
+    """Is broadcast by the quick node to hand its role over to another node (see `Node.transfer_leadership`).
+
+    Args:
+        target_id (int): id of the node that becomes the quick node.
+        committed_block (int): block id of the last committed block of the sender.
+        source_id (int): id of the node that gave up its role (the message is relayed by the target).
+    """
+    def __init__(self, target_id, committed_block, source_id):
+        self.target_id = target_id
+        self.committed_block = committed_block
+        self.source_id = source_id
+
+    def serialize(self):
+        """
+        Returns (bytes): bytes representing the object.
+        """
+        obj_list = [self.source_id, self.committed_block, self.target_id]
+        return b'LTR' + cbor.dumps(obj_list)
+
+    @staticmethod
+    def unserialize(msg):
+        """
+        Args:
+            msg (bytes): LeadershipTransferMessage represented in bytes.
+
+        Returns:
+             LeadershipTransferMessage: original LeadershipTransferMessage instance.
+        """
+        obj_list = cbor.loads(msg[3:])
+        obj = LeadershipTransferMessage.__new__(LeadershipTransferMessage)
+        setattr(obj, 'target_id', obj_list.pop())
+        setattr(obj, 'committed_block', obj_list.pop())
+        setattr(obj, 'source_id', obj_list.pop())
+        return obj
+
+
+class HeartbeatMessage:
+    """Is broadcast periodically by the quick node s.t the other nodes can detect its failure quickly (see
+    `HEARTBEAT_INTERVAL`).
+
+    Args:
+        height (int): committed height of the quick node.
+    """
+    def __init__(self, height):
+        self.height = height
+
+    def serialize(self):
+        """
+        Returns (bytes): bytes representing the object.
+        """
+        obj_list = [self.height]
+        return b'HBT' + cbor.dumps(obj_list)
+
+    @staticmethod
+    def unserialize(msg):
+        """
+        Args:
+            msg (bytes): HeartbeatMessage represented in bytes.
+
+        Returns:
+             HeartbeatMessage: original HeartbeatMessage instance.
+        """
+        obj_list = cbor.loads(msg[3:])
+        obj = HeartbeatMessage.__new__(HeartbeatMessage)
+        setattr(obj, 'height', obj_list.pop())
+        return obj
+
+
+class GroupMessage:
+    """Wraps a message of a single consensus group if multiple groups share the connections between the nodes (see
+    multigroup.py).
+
+    Args:
+        group_id (int): id of the group the wrapped message belongs to.
+        data (bytes): serialized message (including its 3 char type prefix).
+    """
+    def __init__(self, group_id, data):
+        self.group_id = group_id
+        self.data = data
+
+    def serialize(self):
+        """
+        Returns (bytes): bytes representing the object.
+        """
+        obj_list = [self.data, self.group_id]
+        return b'GRP' + cbor.dumps(obj_list)
+
+    @staticmethod
+    def unserialize(msg):
+        """
+        Args:
+            msg (bytes): GroupMessage represented in bytes.
+
+        Returns:
+             GroupMessage: original GroupMessage instance.
+        """
+        obj_list = cbor.loads(msg[3:])
+        obj = GroupMessage.__new__(GroupMessage)
+        setattr(obj, 'group_id', obj_list.pop())
+        setattr(obj, 'data', obj_list.pop())
+        return obj
+
+
+class SyncRequestMessage:
+    """Is sent by a node that fell far behind to synchronize its chain with a peer. Blocks are addressed by their
+    committed height (index into `committed_blocks`). A request is one of:
+
+        - a probe (`credit` = 0): the peer answers with its committed height only.
+        - a stripe request (`start` is set): the peer streams the committed blocks with height in [`start`, `stop`).
+          If `stop` is None the peer streams all committed blocks from `start` on followed by the blocks up to its
+          head block.
+        - a credit grant (`start` is None): further chunks of the running stripe may be sent.
+
+    The peer streams the blocks back in chunks. Each chunk consumes one credit (flow control).
+
+    Args:
+        credit (int): number of chunks the requesting node is willing to receive.
+        start (int): committed height of the first requested block.
+        stop (int): committed height following the last requested block (None to stream up to the head block).
+    """
+    def __init__(self, credit, start=None, stop=None):
+        self.credit = credit
+        self.start = start
+        self.stop = stop
+
+    def serialize(self):
+        """
+        Returns (bytes): bytes representing the object.
+        """
+        obj_list = [self.stop, self.start, self.credit]
+        return b'SRQ' + cbor.dumps(obj_list)
+
+    @staticmethod
+    def unserialize(msg):
+        """
+        Args:
+            msg (bytes): SyncRequestMessage represented in bytes.
+
+        Returns:
+             SyncRequestMessage: original SyncRequestMessage instance.
+        """
+        obj_list = cbor.loads(msg[3:])
+        obj = SyncRequestMessage.__new__(SyncRequestMessage)
+        setattr(obj, 'credit', obj_list.pop())
+        setattr(obj, 'start', obj_list.pop())
+        setattr(obj, 'stop', obj_list.pop())
+        return obj
+
+
+class SyncResponseMessage:
+    """Is sent as a response to a `SyncRequestMessage`. Contains one chunk of the requested stripe (or no blocks at all
+    if it answers a probe).
+
+    Args:
+        blocks (list): list of consecutive blocks (parents before children).
+        committed_block (int): block id of the last committed block of the sender (only set in the last chunk).
+        done (bool): True if this is the last chunk of the stripe.
+        height (int): committed height of the sender.
+    """
+    def __init__(self, blocks, committed_block, done, height):
+        self.blocks = blocks
+        self.committed_block = committed_block
+        self.done = done
+        self.height = height
+
+    def serialize(self):
+        """
+        Returns (bytes): bytes representing the object.
+        """
+        blocks = []
+        for b in self.blocks:
+            blocks.append(b.serialize())
+        obj_list = [self.height, self.done, self.committed_block, blocks]
+        return b'SRS' + cbor.dumps(obj_list)
+
+    @staticmethod
+    def unserialize(msg):
+        """
+        Args:
+            msg (bytes): SyncResponseMessage represented in bytes.
+
+        Returns:
+             SyncResponseMessage: original SyncResponseMessage instance.
+        """
+        obj_list = cbor.loads(msg[3:])
+        obj = SyncResponseMessage.__new__(SyncResponseMessage)
+        blocks = []
+        for b in obj_list.pop():
+            blocks.append(Block.unserialize(b))
+        setattr(obj, 'blocks', blocks)
+        setattr(obj, 'committed_block', obj_list.pop())
+        setattr(obj, 'done', obj_list.pop())
+        setattr(obj, 'height', obj_list.pop())
+        return obj
+
+
+class SnapshotRequestMessage:
+    """Is sent by a node that fell too far behind to synchronize its chain block by block (the blocks have been deleted
+    by a genesis block change). It asks a peer for a snapshot of the app state (`start` = True) or grants more credit
+    for the snapshot that is currently transferred. Each chunk consumes one credit (flow control).
+
+    Args:
+        credit (int): number of chunks the requesting node is willing to receive.
+        start (bool): True to start the transfer of a new snapshot.
+    """
+    def __init__(self, credit, start=False):
+        self.credit = credit
+        self.start = start
+
+    def serialize(self):
+        """
+        Returns (bytes): bytes representing the object.
+        """
+        obj_list = [self.start, self.credit]
+        return b'SNQ' + cbor.dumps(obj_list)
+
+    @staticmethod
+    def unserialize(msg):
+        """
+        Args:
+            msg (bytes): SnapshotRequestMessage represented in bytes.
+
+        Returns:
+             SnapshotRequestMessage: original SnapshotRequestMessage instance.
+        """
+        obj_list = cbor.loads(msg[3:])
+        obj = SnapshotRequestMessage.__new__(SnapshotRequestMessage)
+        setattr(obj, 'credit', obj_list.pop())
+        setattr(obj, 'start', obj_list.pop())
+        return obj
+
+
+class SnapshotChunkMessage:
+    """Is sent as a response to a `SnapshotRequestMessage`. Contains one chunk of the snapshot. The last chunk also
+    contains the committed block the snapshot is tagged with.
+
+    Args:
+        data (bytes): chunk of the snapshot.
+        done (bool): True if this is the last chunk.
+        block (Block): last committed block whose txs are contained in the snapshot (only set in the last chunk, None
+            if the sender can not serve a snapshot).
+        height (int): committed height of `block` (only set in the last chunk).
+    """
+    def __init__(self, data, done, block, height):
+        self.data = data
+        self.done = done
+        self.block = block
+        self.height = height
+
+    def serialize(self):
+        """
+        Returns (bytes): bytes representing the object.
+        """
+        block = self.block.serialize() if self.block is not None else None
+        obj_list = [self.height, block, self.done, self.data]
+        return b'SNC' + cbor.dumps(obj_list)
+
+    @staticmethod
+    def unserialize(msg):
+        """
+        Args:
+            msg (bytes): SnapshotChunkMessage represented in bytes.
+
+        Returns:
+             SnapshotChunkMessage: original SnapshotChunkMessage instance.
+        """
+        obj_list = cbor.loads(msg[3:])
+        obj = SnapshotChunkMessage.__new__(SnapshotChunkMessage)
+        setattr(obj, 'data', obj_list.pop())
+        setattr(obj, 'done', obj_list.pop())
+        block = obj_list.pop()
+        setattr(obj, 'block', Block.unserialize(block) if block is not None else None)
+        setattr(obj, 'height', obj_list.pop())
         return obj
 
 
@@ -169,6 +455,7 @@ class Block:
         SEQ (int): sequence number used to create unique block id.
         creator_state (int): 0,1 or 2 translates to QUICK, MEDIUM or SLOW.
         depth (int): Total number of transactions the block and all ist ancestor blocks contain.
+        size (int): number of bytes of the serialized block (None until it has been serialized once).
     """
     def __init__(self, creator_id, parent_block_id, txs, counter):
         self.creator_id = creator_id
@@ -178,6 +465,7 @@ class Block:
         self.parent_block_id = parent_block_id
         self.depth = None
         self.txs = txs
+        self.size = None
 
     def __lt__(self, other):
         """Compare two blocks by depth` and `creator_id`."""
@@ -204,8 +492,17 @@ class Block:
             txs.append(txn.serialize())
         obj_list = [txs, self.depth, self.parent_block_id, self.creator_state, self.block_id, self.SEQ, self.creator_id]
         obj_bytes = cbor.dumps(obj_list)
+        self.size = len(obj_bytes) + 3
         return b'BLK' + obj_bytes
 
+    def get_size(self):
+        """
+        Returns (int): number of bytes of the serialized block (the block is only serialized if its size is unknown).
+        """
+        if self.size is None:
+            self.serialize()
+        return self.size
+
     @staticmethod
     def unserialize(msg):
         """
@@ -218,6 +515,7 @@ class Block:
         obj_list = cbor.loads(msg[3:])
 
         obj = Block.__new__(Block)
+        setattr(obj, 'size', len(msg))
         setattr(obj, 'creator_id', obj_list.pop())
         setattr(obj, 'SEQ', obj_list.pop())
         setattr(obj, 'block_id', obj_list.pop())
@@ -239,16 +537,21 @@ class Transaction:
         creator_id (int): id of the node that created the transaction.
         content (str): the command to be stored/executed/committed.
         counter (int): used to define unqiue sequence number.
+        membership (bool): True if `content` is the peers dict of a new configuration (see `Node.change_membership`)
+            instead of a command of the app.
 
     Attributes:
         SEQ (int): used to define unique transaction id.
         txn_id (int): used to uniquely identify a transaction.
+        size (int): number of bytes of the serialized transaction (None until it has been serialized once).
     """
-    def __init__(self, creator_id, content, counter):
+    def __init__(self, creator_id, content, counter, membership=False):
         self.creator_id = creator_id
         self.SEQ = counter
         self.txn_id = self.creator_id | (self.SEQ << 16)
         self.content = content  # a string which can represent a command for example
+        self.membership = membership
+        self.size = None
 
     def __eq__(self, other):
         return self.txn_id == other.txn_id
@@ -260,10 +563,20 @@ class Transaction:
         """
         Returns (bytes): bytes representing the object.
         """
-        obj_list = [self.content, self.txn_id, self.SEQ, self.creator_id]
+        obj_list = [self.membership, self.content, self.txn_id, self.SEQ, self.creator_id]
         obj_bytes = cbor.dumps(obj_list)
+        self.size = len(obj_bytes) + 3
         return b'TXN' + obj_bytes
 
+    def get_size(self):
+        """
+        Returns (int): number of bytes of the serialized transaction (the transaction is only serialized if its size is
+            unknown).
+        """
+        if self.size is None:
+            self.serialize()
+        return self.size
+
     @staticmethod
     def unserialize(msg):
         """
@@ -275,10 +588,13 @@ class Transaction:
         """
         obj_list = cbor.loads(msg[3:])
         obj = Transaction.__new__(Transaction)
+        setattr(obj, 'size', len(msg))
         setattr(obj, 'creator_id', obj_list.pop())
         setattr(obj, 'SEQ', obj_list.pop())
         setattr(obj, 'txn_id', obj_list.pop())
         setattr(obj, 'content', obj_list.pop())
+        # transactions serialized before the membership flag existed are commands
+        setattr(obj, 'membership', obj_list.pop() if len(obj_list) != 0 else False)
         return obj
 
 
@@ -313,19 +629,22 @@ class PingMessage:
 
 
 class PongMessage:
-    """Is sent to estimate RTT.
+    """Is sent to estimate RTT. Also tells the receiver the committed height of the sender.
 
     Args:
         time (float): timestamp that was received in the PingMessage.
+        height (int or list): committed height of the sender (a list with one committed height per group if the sender
+            runs multiple consensus groups, None if unknown).
     """
-    def __init__(self, time):
+    def __init__(self, time, height=None):
         self.time = time
+        self.height = height
 
     def serialize(self):
         """
         Returns (bytes): bytes representing the object.
         """
-        return b'PON' + cbor.dumps(self.time)
+        return b'PON' + cbor.dumps([self.height, self.time])
 
     @staticmethod
     def unserialize(msg):
@@ -336,7 +655,8 @@ class PongMessage:
         Returns:
              PongMessage: original PongMessage instance.
         """
-        time = cbor.loads(msg[3:])
+        obj_list = cbor.loads(msg[3:])
         obj = PongMessage.__new__(PongMessage)
-        setattr(obj, 'time', time)
+        setattr(obj, 'time', obj_list.pop())
+        setattr(obj, 'height', obj_list.pop())
         return obj
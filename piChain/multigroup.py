@@ -0,0 +1,199 @@
+"""This module implements the multi-group mode: a node runs many independent piChain logs (consensus groups) in the same
+process. The groups share the connections to the peers and the reactor. Every message of a group is wrapped into a
+GroupMessage tagged with the group id. Each group has its own blocktree, quick node and `tx_committed` callback, so the
+load of the quick nodes is spread among the nodes.
+"""
+
+import logging
+import time
+
+from piChain.PaxosLogic import Node
+from piChain.config import HEARTBEAT_INTERVAL
+from piChain.PaxosNetwork import ConnectionManager
+from piChain.messages import GroupMessage, PongMessage
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+class GroupTransport:
+    """Proxy of the transport of a Connection used by a single group. The transport is shared by all groups, so it is
+    paused while at least one group paused it (see `Node.update_admission`) and a group that admits txs again does not
+    resume it while another group is still busy.
+
+    Args:
+        connection (Connection): the connection shared by all groups.
+        group_id (int): id of the group using this proxy.
+    """
+    def __init__(self, connection, group_id):
+        self.connection = connection
+        self.group_id = group_id
+
+    def __getattr__(self, name):
+        return getattr(self.connection.transport, name)
+
+    def pauseProducing(self):
+        if len(self.connection.paused_groups) == 0:
+            self.connection.transport.pauseProducing()
+        self.connection.paused_groups.add(self.group_id)
+
+    def resumeProducing(self):
+        if self.group_id not in self.connection.paused_groups:
+            return
+        self.connection.paused_groups.discard(self.group_id)
+        if len(self.connection.paused_groups) == 0:
+            self.connection.transport.resumeProducing()
+
+
+class GroupConnection:
+    """Proxy of a Connection used by a single group. Frames sent over it are wrapped into a GroupMessage.
+
+    Args:
+        connection (Connection): the connection shared by all groups.
+        group_id (int): id of the group using this proxy.
+    """
+    def __init__(self, connection, group_id):
+        self.connection = connection
+        self.group_id = group_id
+        self.peer_node_id = connection.peer_node_id
+
+    @property
+    def transport(self):
+        return GroupTransport(self.connection, self.group_id)
+
+    @property
+    def lc_ping(self):
+        return self.connection.lc_ping
+
+    def sendString(self, string):
+        """Send `string` (a serialized message of the group) to the peer.
+
+        Args:
+            string (bytes): the serialized message.
+        """
+        self.connection.sendString(GroupMessage(self.group_id, string).serialize())
+
+
+class GroupNode(Node):
+    """A piChain node of a single group. It does not own any connections: these are managed by the MultiGroupNode which
+    routes the messages of the group to it.
+
+    Args:
+        node_index (int): the index of this node into the peers dictionary.
+        peers_dict (dict): a dict containing the (ip, port) pairs for all nodes.
+        group_id (int): id of the group. Node `group_id` % n is the quick node of the group in the beginning.
+        manager (MultiGroupNode): owner of the connections.
+    """
+    def __init__(self, node_index, peers_dict, group_id, manager):
+        super().__init__(node_index, peers_dict, group_id)
+        self.manager = manager
+        self.reactor = manager.reactor
+
+    def start(self):
+        """Remember the start time, start the heartbeats and apply the committed blocks the state machine did not
+        persist (the connections are opened by the MultiGroupNode)."""
+        self.started_at = time.time()
+        self.lc_heartbeat.clock = self.reactor
+        self.lc_heartbeat.start(HEARTBEAT_INTERVAL, now=False)
+        self.replay_unapplied()
+
+    def stop(self):
+        """Stop the heartbeats and timers (the connections are closed by the MultiGroupNode)."""
+        if self.lc_heartbeat.running:
+            self.lc_heartbeat.stop()
+        self.patience_timer.cancel()
+        self.commit_timer.cancel()
+        self.retry_commit_timer.cancel()
+
+
+class MultiGroupNode(ConnectionManager):
+    """Keeps the connections to the peers and routes the messages of each group to its GroupNode.
+
+    Args:
+        node_index (int): the index of this node into the peers dictionary.
+        peers_dict (dict): a dict containing the (ip, port) pairs for all nodes.
+        group_count (int): number of consensus groups.
+
+    Attributes:
+        groups (list): GroupNode instances, indexed by group id.
+    """
+    def __init__(self, node_index, peers_dict, group_count):
+        super().__init__(node_index, peers_dict)
+        self.groups = [GroupNode(node_index, peers_dict, group_id, self) for group_id in range(group_count)]
+
+    def make_txn(self, command, group_id):
+        """Make a transaction in the group with `group_id` (see `Node.make_txn`).
+
+        Args:
+            command (str): command of the transaction.
+            group_id (int): id of the group.
+
+        Returns:
+            Deferred: fires with the txn id once the transaction has been committed in the group.
+        """
+        return self.groups[group_id].make_txn(command)
+
+    def receive_group_message(self, message, sender):
+        """Pass the wrapped message to the group it belongs to.
+
+        Args:
+            message (GroupMessage): Received GroupMessage.
+            sender (Connection): Connection instance of the sender.
+        """
+        if message.group_id < 0 or message.group_id >= len(self.groups):
+            logger.warning('message of unknown group %s dropped', str(message.group_id))
+            return
+        group = self.groups[message.group_id]
+
+        # reuse the proxy of the group unless the message arrived over another connection than the registered one
+        connection = group.peers_connection.get(sender.peer_node_id)
+        if connection is None or connection.connection is not sender:
+            connection = GroupConnection(sender, message.group_id)
+
+        group.parse_msg(message.data[:3].decode(), message.data, connection)
+
+    def committed_height(self):
+        """
+        Returns:
+            list: committed height of each group (sent to the peers in pong messages).
+        """
+        return [group.blocktree.committed_height() for group in self.groups]
+
+    def receive_pong_message(self, message, peer_node_id):
+        """The RTT samples are used by all groups. Each group gets the committed height of the peer in this group."""
+        heights = message.height if isinstance(message.height, list) else []
+        for group in self.groups:
+            height = heights[group.group_id] if group.group_id < len(heights) else None
+            group.receive_pong_message(PongMessage(message.time, height), peer_node_id)
+
+    def peer_connected(self, peer_node_id):
+        """Give each group a proxy of the new connection. A learner that connects while a group is busy is paused
+        right away (see `Node.update_admission`)."""
+        connection = self.peers_connection.get(peer_node_id)
+        for group in self.groups:
+            proxy = GroupConnection(connection, group.group_id)
+            group.peers_connection.update({peer_node_id: proxy})
+            if group.busy and peer_node_id in group.learners:
+                proxy.transport.pauseProducing()
+        super().peer_connected(peer_node_id)
+
+    def peer_disconnected(self, peer_node_id):
+        for group in self.groups:
+            if group.peers_connection.pop(peer_node_id, None) is not None:
+                group.peer_disconnected(peer_node_id)
+
+    def start(self):
+        """Start the groups, listen on the port given in the peers dict and connect to the peers (see
+        `ConnectionManager.start`).
+        """
+        for group in self.groups:
+            group.reactor = self.reactor
+            group.start()
+        super().start()
+
+    def stop(self):
+        """Stop the groups and close all connections (see `ConnectionManager.stop`)."""
+        for group in self.groups:
+            group.stop()
+        super().stop()
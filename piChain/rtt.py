@@ -0,0 +1,78 @@
+"""This module implements the estimation of round trip times (RTT) between nodes. The estimates are used to compute the
+timeouts of a node."""
+
+import bisect
+import math
+from collections import deque
+
+from piChain.config import RTT_WINDOW, RTT_PERCENTILE, PING_INTERVAL_MIN, PING_INTERVAL_MAX
+
+
+class RttEstimator:
+    """Estimates the RTT to a single peer. Keeps a smoothed mean and mean deviation of the samples (like the TCP
+    retransmission timer, see RFC 6298) and a window of recent samples to compute high percentiles.
+
+    Attributes:
+        srtt (float): smoothed RTT (None before the first sample).
+        rttvar (float): smoothed mean deviation of the RTT (None before the first sample).
+        samples (deque): the `RTT_WINDOW` most recent samples.
+        ordered (list): `samples` in ascending order (kept sorted s.t a percentile does not need to sort the window).
+    """
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.samples = deque(maxlen=RTT_WINDOW)
+        self.ordered = []
+
+    def add_sample(self, rtt):
+        """Update the estimate with a new sample.
+
+        Args:
+            rtt (float): measured round trip time in seconds.
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+        if len(self.samples) == self.samples.maxlen:
+            # the oldest sample drops out of the window
+            del self.ordered[bisect.bisect_left(self.ordered, self.samples[0])]
+        self.samples.append(rtt)
+        bisect.insort(self.ordered, rtt)
+
+    def percentile(self, p):
+        """
+        Args:
+            p (float): percentile in [0, 100].
+
+        Returns:
+            float: the `p`-th percentile of the recent samples (nearest-rank method).
+        """
+        rank = max(1, math.ceil(p / 100 * len(self.ordered)))
+        return self.ordered[rank - 1]
+
+    def estimate(self):
+        """
+        Returns:
+            float: conservative estimate of the RTT. The max of the smoothed RTT plus four times its deviation and
+                the `RTT_PERCENTILE`-th percentile of the recent samples.
+        """
+        return max(self.srtt + 4 * self.rttvar, self.percentile(RTT_PERCENTILE))
+
+    def ping_interval(self):
+        """The more the samples vary, the more often the RTT is sampled.
+
+        Returns:
+            float: time to wait before sending the next ping message to the peer.
+        """
+        if len(self.samples) < 4 or self.srtt == 0:
+            return PING_INTERVAL_MIN
+
+        # coefficient of variation
+        cv = self.rttvar / self.srtt
+        return max(PING_INTERVAL_MIN, PING_INTERVAL_MAX * (1 - 4 * cv))
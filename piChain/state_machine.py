@@ -0,0 +1,153 @@
+"""This module defines the StateMachine interface. An app implementing it lets the node apply the committed txs of a
+block on multiple worker threads in parallel (see `ApplyPipeline`) and transfer snapshots of its state to nodes that
+fell too far behind to catch up block by block. `PlyvelStateMachine` persists the applied height together with the
+writes of the commands s.t a restarted node only applies the committed commands that are missing."""
+
+import threading
+
+
+class StateMachine:
+    """Interface of an app whose commands can be applied in parallel. Commands with different partition keys must be
+    independent of each other: they may be applied in any order and concurrently. Commands with the same key are applied
+    in commit order.
+    """
+    def partition_key(self, command):
+        """Is called on the reactor thread for each committed command.
+
+        Args:
+            command (str): command of a committed transaction.
+
+        Returns:
+            the partition key of `command` (e.g the database key it modifies) or None if it may depend on any other
+                command (it is then applied alone, after all previous and before all following commands).
+        """
+        raise NotImplementedError("To be implemented in subclass")
+
+    def apply(self, commands):
+        """Is called on a worker thread with committed commands (possibly concurrently with other calls).
+
+        Args:
+            commands (list): commands of the committed txs in commit order (all keys of a partition are included in the
+                same call).
+        """
+        raise NotImplementedError("To be implemented in subclass")
+
+    def snapshot(self):
+        """Is called on the reactor thread while no commands are applied. The snapshot contains exactly the commands
+        applied so far (the node tags it with the last applied block). Should return quickly, e.g by reading from a
+        snapshot of a database.
+
+        Returns:
+            a binary file-like object the snapshot is read from (`read(size)` returns less than `size` bytes only at
+                the end of the snapshot).
+        """
+        raise NotImplementedError("To be implemented in subclass")
+
+    def restore(self, stream):
+        """Is called on a worker thread while no commands are applied. Replace the state by a snapshot of a peer.
+
+        Args:
+            stream: a binary file-like object containing a snapshot returned by `snapshot` on a peer.
+        """
+        raise NotImplementedError("To be implemented in subclass")
+
+    def flush(self, height):
+        """Is called on a worker thread once all committed commands up to committed height `height` have been applied
+        (and after a snapshot has been restored). An app that persists its state can persist `height` together with the
+        applied commands here (see `applied_height`).
+
+        Args:
+            height (int): committed height of the last applied block.
+        """
+        pass
+
+    def applied_height(self):
+        """Is called on the reactor thread once the node starts.
+
+        Returns:
+            int: committed height up to which the commands have been persisted by the app (see `flush`). The node
+                passes the committed blocks above it to `apply` again. None if the app does not track it (the blocks
+                committed before a restart are then not applied again).
+        """
+        return None
+
+
+class StagedWrites:
+    """Writes of the commands passed to a single `PlyvelStateMachine.apply` call. Has the put and delete methods of a
+    plyvel write batch.
+
+    Attributes:
+        ops (list): (key, value) pairs in the order they have been written (value is None for a delete).
+    """
+    def __init__(self):
+        self.ops = []
+
+    def put(self, key, value):
+        self.ops.append((key, value))
+
+    def delete(self, key):
+        self.ops.append((key, None))
+
+
+class PlyvelStateMachine(StateMachine):
+    """StateMachine of an app that keeps its state in a plyvel db. The writes of the applied commands are staged and
+    written together with the applied height in a single write batch once all shards of a batch of committed blocks
+    have been applied (see `flush`). The state on disk thus always corresponds to a committed height and a restarted
+    node applies exactly the committed commands that have not been written yet.
+
+    Note: the commands read the db as of the last flush (writes staged by previous commands of the same batch are not
+    visible yet).
+
+    Args:
+        db (plyvel.DB): db of the app (may be shared by multiple state machines with different `applied_key`).
+        applied_key (bytes): key the applied height is stored under.
+
+    Attributes:
+        staged (list): StagedWrites of the `apply` calls since the last flush.
+    """
+    def __init__(self, db, applied_key=b'\x00applied_height'):
+        self.db = db
+        self.applied_key = applied_key
+        self.staged = []
+        self.lock = threading.Lock()
+
+    def execute(self, batch, command):
+        """Is called on a worker thread for each committed command.
+
+        Args:
+            batch (StagedWrites): the writes of `command` are staged in it (put and delete like a plyvel write batch).
+            command (str): command of a committed transaction.
+        """
+        raise NotImplementedError("To be implemented in subclass")
+
+    def apply(self, commands):
+        batch = StagedWrites()
+        for command in commands:
+            self.execute(batch, command)
+        with self.lock:
+            self.staged.append(batch)
+
+    def flush(self, height):
+        """Write the staged writes and `height` to the db atomically."""
+        with self.lock:
+            staged = self.staged
+            self.staged = []
+        with self.db.write_batch() as wb:
+            for batch in staged:
+                for key, value in batch.ops:
+                    if value is None:
+                        wb.delete(key)
+                    else:
+                        wb.put(key, value)
+            wb.put(self.applied_key, str(height).encode())
+
+    def applied_height(self):
+        """
+        Returns:
+            int: committed height stored by the last flush (0 if the app state is empty s.t all committed blocks are
+                applied).
+        """
+        value = self.db.get(self.applied_key)
+        if value is None:
+            return 0
+        return int(value.decode())
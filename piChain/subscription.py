@@ -0,0 +1,133 @@
+"""This module implements an endpoint that streams the committed log of a node to change-data-capture consumers (e.g
+search indexers, caches or analytics). A consumer subscribes from a committed height and receives the committed txs in
+commit order, batched into frames of whole blocks. It resumes after a reconnect by subscribing from the height
+following the last block it received. The log is read from the blocktree on the reactor thread; the consensus does not
+wait for the consumers.
+
+Example:
+    reactor.listenTCP(9000, CommittedLogFactory(node))
+"""
+
+import logging
+import struct
+
+import cbor
+from zope.interface import implementer
+from twisted.internet import defer
+from twisted.internet.protocol import Factory, connectionDone
+from twisted.internet.interfaces import IPushProducer
+from twisted.protocols.basic import IntNStringReceiver
+
+from piChain.config import SUBSCRIPTION_BATCH_SIZE, MAX_MESSAGE_SIZE
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG)
+
+
+@implementer(IPushProducer)
+class CommittedLogProtocol(IntNStringReceiver):
+    """Streams the committed log to a single subscriber. Frames are prefixed with their length (like the frames between
+    the nodes). The subscriber sends a single frame: the cbor encoded committed height it subscribes from. Each frame
+    sent afterwards is a cbor encoded list of [committed height, block id, txn id, content] entries of one or more whole
+    blocks (at most `SUBSCRIPTION_BATCH_SIZE` bytes of contents unless a single block is larger). If the requested
+    blocks have been deleted, a cbor encoded error string is sent and the connection is closed.
+
+    The protocol is registered as a streaming producer: no frames are sent while the transport is paused, so a slow
+    subscriber does not make the node buffer the log. The blocks it did not send yet are not deleted at a genesis block
+    change (see `LOG_RETENTION_BLOCKS` for subscribers that reconnect).
+
+    Args:
+        factory (CommittedLogFactory): factory holding the node.
+
+    Attributes:
+        next_height (int): committed height of the next block sent to the subscriber (None before it subscribed).
+        paused (bool): True while the transport can not take more data.
+        waiter (Deferred): fires once the next block has been committed (None if not waiting).
+    """
+    # little endian, unsigned int
+    structFormat = '<I'
+    prefixLength = struct.calcsize(structFormat)
+
+    def __init__(self, factory):
+        self.node = factory.node
+        self.next_height = None
+        self.paused = False
+        self.waiter = None
+        self.MAX_LENGTH = MAX_MESSAGE_SIZE
+
+    def connectionMade(self):
+        self.transport.registerProducer(self, True)
+
+    def connectionLost(self, reason=connectionDone):
+        self.paused = True
+        self.node.log_subscribers.discard(self)
+        if self.waiter is not None:
+            self.waiter.cancel()
+            self.waiter = None
+
+    def stringReceived(self, string):
+        """Subscribe from the received committed height (only a single subscription per connection)."""
+        if self.next_height is not None:
+            return
+        start = cbor.loads(string)
+        if not isinstance(start, int):
+            self.transport.loseConnection()
+            return
+        self.next_height = max(start, 1)
+        self.node.log_subscribers.add(self)
+        self.send_batches()
+
+    def send_batches(self):
+        """Send the committed blocks from `next_height` on until the transport is paused or the subscriber caught up.
+        Then wait for the next committed block."""
+        while not self.paused and self.waiter is None:
+            if self.next_height > self.node.blocktree.committed_height():
+                self.waiter = self.node.wait_for_height(self.next_height)
+                self.waiter.addCallbacks(self.block_committed, lambda failure: failure.trap(defer.CancelledError))
+                return
+
+            entries = []
+            size = 0
+            try:
+                while size < SUBSCRIPTION_BATCH_SIZE and self.next_height <= self.node.blocktree.committed_height():
+                    block = self.node.committed_block(self.next_height)
+                    for txn in block.txs:
+                        entries.append([self.next_height, block.block_id, txn.txn_id, txn.content])
+                        size += len(txn.content)
+                    self.next_height += 1
+            except ValueError as e:
+                logger.warning('subscription from committed height %s failed: %s', str(self.next_height), str(e))
+                self.sendString(cbor.dumps(str(e)))
+                self.paused = True
+                self.node.log_subscribers.discard(self)
+                self.transport.loseConnection()
+                return
+            if len(entries) != 0:
+                self.sendString(cbor.dumps(entries))
+
+    def block_committed(self, _):
+        self.waiter = None
+        self.send_batches()
+
+    def pauseProducing(self):
+        self.paused = True
+
+    def resumeProducing(self):
+        self.paused = False
+        self.send_batches()
+
+    def stopProducing(self):
+        self.paused = True
+
+
+class CommittedLogFactory(Factory):
+    """Twisted Factory of the subscriptions to the committed log of a node.
+
+    Args:
+        node (Node): node whose committed log is streamed.
+    """
+    def __init__(self, node):
+        self.node = node
+
+    def buildProtocol(self, addr):
+        return CommittedLogProtocol(self)
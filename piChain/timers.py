@@ -0,0 +1,51 @@
+"""This module implements the Timer class which is used by a node to track its deadlines (the patience of the oldest
+pending transaction, the timeout of the running commit and the retry of a commit). Unlike a `deferLater` call per
+deadline, a timer is re-armed and cancelled s.t the reactor holds at most one DelayedCall per timer."""
+
+
+class Timer:
+    """A deadline with at most one scheduled call. Arming an armed timer moves the deadline of the scheduled call (see
+    `DelayedCall.reset`) instead of scheduling another one.
+
+    Attributes:
+        call (DelayedCall): the scheduled call (None if the timer is not armed).
+        function (Callable): called once the deadline is reached.
+        args (tuple): arguments `function` is called with.
+    """
+    def __init__(self):
+        self.call = None
+        self.function = None
+        self.args = ()
+
+    def active(self):
+        """
+        Returns:
+            bool: True if the timer is armed.
+        """
+        return self.call is not None and self.call.active()
+
+    def arm(self, clock, delay, function, *args):
+        """Call `function` with `args` once `delay` seconds have passed. A previously armed deadline is replaced.
+
+        Args:
+            clock (IReactorTime): reactor used to schedule the call.
+            delay (float): seconds from now.
+            function (Callable): called once the deadline is reached.
+            *args: arguments `function` is called with.
+        """
+        self.function = function
+        self.args = args
+        if self.active():
+            self.call.reset(max(0, delay))
+        else:
+            self.call = clock.callLater(max(0, delay), self.fire)
+
+    def cancel(self):
+        """Disarm the timer (nothing happens if it is not armed)."""
+        if self.active():
+            self.call.cancel()
+        self.call = None
+
+    def fire(self):
+        self.call = None
+        self.function(*self.args)
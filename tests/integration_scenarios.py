@@ -21,6 +21,8 @@ class IntegrationScenarios:
 
     crash behavior:
         - Scenarios 20-21 test node crashes.
+        - Scenario 22 tests a restart of the quick node after it handed its role over.
+        - Scenario 23 tests the failover after a crash of the quick node under load.
 
     partition bahavior:
         - Scenarios 30-32 test network partition.
@@ -372,6 +374,44 @@ class IntegrationScenarios:
             txn2 = Transaction(1, 'command2', 2)
             deferLater(reactor, 6, node.broadcast, txn2, 'TXN')
 
+    @staticmethod
+    def scenario22(node):
+        """Test a planned restart of the quick node. It hands its role over to node 1 after a commit, then it is
+        restarted and another transaction is committed.
+
+        Args:
+            node (Node): Node calling this method
+
+        """
+        logging.debug('start test scenario 22')
+        if node.id == 0 and node.blocktree.committed_height() == 0:
+            # create a Transaction and broadcast it
+            txn = Transaction(0, 'command1', 1)
+            deferLater(reactor, 0.1, node.broadcast, txn, 'TXN')
+
+            # hand the role of the quick node over to node 1 before the restart
+            deferLater(reactor, 0.5, node.transfer_leadership, 1)
+
+        elif node.id == 2:
+            # create another Transaction while node 0 restarts
+            txn2 = Transaction(2, 'command2', 2)
+            deferLater(reactor, 3, node.broadcast, txn2, 'TXN')
+
+    @staticmethod
+    def scenario23(node):
+        """Test the failover after a crash of the quick node. Node 1 keeps making transactions, the quick node is
+        crashed meanwhile and one of the other nodes takes over (it writes the failover time to stdout).
+
+        Args:
+            node (Node): Node calling this method
+
+        """
+        logging.debug('start test scenario 23')
+        if node.id == 1:
+            for i in range(1, 31):
+                txn = Transaction(1, 'command%i' % i, i)
+                deferLater(reactor, i * 0.2, node.broadcast, txn, 'TXN')
+
     # partition behavior
 
     @staticmethod
@@ -0,0 +1,197 @@
+"""Unit tests of the ApplyPipeline class."""
+
+import shutil
+import tempfile
+import threading
+
+import plyvel
+from unittest.mock import MagicMock
+from twisted.internet import reactor, defer
+from twisted.trial.unittest import TestCase
+
+from piChain.apply import ApplyPipeline
+from piChain.state_machine import PlyvelStateMachine
+
+
+class TestApplyPipeline(TestCase):
+
+    def test_batches(self):
+        node = MagicMock()
+        node.reactor = reactor
+        batches = []
+        threads = set()
+        release = threading.Event()
+
+        def callback(commands):
+            release.wait(5)
+            threads.add(threading.current_thread())
+            batches.append(commands)
+
+        done = defer.Deferred()
+
+        def blocks_applied():
+            if pipeline.applied_height == 3 and not done.called:
+                done.callback(None)
+        node.blocks_applied.side_effect = blocks_applied
+
+        pipeline = ApplyPipeline(node, callback, 0)
+        pipeline.put(1, ['a'])
+        pipeline.put(2, ['b'])
+        pipeline.put(3, ['c', 'd'])
+        assert pipeline.running
+        assert pipeline.applied_height == 0
+        release.set()
+
+        def check(_):
+            # the blocks queued while the first one was applied are applied in a single call off the reactor thread
+            assert batches == [['a'], ['b', 'c', 'd']]
+            assert threading.current_thread() not in threads
+            assert not pipeline.running
+        return done.addCallback(check)
+
+    def test_partitioned(self):
+        node = MagicMock()
+        node.reactor = reactor
+        calls = []
+        lock = threading.Lock()
+
+        def callback(commands):
+            with lock:
+                calls.append(commands)
+
+        def partition_key(command):
+            return None if command == 'barrier' else command.split()[1]
+
+        commands = ['put a 1', 'put b 1', 'put a 2', 'put c 1', 'barrier', 'put a 3', 'put b 2']
+        pipeline = ApplyPipeline(node, callback, 0, partition_key)
+        d = pipeline.apply_partitioned(commands)
+
+        def check(_):
+            applied = [c for call in calls for c in call]
+            assert sorted(applied) == sorted(commands)
+            # the commands of a key are applied by a single call in commit order
+            for key in ['a', 'b', 'c']:
+                assert [c for c in applied if partition_key(c) == key] == [c for c in commands if
+                                                                            partition_key(c) == key]
+            # a command without key is applied alone between the previous and the following commands
+            i = calls.index(['barrier'])
+            assert sorted(c for call in calls[:i] for c in call) == sorted(commands[:4])
+        return d.addCallback(check)
+
+    def test_flush(self):
+        node = MagicMock()
+        node.reactor = reactor
+        calls = []
+
+        def partition_key(command):
+            return command.split()[1]
+
+        done = defer.Deferred()
+        node.blocks_applied.side_effect = lambda: done.callback(None)
+
+        pipeline = ApplyPipeline(node, lambda commands: calls.append(commands), 0, partition_key,
+                                 lambda height: calls.append(height))
+        pipeline.put(2, ['put a 1', 'put b 1'])
+
+        def check(_):
+            # the applied height is flushed once all shards have been applied
+            assert calls[-1] == 2
+            assert sorted(c for call in calls[:-1] for c in call) == ['put a 1', 'put b 1']
+            assert pipeline.applied_height == 2
+        return done.addCallback(check)
+
+    def test_apply_failed(self):
+        node = MagicMock()
+        node.reactor = reactor
+        flushed = []
+
+        def callback(commands):
+            if 'bad' in commands:
+                raise ValueError('cannot apply')
+
+        pipeline = ApplyPipeline(node, callback, 0, flush=flushed.append)
+        stopped = self.notify_failure(pipeline)
+        pipeline.put(1, ['bad'])
+        pipeline.put(2, ['a'])
+        waiter = MagicMock()
+        pipeline.when_idle(waiter, 'session')
+
+        def check(_):
+            # the failed block is neither marked as applied nor flushed, the pipeline stops
+            assert pipeline.applied_height == 0
+            assert flushed == []
+            assert pipeline.failure is not None
+            assert not node.blocks_applied.called
+            # a waiter (e.g a snapshot session) is not dropped silently
+            waiter.assert_called_once_with('session')
+            pipeline.put(3, ['b'])
+            assert not pipeline.running
+            assert len(pipeline.queue) == 0
+        return stopped.addCallback(check)
+
+    def test_restore_failed(self):
+        node = MagicMock()
+        node.reactor = reactor
+        stream = MagicMock()
+
+        def restore(s):
+            raise ValueError('corrupt snapshot')
+
+        pipeline = ApplyPipeline(node, MagicMock(), 0)
+        stopped = self.notify_failure(pipeline)
+        pipeline.restore(restore, stream, 5)
+
+        def check(_):
+            assert pipeline.applied_height == 0
+            assert stream.close.called
+        return stopped.addCallback(check)
+
+    def test_execute_failed(self):
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        db = plyvel.DB(path, create_if_missing=True)
+        self.addCleanup(db.close)
+
+        class KeyValueStore(PlyvelStateMachine):
+            def execute(self, batch, command):
+                c_list = command.split()
+                if c_list[0] != 'put':
+                    raise ValueError('unknown operation')
+                batch.put(c_list[1].encode(), c_list[2].encode())
+
+        node = MagicMock()
+        node.reactor = reactor
+        store = KeyValueStore(db)
+        pipeline = ApplyPipeline(node, store.apply, store.applied_height(), lambda command: command.split()[1],
+                                 store.flush)
+        applied = defer.Deferred()
+        node.blocks_applied.side_effect = lambda: applied.callback(None)
+        pipeline.put(1, ['put a 1'])
+
+        def apply_invalid(_):
+            stopped = self.notify_failure(pipeline)
+            pipeline.put(2, ['put b 1', 'get a'])
+            return stopped
+
+        def check(_):
+            # neither the watermark nor the persisted applied height move past the failed block
+            assert pipeline.applied_height == 1
+            assert store.applied_height() == 1
+            assert db.get(b'a') == b'1'
+            assert db.get(b'b') is None
+        return applied.addCallback(apply_invalid).addCallback(check)
+
+    @staticmethod
+    def notify_failure(pipeline):
+        """
+        Returns:
+            Deferred: fires once `pipeline` has been stopped by a failure.
+        """
+        stopped = defer.Deferred()
+        apply_failed = pipeline.apply_failed
+
+        def failed(failure):
+            apply_failed(failure)
+            stopped.callback(None)
+        pipeline.apply_failed = failed
+        return stopped
@@ -121,3 +121,27 @@ class TestBlocktree(TestCase):
         block_set.add(b2)
 
         assert len(block_set) == 2
+
+    def test_committed_range(self):
+        bt = Blocktree(0)
+        bt.db = MagicMock()
+        b1 = Block(1, GENESIS.block_id, [Transaction(0, 'c', 0)], 1)
+        b2 = Block(2, b1.block_id, [Transaction(0, 'c', 1)], 2)
+        b3 = Block(3, b2.block_id, [Transaction(0, 'c', 2)], 3)
+
+        bt.add_blocks([b1, b2, b3])
+        assert b3.depth == 3
+
+        bt.committed_blocks += [b1.block_id, b2.block_id]
+        bt.committed_block = b2
+        bt.head_block = b3
+
+        assert bt.committed_height() == 2
+        assert bt.committed_range(1, 2) == [b1.block_id]
+        assert bt.committed_range(1, None) == [b1.block_id, b2.block_id, b3.block_id]
+        assert bt.committed_range(3, None) == [b3.block_id]
+        assert bt.committed_range(2, 4) is None
+
+        assert bt.height_after_commit(b2) == 2
+        assert bt.height_after_commit(b3) == 3
+        assert bt.height_after_commit(b1) is None
@@ -7,11 +7,14 @@ import logging
 
 from twisted.trial import unittest
 from twisted.test import proto_helpers
-from unittest.mock import MagicMock
+from twisted.internet import task, error
+from unittest.mock import MagicMock, patch
 
 from piChain.PaxosLogic import Node
+from piChain.PaxosNetwork import ConnectionManager, LOOPBACK_MANAGERS
 from piChain.messages import Transaction, RequestBlockMessage, Block, RespondBlockMessage, PaxosMessage, PongMessage, \
-    PingMessage
+    PingMessage, SyncRequestMessage, SyncResponseMessage, ReadIndexMessage, GroupMessage, \
+    LeadershipTransferMessage, HeartbeatMessage, SnapshotRequestMessage, SnapshotChunkMessage
 
 logging.disable(logging.CRITICAL)
 
@@ -59,6 +62,24 @@ class TestConnection(unittest.TestCase):
 
         self.assertEqual(self.transport.value(), b'')
 
+    def test_second_connection(self):
+        """Test a second connection to the same peer: it is not used to send messages, but the messages received over
+        it are attributed to the peer and losing it does not disconnect the peer.
+        """
+        s = json.dumps({'nodeid': '1'})
+        self.proto.stringReceived(b'HEL' + s.encode())
+
+        proto2 = self.node.buildProtocol(('localhost', 0))
+        proto2.makeConnection(proto_helpers.StringTransport())
+        proto2.stringReceived(b'HEL' + s.encode())
+        self.assertEqual(proto2.peer_node_id, '1')
+        self.assertIs(self.node.peers_connection.get('1'), self.proto)
+
+        self.node.peer_disconnected = MagicMock()
+        proto2.connectionLost()
+        self.assertIs(self.node.peers_connection.get('1'), self.proto)
+        self.assertFalse(self.node.peer_disconnected.called)
+
     def test_rqb(self):
         """Test receipt of a RequestBlockMessage.
         """
@@ -86,6 +107,8 @@ class TestConnection(unittest.TestCase):
         obj = self.node.receive_transaction.call_args[0][0]
         self.assertEqual(type(obj), Transaction)
         self.assertEqual(obj, txn)
+        self.assertEqual(obj.size, len(s))
+        self.assertEqual(txn.size, len(s))
 
     def test_blk(self):
         """Test receipt of a Block.
@@ -102,6 +125,8 @@ class TestConnection(unittest.TestCase):
         obj = self.node.receive_block.call_args[0][0]
         self.assertEqual(type(obj), Block)
         self.assertEqual(obj.txs[0], txn1)
+        self.assertEqual(obj.size, len(s))
+        self.assertEqual(obj.txs[0].size, len(txn1.serialize()))
 
     def test_rsp(self):
         """Test receipt of a RespondBlockMessage.
@@ -125,6 +150,142 @@ class TestConnection(unittest.TestCase):
         self.assertEqual(type(obj), RespondBlockMessage)
         self.assertEqual(obj.blocks[0].txs[0], txn1)
 
+    def test_srq(self):
+        """Test receipt of a SyncRequestMessage.
+        """
+        self.node.receive_sync_request_message = MagicMock()
+
+        srq = SyncRequestMessage(4, 10, 20)
+        s = srq.serialize()
+        self.proto.stringReceived(s)
+
+        self.assertTrue(self.node.receive_sync_request_message.called)
+        obj = self.node.receive_sync_request_message.call_args[0][0]
+        self.assertEqual(type(obj), SyncRequestMessage)
+        self.assertEqual(obj.credit, 4)
+        self.assertEqual(obj.start, 10)
+        self.assertEqual(obj.stop, 20)
+
+    def test_srs(self):
+        """Test receipt of a SyncResponseMessage.
+        """
+        self.node.receive_sync_response_message = MagicMock()
+
+        txn1 = Transaction(0, 'command1', 1)
+        block = Block(0, 0, [txn1], 1)
+
+        srs = SyncResponseMessage([block], block.block_id, True, 7)
+        s = srs.serialize()
+        self.proto.stringReceived(s)
+
+        self.assertTrue(self.node.receive_sync_response_message.called)
+        obj = self.node.receive_sync_response_message.call_args[0][0]
+        self.assertEqual(type(obj), SyncResponseMessage)
+        self.assertEqual(obj.blocks[0].txs[0], txn1)
+        self.assertEqual(obj.committed_block, block.block_id)
+        self.assertTrue(obj.done)
+        self.assertEqual(obj.height, 7)
+
+    def test_rix(self):
+        """Test receipt of a ReadIndexMessage.
+        """
+        self.node.receive_read_index_message = MagicMock()
+
+        rix = ReadIndexMessage(5, 3)
+        s = rix.serialize()
+        self.proto.stringReceived(s)
+
+        self.assertTrue(self.node.receive_read_index_message.called)
+        obj = self.node.receive_read_index_message.call_args[0][0]
+        self.assertEqual(type(obj), ReadIndexMessage)
+        self.assertEqual(obj.request_id, 5)
+        self.assertEqual(obj.height, 3)
+
+    def test_ltr(self):
+        """Test receipt of a LeadershipTransferMessage.
+        """
+        self.node.receive_leadership_transfer_message = MagicMock()
+
+        ltr = LeadershipTransferMessage(2, 5, 1)
+        s = ltr.serialize()
+        self.proto.stringReceived(s)
+
+        self.assertTrue(self.node.receive_leadership_transfer_message.called)
+        obj = self.node.receive_leadership_transfer_message.call_args[0][0]
+        self.assertEqual(type(obj), LeadershipTransferMessage)
+        self.assertEqual(obj.target_id, 2)
+        self.assertEqual(obj.committed_block, 5)
+        self.assertEqual(obj.source_id, 1)
+
+    def test_snq(self):
+        """Test receipt of a SnapshotRequestMessage.
+        """
+        self.node.receive_snapshot_request_message = MagicMock()
+
+        snq = SnapshotRequestMessage(4, True)
+        s = snq.serialize()
+        self.proto.stringReceived(s)
+
+        self.assertTrue(self.node.receive_snapshot_request_message.called)
+        obj = self.node.receive_snapshot_request_message.call_args[0][0]
+        self.assertEqual(type(obj), SnapshotRequestMessage)
+        self.assertEqual(obj.credit, 4)
+        self.assertTrue(obj.start)
+
+    def test_snc(self):
+        """Test receipt of a SnapshotChunkMessage.
+        """
+        self.node.receive_snapshot_chunk_message = MagicMock()
+
+        b = Block(1, 2, [Transaction(1, 'a', 1)], 3)
+        b.depth = 7
+        snc = SnapshotChunkMessage(b'\x00data', True, b, 5)
+        s = snc.serialize()
+        self.proto.stringReceived(s)
+
+        self.assertTrue(self.node.receive_snapshot_chunk_message.called)
+        obj = self.node.receive_snapshot_chunk_message.call_args[0][0]
+        self.assertEqual(type(obj), SnapshotChunkMessage)
+        self.assertEqual(obj.data, b'\x00data')
+        self.assertTrue(obj.done)
+        self.assertEqual(obj.block, b)
+        self.assertEqual(obj.block.depth, 7)
+        self.assertEqual(obj.height, 5)
+
+        # a chunk that is not the last one carries no block
+        obj = SnapshotChunkMessage.unserialize(SnapshotChunkMessage(b'x', False, None, None).serialize())
+        self.assertIsNone(obj.block)
+
+    def test_hbt(self):
+        """Test receipt of a HeartbeatMessage.
+        """
+        self.node.receive_heartbeat_message = MagicMock()
+
+        hbt = HeartbeatMessage(7)
+        s = hbt.serialize()
+        self.proto.stringReceived(s)
+
+        self.assertTrue(self.node.receive_heartbeat_message.called)
+        obj = self.node.receive_heartbeat_message.call_args[0][0]
+        self.assertEqual(type(obj), HeartbeatMessage)
+        self.assertEqual(obj.height, 7)
+
+    def test_grp(self):
+        """Test receipt of a GroupMessage.
+        """
+        self.node.receive_group_message = MagicMock()
+
+        rbm = RequestBlockMessage(3)
+        grp = GroupMessage(2, rbm.serialize())
+        s = grp.serialize()
+        self.proto.stringReceived(s)
+
+        self.assertTrue(self.node.receive_group_message.called)
+        obj = self.node.receive_group_message.call_args[0][0]
+        self.assertEqual(type(obj), GroupMessage)
+        self.assertEqual(obj.group_id, 2)
+        self.assertEqual(RequestBlockMessage.unserialize(obj.data).block_id, 3)
+
     def test_pam(self):
         """Test receipt of a PaxosMessage.
         """
@@ -140,6 +301,7 @@ class TestConnection(unittest.TestCase):
         pam = PaxosMessage('TRY', 2)
         pam.new_block = block.block_id
         pam.last_committed_block = block2.block_id
+        pam.height = 7
 
         s = pam.serialize()
         self.proto.stringReceived(s)
@@ -149,17 +311,20 @@ class TestConnection(unittest.TestCase):
         self.assertEqual(type(obj), PaxosMessage)
         self.assertEqual(obj.new_block, block.block_id)
         self.assertEqual(obj.last_committed_block, block2.block_id)
+        self.assertEqual(obj.height, 7)
 
     def test_PON(self):
         """Test receipt of a PongMessage.
         """
         self.node.receive_pong_message = MagicMock()
 
-        pong = PongMessage(time.time())
+        pong = PongMessage(time.time(), 4)
         s = pong.serialize()
         self.proto.stringReceived(s)
 
         self.assertTrue(self.node.receive_pong_message.called)
+        obj = self.node.receive_pong_message.call_args[0][0]
+        self.assertEqual(obj.height, 4)
 
     def test_PIN(self):
         """Test receipt of a PingMessage.
@@ -172,6 +337,7 @@ class TestConnection(unittest.TestCase):
         print(self.proto.transport.value())
         obj = PongMessage.unserialize(self.proto.transport.value()[4:])
         self.assertEqual(obj.time, timestamp)
+        self.assertEqual(obj.height, 0)
 
     def test_broadcast(self):
         # setup another connection
@@ -209,3 +375,132 @@ class TestConnection(unittest.TestCase):
         obj = RequestBlockMessage.unserialize(self.proto.transport.value()[4:])
 
         self.assertEqual(rbm.block_id, obj.block_id)
+
+    @patch('piChain.PaxosNetwork.LoopingCall', MagicMock())
+    def test_loopback(self):
+        """Test that frames are passed between two ConnectionManager instances over a loopback connection.
+        """
+        clock = task.Clock()
+        peers = {
+            '0': {'loopback': 'test_node_0'},
+            '1': {'loopback': 'test_node_1'}
+        }
+        manager = ConnectionManager(1, peers)
+        manager.message_callback = MagicMock()
+        LOOPBACK_MANAGERS.update({'test_node_1': manager})
+        self.addCleanup(LOOPBACK_MANAGERS.pop, 'test_node_1')
+
+        self.node.peers = peers
+        self.node.reactor = clock
+        d = self.node.connect_to_peer('1')
+        d.addCallback(self.node.got_protocol)
+        clock.advance(0)
+        clock.advance(0)
+
+        self.assertIn('0', manager.peers_connection)
+        self.assertIn('1', self.node.peers_connection)
+
+        rbm = RequestBlockMessage(3)
+        self.node.broadcast(rbm, 'RQB')
+        clock.advance(0)
+
+        self.assertTrue(manager.message_callback.called)
+        msg_type, msg, sender = manager.message_callback.call_args[0]
+        self.assertEqual(msg_type, 'RQB')
+        self.assertEqual(RequestBlockMessage.unserialize(msg).block_id, 3)
+
+        # pause delivery
+        manager.peers_connection.get('0').transport.pauseProducing()
+        manager.message_callback.reset_mock()
+        self.node.broadcast(rbm, 'RQB')
+        clock.advance(0)
+        self.assertFalse(manager.message_callback.called)
+        manager.peers_connection.get('0').transport.resumeProducing()
+        self.assertTrue(manager.message_callback.called)
+
+    def test_loopback_not_listening(self):
+        """Test that connecting to a loopback name nobody listens on fails.
+        """
+        self.node.peers = {'1': {'loopback': 'test_nobody'}}
+        d = self.node.connect_to_peer('1')
+        return self.assertFailure(d, error.ConnectionRefusedError)
+
+    @patch('piChain.PaxosNetwork.LoopingCall', MagicMock())
+    def test_reconnect(self):
+        """Test that failed connection attempts are retried with exponential backoff and that a lost connection is
+        reestablished.
+        """
+        clock = task.Clock()
+        peers = {
+            '0': {'loopback': 'test_node_0'},
+            '1': {'loopback': 'test_node_1'}
+        }
+        self.node.peers = peers
+        self.node.reactor = clock
+        self.node.mesh_incomplete_since = time.time()
+
+        # peer 1 is not online yet
+        self.node.connect_to_nodes()
+        self.assertIn('1', self.node.reconnect_calls)
+        self.assertEqual(self.node.reconnect_delays.get('1'), 0.2)
+
+        clock.advance(0.15)
+        self.assertIn('1', self.node.reconnect_calls)
+        self.assertEqual(self.node.reconnect_delays.get('1'), 0.4)
+
+        # peer 1 comes online
+        manager = ConnectionManager(1, peers)
+        manager.reactor = clock
+        LOOPBACK_MANAGERS.update({'test_node_1': manager})
+        self.addCleanup(LOOPBACK_MANAGERS.pop, 'test_node_1')
+        clock.advance(0.3)
+        clock.advance(0)
+        clock.advance(0)
+
+        self.assertIn('1', self.node.peers_connection)
+        self.assertEqual(self.node.reconnect_calls, {})
+        self.assertEqual(self.node.reconnect_delays, {})
+        self.assertIsNone(self.node.mesh_incomplete_since)
+        self.assertIsNotNone(self.node.time_to_full_mesh)
+
+        # peer 1 closes the connection
+        manager.peers_connection.get('0').transport.loseConnection()
+        clock.advance(0)
+        self.assertNotIn('1', self.node.peers_connection)
+        self.assertIn('1', self.node.reconnect_calls)
+
+        clock.advance(0.15)
+        clock.advance(0)
+        clock.advance(0)
+        self.assertIn('1', self.node.peers_connection)
+
+        # no reconnect attempts once stopped
+        self.node.stop()
+        clock.advance(0)
+        self.assertEqual(self.node.reconnect_calls, {})
+        self.assertEqual(self.node.peers_connection, {})
+
+    @patch('piChain.PaxosNetwork.LoopingCall', MagicMock())
+    def test_stop_removed_node(self):
+        """Test that a node that has been removed from the configuration can be stopped and restarted.
+        """
+        clock = task.Clock()
+        peers = {
+            '0': {'loopback': 'test_node_0'},
+            '1': {'loopback': 'test_node_1'}
+        }
+        self.node.set_peers(peers)
+        self.node.reactor = clock
+        self.node.start()
+        self.assertIs(LOOPBACK_MANAGERS.get('test_node_0'), self.node)
+
+        # node 0 is removed from the configuration
+        self.node.update_peers({'1': {'loopback': 'test_node_1'}, '2': {'loopback': 'test_node_2'}})
+        self.node.stop()
+        self.assertNotIn('test_node_0', LOOPBACK_MANAGERS)
+
+        self.node.stopped = False
+        self.node.start()
+        self.assertNotIn('test_node_0', LOOPBACK_MANAGERS)
+        self.node.stop()
+        return self.assertFailure(self.node.connect_to_peer('0'), error.ConnectError)
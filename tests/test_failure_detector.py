@@ -0,0 +1,37 @@
+"""Unit tests of the PhiAccrualDetector class."""
+
+from unittest import TestCase
+
+from piChain.failure_detector import PhiAccrualDetector
+from piChain.config import PHI_THRESHOLD
+
+
+class TestPhiAccrualDetector(TestCase):
+
+    def test_phi_before_first_heartbeat(self):
+        detector = PhiAccrualDetector(0.1, 0.05)
+        assert detector.phi(now=100) == 0
+
+    def test_phi_grows(self):
+        detector = PhiAccrualDetector(0.1, 0.05)
+        for i in range(11):
+            detector.heartbeat(now=i / 10)
+
+        assert detector.phi(now=1.05) < 1
+        assert detector.phi(now=1.1) < detector.phi(now=1.2)
+        assert detector.phi(now=1.5) > PHI_THRESHOLD
+
+        # no overflow long after the last heartbeat
+        assert detector.phi(now=1000) > PHI_THRESHOLD
+
+    def test_irregular_heartbeats(self):
+        regular = PhiAccrualDetector(0.1, 0.01)
+        irregular = PhiAccrualDetector(0.1, 0.01)
+        t = 0
+        for i in range(20):
+            regular.heartbeat(now=i / 10)
+            irregular.heartbeat(now=t)
+            t += 0.02 if i % 2 == 0 else 0.18
+
+        # the same silence is less suspicious if the heartbeats arrive irregularly
+        assert irregular.phi(now=t - 0.18 + 0.3) < regular.phi(now=1.9 + 0.3)
@@ -29,6 +29,28 @@ class MultiNodeTestCrashes(MultiNodeTest):
         assert node0_blocks == node1_blocks
         assert node2_blocks == node1_blocks
 
+    def test_scenario22_leadership_transfer(self):
+        self.start_processes_with_test_scenario(22, 3)
+        time.sleep(3)
+        self.terminate_single_process(0)
+        node0_blocks_before = self.extract_committed_blocks_single_process(0)
+        self.start_single_process_with_test_scenario(22, 0, 3)
+        time.sleep(10)
+        self.terminate_processes()
+
+        node0_blocks_after = self.extract_committed_blocks_single_process(0)
+        node1_blocks = self.extract_committed_blocks_single_process(1)
+        node2_blocks = self.extract_committed_blocks_single_process(2)
+
+        node0_blocks = node0_blocks_before + node0_blocks_after
+
+        assert len(node1_blocks) == 2
+        assert node0_blocks == node1_blocks
+        assert node2_blocks == node1_blocks
+
+        # the second block has been created by node 1 (the block id contains the id of its creator)
+        assert int(node1_blocks[1].split()[-1]) & 0xffff == 1
+
     def test_scenario21_crash(self):
         self.start_processes_with_test_scenario(21, 3)
         time.sleep(3)
@@ -47,3 +69,25 @@ class MultiNodeTestCrashes(MultiNodeTest):
         assert len(node0_blocks) > 0
         assert node0_blocks == node1_blocks
         assert node2_blocks == node1_blocks
+
+    def test_scenario23_failover(self):
+        self.start_processes_with_test_scenario(23, 3)
+        time.sleep(3)
+        self.terminate_single_process(0)
+        time.sleep(6)
+        self.terminate_processes()
+
+        node1_lines = self.extract_lines_single_process(1)
+        node2_lines = self.extract_lines_single_process(2)
+        node1_blocks = [line for line in node1_lines if 'block =' in line]
+        node2_blocks = [line for line in node2_lines if 'block =' in line]
+
+        # all transactions are committed (some of them before the crash)
+        assert node1_blocks == node2_blocks
+        assert len(node1_blocks) > 1
+
+        # a single node took over as quick node and reported the time since the last heartbeat of node 0
+        failover_times = self.extract_failover_times(node1_lines) + self.extract_failover_times(node2_lines)
+        print('failover times = %s seconds' % str(failover_times))
+        assert len(failover_times) == 1
+        assert failover_times[0] < 5
@@ -0,0 +1,169 @@
+"""Unit tests of the multigroup module."""
+
+import logging
+import os
+import time
+import shutil
+
+from unittest.mock import MagicMock, patch
+from twisted.internet import task
+from twisted.trial.unittest import TestCase
+
+from piChain.PaxosLogic import QUICK, SLOW, MAX_BLOCK_SIZE, ITEM_OVERHEAD
+from piChain.multigroup import MultiGroupNode, GroupConnection
+from piChain.messages import Transaction, GroupMessage, RequestBlockMessage, PongMessage, RespondBlockMessage, \
+    SyncResponseMessage
+from piChain.config import MAX_MESSAGE_SIZE
+
+logging.disable(logging.CRITICAL)
+
+
+class TestMultiGroupNode(TestCase):
+
+    def setUp(self):
+        # delete pichain folder on disk
+        base_path = os.path.expanduser('~/.pichain')
+        if os.path.exists(base_path):
+            shutil.rmtree(base_path)
+
+        self.peers = {
+            '0': {'loopback': 'test_group_node_0'},
+            '1': {'loopback': 'test_group_node_1'}
+        }
+
+    def make_node(self, node_index, group_count):
+        node = MultiGroupNode(node_index, self.peers, group_count)
+        for group in node.groups:
+            self.addCleanup(group.blocktree.db.close)
+        return node
+
+    def test_groups(self):
+        """Test that the groups have their own blocktree and are spread among the nodes as quick nodes."""
+        node = self.make_node(1, 3)
+
+        self.assertEqual([group.group_id for group in node.groups], [0, 1, 2])
+        self.assertEqual([group.state for group in node.groups], [SLOW, QUICK, SLOW])
+        self.assertTrue(os.path.exists(os.path.expanduser('~/.pichain/node_1_group_2')))
+
+    def test_receive_group_message(self):
+        """Test that a GroupMessage is passed to its group which answers over a GroupConnection."""
+        node = self.make_node(0, 2)
+        for group in node.groups:
+            group.receive_request_blocks_message = MagicMock()
+        sender = MagicMock(peer_node_id='1')
+
+        node.receive_group_message(GroupMessage(1, RequestBlockMessage(3).serialize()), sender)
+
+        self.assertFalse(node.groups[0].receive_request_blocks_message.called)
+        req, connection = node.groups[1].receive_request_blocks_message.call_args[0]
+        self.assertEqual(req.block_id, 3)
+        self.assertEqual(type(connection), GroupConnection)
+
+        # the answer is wrapped into a GroupMessage of the same group
+        connection.sendString(b'RSB')
+        msg = GroupMessage.unserialize(sender.sendString.call_args[0][0])
+        self.assertEqual(msg.group_id, 1)
+        self.assertEqual(msg.data, b'RSB')
+
+        # messages of unknown groups are dropped
+        node.receive_group_message(GroupMessage(2, RequestBlockMessage(3).serialize()), sender)
+        self.assertEqual(node.groups[1].receive_request_blocks_message.call_count, 1)
+
+    def test_receive_pong_message(self):
+        """Test that each group gets the committed height of the peer in this group."""
+        node = self.make_node(0, 2)
+        self.assertEqual(node.committed_height(), [0, 0])
+
+        node.receive_pong_message(PongMessage(time.time(), [3, 5]), '1')
+        self.assertEqual([group.peer_heights.get('1') for group in node.groups], [3, 5])
+        for group in node.groups:
+            self.assertIsNotNone(group.rtts.get('1'))
+
+    @patch('piChain.PaxosLogic.BLOCK_SIZE', MAX_MESSAGE_SIZE)
+    def test_max_block_size(self):
+        """Test that a block of the max size still fits into a single message once it is wrapped into a GroupMessage."""
+        node = self.make_node(0, 2)
+        group = node.groups[1]
+        group.reactor = task.Clock()
+        group.timeout_over = MagicMock()
+
+        # a command s.t the txn has the max size
+        content = 'x' * MAX_BLOCK_SIZE
+        content = content[:len(content) - (Transaction(0, content, 1).get_size() + ITEM_OVERHEAD - MAX_BLOCK_SIZE)]
+        self.assertRaises(ValueError, group.make_txn, content + 'x')
+        group.make_txn(content)
+        b = group.create_block()
+        self.assertEqual(len(b.txs), 1)
+
+        for message in [RespondBlockMessage([b]), SyncResponseMessage([b], b.block_id, True, 2 ** 40)]:
+            frame = GroupMessage(1, message.serialize()).serialize()
+            self.assertLessEqual(len(frame), MAX_MESSAGE_SIZE)
+
+    def test_shared_transport_paused(self):
+        """Test that a connection shared by the groups stays paused while at least one group is busy."""
+        node = self.make_node(0, 2)
+        connection = MagicMock(peer_node_id='1', paused_groups=set())
+        node.peers_connection = {'1': connection}
+        for group in node.groups:
+            group.learners = {'1'}
+        node.peer_connected('1')
+
+        # group 0 becomes busy and pauses the learner connection
+        node.groups[0].busy = True
+        for producer in node.groups[0].paused_producers():
+            producer.pauseProducing()
+        self.assertEqual(connection.transport.pauseProducing.call_count, 1)
+
+        # a learner connecting while group 0 is busy is paused right away
+        new_connection = MagicMock(peer_node_id='1', paused_groups=set())
+        node.peers_connection = {'1': new_connection}
+        node.peer_connected('1')
+        self.assertEqual(new_connection.paused_groups, {0})
+        self.assertEqual(new_connection.transport.pauseProducing.call_count, 1)
+
+        # group 1 becomes busy too, then group 0 admits txs again: the connection stays paused
+        node.groups[1].busy = True
+        for group in node.groups:
+            for producer in group.paused_producers():
+                producer.pauseProducing()
+        for producer in node.groups[0].paused_producers():
+            producer.resumeProducing()
+        self.assertEqual(new_connection.transport.pauseProducing.call_count, 1)
+        self.assertFalse(new_connection.transport.resumeProducing.called)
+
+        # it is resumed once the last busy group admits txs again
+        for producer in node.groups[1].paused_producers():
+            producer.resumeProducing()
+        self.assertEqual(new_connection.transport.resumeProducing.call_count, 1)
+        self.assertEqual(new_connection.paused_groups, set())
+
+    @patch('piChain.PaxosNetwork.LoopingCall', MagicMock())
+    def test_shared_connection(self):
+        """Test that the groups share the connection between two nodes and only receive their own messages."""
+        clock = task.Clock()
+        node_0 = self.make_node(0, 2)
+        node_1 = self.make_node(1, 2)
+        for node in [node_0, node_1]:
+            node.reactor = clock
+            self.addCleanup(node.stop)
+        node_0.start()
+        node_1.start()
+        clock.advance(0)
+        clock.advance(0)
+
+        self.assertIn('1', node_0.peers_connection)
+        for group in node_0.groups:
+            self.assertIs(group.peers_connection.get('1').connection, node_0.peers_connection.get('1'))
+
+        txn = Transaction(0, 'command1', 1)
+        node_0.groups[1].broadcast(txn, 'TXN')
+        clock.advance(0)
+
+        self.assertIn(txn.txn_id, node_1.groups[1].known_txs)
+        self.assertNotIn(txn.txn_id, node_1.groups[0].known_txs)
+
+        # a lost connection is removed from all groups
+        node_1.peers_connection.get('0').transport.loseConnection()
+        clock.advance(0)
+        for group in node_0.groups:
+            self.assertNotIn('1', group.peers_connection)
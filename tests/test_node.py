@@ -1,16 +1,24 @@
 """Unit tests of the Node class inside the PaxosLogic module."""
 
+import io
+import json
 import logging
 import time
 import os
 import shutil
 
-from unittest.mock import MagicMock
-from twisted.internet import task
+from unittest.mock import MagicMock, patch
+from twisted.internet import task, defer
+from twisted.python.failure import Failure
 from twisted.trial.unittest import TestCase
 
-from piChain.PaxosLogic import Node, GENESIS
-from piChain.messages import PaxosMessage, Block, Transaction, RequestBlockMessage, PongMessage
+from piChain.PaxosLogic import Node, NodeBusyError, SnapshotTransfer, GENESIS, QUICK, MEDIUM, SLOW, ENVELOPE_OVERHEAD, \
+    ITEM_OVERHEAD
+from piChain.apply import ApplyPipeline
+from piChain.config import LEASE_DURATION
+from piChain.messages import PaxosMessage, Block, Transaction, RequestBlockMessage, PongMessage, RespondBlockMessage, \
+    SyncRequestMessage, SyncResponseMessage, ReadIndexMessage, LeadershipTransferMessage, HeartbeatMessage, \
+    SnapshotRequestMessage
 
 logging.disable(logging.CRITICAL)
 
@@ -47,7 +55,7 @@ class TestNode(TestCase):
         self.node.respond = MagicMock()
         self.node.blocktree.nodes.update({b.block_id: b})
 
-        self.node.receive_paxos_message(try_msg, 1)
+        self.node.receive_paxos_message(try_msg, MagicMock(peer_node_id='1'))
         assert self.node.respond.called
         assert self.node.s_max_block_depth == b.depth
 
@@ -111,6 +119,30 @@ class TestNode(TestCase):
         obj = self.node.broadcast.call_args[0][0]
         assert obj.com_block == b.block_id
 
+    def test_receive_paxos_message_try_ok_4(self):
+        # try_ok message contains a propose block which is an ancestor of the new block
+        try_ok = PaxosMessage('TRY_OK', 1)
+
+        a = Block(1, GENESIS.block_id, ['a'], 1)
+        a.depth = 1
+        b = Block(2, a.block_id, ['b'], 2)
+        b.depth = 2
+
+        try_ok.supp_block = a.block_id
+        try_ok.prop_block = a.block_id
+
+        self.node.c_request_seq = 1
+        self.node.c_new_block = b
+        self.node.c_votes = 5
+
+        self.node.broadcast = MagicMock()
+        self.node.blocktree.nodes.update({a.block_id: a, b.block_id: b})
+        self.node.receive_paxos_message(try_ok, None)
+
+        # committing the new block commits the propose block as well
+        obj = self.node.broadcast.call_args[0][0]
+        assert obj.com_block == b.block_id
+
     def test_receive_paxos_message_propose(self):
         propose = PaxosMessage('PROPOSE', 1)
 
@@ -121,7 +153,7 @@ class TestNode(TestCase):
         propose.com_block = GENESIS.block_id
 
         self.node.respond = MagicMock()
-        self.node.receive_paxos_message(propose, 1)
+        self.node.receive_paxos_message(propose, MagicMock(peer_node_id='1'))
 
         assert self.node.respond.called
         assert self.node.s_prop_block.block_id == propose.com_block
@@ -170,6 +202,603 @@ class TestNode(TestCase):
         assert len(self.node.new_txs) == 0
         assert self.node.blocktree.nodes.get(c.block_id) == c
 
+    def test_create_block_size(self):
+        self.node.reactor = task.Clock()
+        txs = [Transaction(1, 'x' * 100, i) for i in range(1000, 1010)]
+        for txn in txs:
+            self.node.receive_transaction(txn)
+        assert self.node.new_txs_size == sum(txn.get_size() + 5 for txn in txs)
+
+        # only 4 txs fit into a block
+        with patch('piChain.PaxosLogic.BLOCK_SIZE', 4 * (txs[0].get_size() + 5)):
+            b = self.node.create_block()
+        assert b.txs == txs[:4]
+        assert self.node.new_txs == txs[4:]
+        assert self.node.new_txs_size == sum(txn.get_size() + 5 for txn in txs[4:])
+
+        # a txn larger than the block size is included on its own
+        with patch('piChain.PaxosLogic.BLOCK_SIZE', 1):
+            b = self.node.create_block()
+        assert b.txs == txs[4:5]
+
+        b = self.node.create_block()
+        assert b.txs == txs[5:]
+        assert self.node.new_txs_size == 0
+
+    def test_make_txn(self):
+        self.node.reactor = task.Clock()
+        self.node.start_commit_process = MagicMock()
+        d = self.node.make_txn('put k v')
+        txn = self.node.new_txs[0]
+        pending = self.node.pending_txs.get(txn.txn_id)
+        committed = []
+        d.addCallback(committed.append)
+
+        b = self.node.create_block()
+        self.node.move_to_block(b)
+        self.node.commit(b)
+
+        assert committed == [txn.txn_id]
+        assert self.node.pending_txs == {}
+        assert pending.timeout_call is None
+
+    def test_make_txn_timeout(self):
+        clock = task.Clock()
+        self.node.reactor = clock
+        self.node.timeout_over = MagicMock()
+        d = self.node.make_txn('put k v')
+        txn = self.node.new_txs[0]
+
+        # the txn got lost (e.g. the quick node crashed): it is resubmitted
+        self.node.new_txs = []
+        clock.advance(10)
+        assert self.node.new_txs == [txn]
+        assert self.node.pending_txs.get(txn.txn_id).resubmits == 1
+
+        clock.advance(10)
+        clock.advance(10)
+        assert self.node.pending_txs == {}
+        return self.assertFailure(d, defer.TimeoutError)
+
+    def test_lease_conflict(self):
+        self.node.respond = MagicMock()
+        lease = PaxosMessage('LEASE', 1)
+        self.node.receive_paxos_message(lease, MagicMock(peer_node_id='1'))
+        assert self.node.respond.called
+        assert self.node.s_lease_holder == '1'
+
+        # TRY and LEASE messages of other nodes are rejected until the lease expires
+        self.node.respond.reset_mock()
+        b = Block(2, GENESIS.block_id, [Transaction(2, 'a', 1)], 1)
+        b.depth = 1
+        self.node.blocktree.nodes.update({b.block_id: b})
+        try_msg = PaxosMessage('TRY', 1)
+        try_msg.last_committed_block = GENESIS.block_id
+        try_msg.new_block = b.block_id
+        self.node.receive_paxos_message(try_msg, MagicMock(peer_node_id='2'))
+        self.node.receive_paxos_message(lease, MagicMock(peer_node_id='2'))
+        assert not self.node.respond.called
+
+        self.node.s_lease_expires = time.monotonic() - 1
+        self.node.receive_paxos_message(try_msg, MagicMock(peer_node_id='2'))
+        assert self.node.respond.called
+
+    def test_lease_wall_clock_step(self):
+        # a step of the wall clock (e.g by NTP) neither extends nor shortens a lease
+        self.node.grant_lease(MagicMock(peer_node_id='1'))
+        self.node.state = QUICK
+        self.node.c_lease_expires = time.monotonic() + LEASE_DURATION
+        with patch('time.time', return_value=time.time() + 3600):
+            assert self.node.has_lease()
+            assert self.node.lease_conflict(MagicMock(peer_node_id='2'))
+
+        expired = time.monotonic() + LEASE_DURATION + 1
+        with patch('time.time', return_value=time.time() - 3600), patch('time.monotonic', return_value=expired):
+            assert not self.node.has_lease()
+            assert not self.node.lease_conflict(MagicMock(peer_node_id='2'))
+
+    def test_start_commit_process_lease(self):
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        self.node.grant_lease(MagicMock(peer_node_id='1'))
+        self.node.receive_transaction(Transaction(0, 'a', 1))
+        self.node.timeout_over(self.node.new_txs[0])
+
+        # the commit waits until the lease granted to node 1 expired (the TRY message would be rejected)
+        assert not self.node.c_commit_running
+        self.node.s_lease_expires = time.monotonic() - 1
+        self.node.reactor.advance(LEASE_DURATION + self.node.expected_rtt)
+        assert self.node.c_commit_running
+        obj = self.node.broadcast.call_args[0][0]
+        assert obj.msg_type == 'TRY'
+
+    def test_read_index(self):
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        heights = []
+
+        # quick node without a lease renews it first
+        d = self.node.read_index()
+        d.addCallback(heights.append)
+        assert self.node.broadcast.called
+        assert heights == []
+
+        lease_ack = PaxosMessage('LEASE_ACK', self.node.c_lease_seq)
+        lease_ack.last_committed_block = GENESIS.block_id
+        self.node.receive_paxos_message(lease_ack, MagicMock(peer_node_id='1'))
+        assert heights == [0]
+        assert self.node.has_lease()
+
+        # served locally while the lease is valid
+        self.node.broadcast.reset_mock()
+        self.node.read_index().addCallback(heights.append)
+        assert heights == [0, 0]
+        assert not self.node.broadcast.called
+
+    def test_read_index_missed_commit(self):
+        clock = task.Clock()
+        self.node.reactor = clock
+        self.node.broadcast = MagicMock()
+        d = self.node.read_index()
+
+        # a peer accepted a block this node does not know: it may have been committed by another node
+        lease_ack = PaxosMessage('LEASE_ACK', self.node.c_lease_seq)
+        lease_ack.last_committed_block = GENESIS.block_id
+        lease_ack.prop_block = 12345
+        self.node.receive_paxos_message(lease_ack, MagicMock(peer_node_id='1'))
+        assert not self.node.has_lease()
+
+        clock.advance(2)
+        return self.assertFailure(d, defer.TimeoutError)
+
+    def test_read_index_slow_node(self):
+        self.node.state = 2
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        heights = []
+        self.node.read_index().addCallback(heights.append)
+        rix = self.node.broadcast.call_args[0][0]
+        assert isinstance(rix, ReadIndexMessage)
+
+        self.node.receive_read_index_message(ReadIndexMessage(rix.request_id, 3), MagicMock())
+        assert heights == [3]
+        assert self.node.read_requests == {}
+
+    def test_wait_for_height(self):
+        heights = []
+        self.node.wait_for_height(1).addCallback(heights.append)
+        assert heights == []
+
+        b = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b.depth = 1
+        self.node.blocktree.add_block(b)
+        self.node.commit(b)
+        assert heights == [1]
+        assert self.node.height_waiters == []
+
+    def test_wait_for_applied_height(self):
+        applied = []
+        self.node.tx_applied = applied.extend
+        self.node.broadcast = MagicMock()
+        self.node.apply_pipeline = ApplyPipeline(self.node, self.node.tx_applied, 0)
+        # the app is still busy applying previous blocks
+        self.node.apply_pipeline.running = True
+
+        heights = []
+        self.node.wait_for_height(1).addCallback(heights.append)
+        b = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b.depth = 1
+        self.node.blocktree.add_block(b)
+        self.node.commit(b)
+        assert heights == []
+        assert self.node.applied_height() == 0
+        assert list(self.node.apply_pipeline.queue) == [(1, ['a'])]
+
+        self.node.apply_pipeline.queue.clear()
+        self.node.apply_pipeline.applied(None, 1)
+        assert heights == [1]
+
+    def test_committed_log(self):
+        self.node.broadcast = MagicMock()
+        b1 = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b2 = Block(2, b1.block_id, [Transaction(1, 'b', 2), Transaction(1, 'c', 3)], 2)
+        for b in [b1, b2]:
+            self.node.blocktree.add_block(b)
+        self.node.commit(b1)
+
+        log = self.node.committed_log(1)
+        assert next(log) == (1, b1.block_id, b1.txs[0].txn_id, 'a')
+
+        # the iterator picks up blocks committed while it is consumed
+        self.node.commit(b2)
+        assert [entry[3] for entry in log] == ['b', 'c']
+        assert list(self.node.committed_log(3)) == []
+
+        # the blocks deleted at a genesis block change can not be read anymore
+        self.node.blocktree.nodes.pop(b1.block_id)
+        with self.assertRaises(ValueError):
+            list(self.node.committed_log(1))
+
+    @patch('piChain.apply.ApplyPipeline.apply_next')
+    def test_replay_unapplied(self, apply_next):
+        b1 = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b2 = Block(2, b1.block_id, [Transaction(1, 'b', 2)], 2)
+        b3 = Block(3, b2.block_id, [Transaction(1, 'c', 3), Transaction(1, 'd', 4)], 3)
+        for b in [b1, b2, b3]:
+            self.node.blocktree.add_block(b)
+        self.node.blocktree.committed_blocks = [GENESIS.block_id, b1.block_id, b2.block_id, b3.block_id]
+        self.node.blocktree.committed_block = b3
+
+        # the app persisted the txs of the first block before the restart
+        self.node.state_machine = MagicMock()
+        self.node.state_machine.applied_height.return_value = 1
+        self.node.replay_unapplied()
+
+        pipeline = self.node.apply_pipeline
+        assert pipeline.flush == self.node.state_machine.flush
+        assert list(pipeline.queue) == [(2, ['b']), (3, ['c', 'd'])]
+        assert self.node.applied_height() == 1
+
+        # the blocks that have not been applied yet are kept at a genesis block change
+        self.node.peer_heights = {'1': 3, '2': 3}
+        self.node.change_genesis_block()
+        assert self.node.blocktree.genesis_height == 1
+
+    @patch('piChain.apply.APPLY_QUEUE_SIZE', 1)
+    def test_apply_backpressure(self):
+        self.node.broadcast = MagicMock()
+        self.node.start_commit_process = MagicMock()
+        self.node.apply_pipeline = ApplyPipeline(self.node, MagicMock(), 0)
+        self.node.apply_pipeline.running = True
+        self.node.apply_pipeline.queue.append((1, ['a']))
+
+        # the quick node does not create a block while the app falls behind
+        txn = Transaction(0, 'b', 2)
+        self.node.new_txs = [txn]
+        self.node.timeout_over(txn)
+        assert self.node.new_txs == [txn]
+        assert self.node.apply_pipeline.stalled
+
+        # but once the app caught up
+        self.node.apply_pipeline.queue.clear()
+        self.node.apply_pipeline.applied(None, 1)
+        assert self.node.new_txs == []
+        assert self.node.broadcast.called
+
+    def test_bounded_read(self):
+        clock = task.Clock()
+        self.node.reactor = clock
+        heights = []
+
+        # a peer committed 2 blocks this node did not commit yet
+        self.node.update_known_height(2)
+        assert self.node.watermark()[:2] == (0, 2)
+        assert self.node.is_fresh(max_blocks=2)
+        assert not self.node.is_fresh(max_blocks=1)
+        assert self.node.is_fresh(max_age=1)
+
+        self.node.bounded_read(max_blocks=1).addCallback(heights.append)
+        assert heights == []
+
+        b = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b.depth = 1
+        self.node.blocktree.add_block(b)
+        self.node.commit(b)
+        assert heights == [1]
+        assert self.node.watermark()[:2] == (1, 2)
+
+        # reads time out if this node does not catch up
+        d = self.node.bounded_read(max_blocks=0)
+        clock.advance(2)
+        return self.assertFailure(d, defer.TimeoutError)
+
+    @patch('piChain.apply.ApplyPipeline.apply_next')
+    def test_bounded_read_slow_app(self, apply_next):
+        self.node.reactor = task.Clock()
+        self.node.tx_applied = MagicMock()
+        heights = []
+
+        # the block is committed but the slow app did not apply it yet: the local state is still behind
+        b = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b.depth = 1
+        self.node.blocktree.add_block(b)
+        self.node.commit(b)
+        assert self.node.blocktree.committed_height() == 1
+        assert self.node.watermark()[:2] == (0, 1)
+        self.node.bounded_read(max_blocks=0).addCallback(heights.append)
+        assert heights == []
+
+        # the read is served once the block has been applied
+        self.node.apply_pipeline.queue.clear()
+        self.node.apply_pipeline.applied(None, 1)
+        assert heights == [1]
+        assert self.node.watermark() == (1, 1, 0)
+
+    def test_transfer_leadership(self):
+        self.node.broadcast = MagicMock()
+        self.node.c_lease_expires = time.monotonic() + 1
+        self.assertRaises(ValueError, self.node.transfer_leadership, 0)
+
+        self.node.transfer_leadership(1)
+        assert self.node.state == SLOW
+        assert not self.node.has_lease()
+        obj = self.node.broadcast.call_args[0][0]
+        assert type(obj) == LeadershipTransferMessage
+        assert obj.target_id == 1
+
+        # only the quick node can transfer its role
+        self.assertRaises(ValueError, self.node.transfer_leadership, 2)
+
+    def test_learner(self):
+        peers = {
+            '0': {'ip': '127.0.0.1', 'port': 7982},
+            '1': {'ip': '127.0.0.1', 'port': 7981, 'learner': True},
+            '2': {'ip': '127.0.0.1', 'port': 7980}
+        }
+        voter = Node(0, peers)
+        voter.blocktree.db = MagicMock()
+        learner = Node(1, peers)
+        learner.blocktree.db = MagicMock()
+        assert voter.n == 2 and voter.voters == [0, 2]
+        assert learner.learner and learner.state == SLOW
+
+        # the consensus messages are not sent to learners
+        connections = {'1': MagicMock(peer_node_id='1'), '2': MagicMock(peer_node_id='2')}
+        voter.peers_connection = connections
+        voter.broadcast(PaxosMessage('TRY', 1), 'TRY')
+        assert connections['2'].sendString.called
+        assert not connections['1'].sendString.called
+        self.assertRaises(ValueError, voter.transfer_leadership, 1)
+
+        # the node that committed a block sends it to the learners followed by the COMMIT message
+        b = Block(0, GENESIS.block_id, [Transaction(0, 'a', 1)], 1)
+        b.depth = 1
+        voter.blocktree.add_block(b)
+        commit = PaxosMessage('COMMIT', 1)
+        commit.com_block = b.block_id
+        commit.height = 1
+        voter.commit(b)
+        voter.stream_to_learners(0, commit)
+        frames = [call[0][0] for call in connections['1'].sendString.call_args_list]
+        assert [frame[:3] for frame in frames] == [b'RSB', b'PAM']
+
+        committed = []
+        learner.tx_committed = committed.extend
+        for frame in frames:
+            learner.parse_msg(frame[:3].decode(), frame, MagicMock(peer_node_id='0'))
+        assert committed == ['a']
+
+        # a learner neither votes nor puts txs into blocks
+        learner.respond = MagicMock()
+        try_msg = PaxosMessage('TRY', 2)
+        try_msg.last_committed_block = b.block_id
+        try_msg.new_block = b.block_id
+        learner.receive_paxos_message(try_msg, MagicMock(peer_node_id='0'))
+        assert not learner.respond.called
+        learner.receive_transaction(Transaction(0, 'b', 2))
+        assert learner.new_txs == [] and not learner.patience_timer.active()
+
+    def test_change_membership(self):
+        self.node.broadcast = MagicMock()
+        peers = dict(self.node.peers)
+        peers.update({'3': {'ip': '127.0.0.1', 'port': 7983}, '4': {'ip': '127.0.0.1', 'port': 7984}})
+        self.assertRaises(ValueError, self.node.change_membership, peers)
+
+        # add a single voter
+        peers.pop('4')
+        self.node.change_membership(peers)
+        txn = self.node.broadcast.call_args[0][0]
+        assert type(txn) == Transaction and txn.membership
+        assert Transaction.unserialize(txn.serialize()).membership
+
+        # a second change is rejected until the first one has been committed (together they could add two voters)
+        other = dict(peers)
+        other.pop('3')
+        other.update({'4': {'ip': '127.0.0.1', 'port': 7984}})
+        self.assertRaises(ValueError, self.node.change_membership, other)
+
+        # the change takes effect once committed (and is not passed to the app), a command of the app is never taken
+        # for a membership change
+        committed = []
+        self.node.tx_committed = committed.extend
+        command = Transaction(0, '\x00membership ' + json.dumps(other), 2)
+        b = Block(0, GENESIS.block_id, [txn, command], 1)
+        b.depth = 2
+        self.node.blocktree.add_block(b)
+        self.node.commit(b)
+        assert committed == [command.content]
+        assert self.node.n == 4 and self.node.voters == [0, 1, 2, 3]
+        self.node.blocktree.db.put.assert_any_call(b'peers', json.dumps(peers).encode())
+
+        # remove a voter: its connection is closed and it does not vote anymore
+        connection = MagicMock(peer_node_id='2')
+        self.node.peers_connection = {'2': connection}
+        peers.pop('2')
+        self.node.apply_membership(peers)
+        assert self.node.voters == [0, 1, 3]
+        assert connection.transport.loseConnection.called
+        assert not self.node.is_voter(connection)
+        assert self.node.is_voter(None)
+
+    def test_commit_invalid_membership_change(self):
+        # a committed change that is not valid (anymore) is ignored without interrupting the commit
+        self.node.reactor = task.Clock()
+        committed = []
+        self.node.tx_committed = committed.extend
+        self.node.c_commit_running = True
+        d = self.node.make_txn('a')
+        txn = self.node.new_txs[0]
+        two_voters_removed = json.dumps({'0': {'loopback': 'node_0'}})
+        invalid = [Transaction(1, 'not json', 1, True), Transaction(1, two_voters_removed, 2, True)]
+        b = Block(1, GENESIS.block_id, invalid + [txn], 3)
+        b.depth = 3
+        self.node.blocktree.add_block(b)
+        self.node.commit(b)
+        assert committed == ['a']
+        assert self.node.voters == [0, 1, 2]
+        assert not self.node.c_commit_running
+        assert self.node.pending_txs == {}
+        return d
+
+    def test_receive_leadership_transfer_message(self):
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        self.node.state = SLOW
+        self.node.grant_lease(MagicMock(peer_node_id='1'))
+        self.node.receive_transaction(Transaction(1, 'a', 1))
+
+        ltr = LeadershipTransferMessage(0, GENESIS.block_id, 1)
+        self.node.receive_leadership_transfer_message(ltr, MagicMock(peer_node_id='1'))
+
+        # the lease of the source is released, the message is relayed and the txs are put into a block right away
+        assert self.node.state == QUICK
+        assert self.node.s_lease_holder is None
+        assert self.node.broadcast.call_args_list[0][0] == (ltr, 'LTR')
+        assert len(self.node.new_txs) == 0
+        assert self.node.c_commit_running
+
+        # other nodes are demoted and expect heartbeats from the target
+        ltr = LeadershipTransferMessage(2, GENESIS.block_id, 1)
+        self.node.receive_leadership_transfer_message(ltr, MagicMock(peer_node_id='1'))
+        assert self.node.state == SLOW
+        assert self.node.quick_node_id == '2'
+        self.node.receive_heartbeat_message(HeartbeatMessage(0), MagicMock(peer_node_id='2'))
+        assert self.node.quick_detector.last_heartbeat is not None
+
+    def test_transfer_leadership_relayed(self):
+        nodes = [self.node, Node(1, self.node.peers), Node(2, self.node.peers)]
+        queues = {}
+        for node in nodes:
+            node.blocktree.db = MagicMock()
+            node.reactor = task.Clock()
+            for peer in nodes:
+                if peer != node:
+                    connection = MagicMock(peer_node_id=str(peer.id))
+                    connection.sendString.side_effect = queues.setdefault((node.id, peer.id), []).append
+                    node.peers_connection[str(peer.id)] = connection
+
+        def deliver(source, target):
+            queue = queues[(source.id, target.id)]
+            while len(queue) != 0:
+                data = queue.pop(0)
+                target.parse_msg(data[:3].decode(), data, target.peers_connection[str(source.id)])
+
+        # node 2 granted node 0 a lease, node 1 waits for a txn to be committed
+        node_0, node_1, node_2 = nodes
+        node_2.grant_lease(node_2.peers_connection['0'])
+        node_1.receive_transaction(Transaction(1, 'a', 1))
+        node_0.transfer_leadership(1)
+
+        # node 2 receives the messages of the target before the LTR of node 0: the relayed LTR released the lease
+        deliver(node_0, node_1)
+        assert node_1.state == QUICK
+        deliver(node_1, node_2)
+        assert node_2.s_lease_holder is None
+        # TRY_OK, PROPOSE and PROPOSE_ACK
+        deliver(node_2, node_1)
+        deliver(node_1, node_2)
+        assert node_2.s_lease_holder == '1'
+        deliver(node_2, node_1)
+        assert node_1.blocktree.committed_height() == 1
+
+        # the late LTR of node 0 does not release the lease granted to the target
+        deliver(node_0, node_2)
+        assert node_2.s_lease_holder == '1'
+        assert node_2.state == SLOW
+
+    def test_heartbeat(self):
+        self.node.broadcast = MagicMock()
+
+        # the quick node broadcasts a heartbeat
+        self.node.heartbeat()
+        obj = self.node.broadcast.call_args[0][0]
+        assert type(obj) == HeartbeatMessage
+        assert obj.height == 0
+
+        # a slow node suspects the quick node once its heartbeats stop
+        self.node.state = SLOW
+        self.node.broadcast = MagicMock()
+        self.node.receive_heartbeat_message(HeartbeatMessage(0), MagicMock(peer_node_id='2'))
+        self.node.heartbeat()
+        assert not self.node.broadcast.called
+        assert self.node.quick_suspected_at is None
+
+        self.node.quick_detector.last_heartbeat -= 1
+        self.node.heartbeat()
+        assert self.node.quick_suspected_at is not None
+
+    def test_suspect_quick_node(self):
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        self.node.state = SLOW
+        self.node.receive_heartbeat_message(HeartbeatMessage(0), MagicMock(peer_node_id='1'))
+        self.node.receive_transaction(Transaction(2, 'a', 1))
+
+        # node 2 follows node 1 if it is connected
+        self.node.peers_connection = {'1': MagicMock(), '2': MagicMock()}
+        assert self.node.quick_successor() == 2
+        self.node.suspect_quick_node()
+        assert self.node.state == SLOW
+
+        # node 0 is the successor otherwise: it puts the pending txs into a block right away
+        self.node.quick_suspected_at = None
+        self.node.peers_connection = {}
+        self.node.peer_disconnected('1')
+        assert self.node.quick_suspected_at is not None
+        assert len(self.node.new_txs) == 0
+        assert self.node.state == QUICK
+        assert self.node.c_commit_running
+
+    def test_receive_heartbeat_message(self):
+        self.node.state = MEDIUM
+        self.node.quick_suspected_at = time.time()
+
+        # the quick node is alive: the pre-armed promotion is revoked
+        self.node.receive_heartbeat_message(HeartbeatMessage(3), MagicMock(peer_node_id='2'))
+        assert self.node.quick_node_id == '2'
+        assert self.node.quick_suspected_at is None
+        assert self.node.state == SLOW
+        assert self.node.known_height == 3
+
+    def test_make_txn_too_large(self):
+        with patch('piChain.PaxosLogic.MAX_BLOCK_SIZE', 100):
+            self.assertRaises(ValueError, self.node.make_txn, 'x' * 100)
+
+    @patch('piChain.PaxosLogic.PENDING_TXS_HIGH', 3)
+    @patch('piChain.PaxosLogic.PENDING_TXS_LOW', 1)
+    def test_admission_control(self):
+        self.node.reactor = task.Clock()
+        self.node.timeout_over = MagicMock()
+        producer = MagicMock()
+        learner = MagicMock()
+        self.node.ingress_producers.add(producer)
+        self.node.learners = {'1'}
+        self.node.peers_connection = {'1': learner}
+        for i in range(3):
+            self.node.make_txn('put k%i v' % i)
+        assert self.node.busy
+        assert producer.pauseProducing.called
+        assert learner.transport.pauseProducing.called
+
+        # new txs are rejected until enough pending txs have been committed
+        rejected = []
+        self.node.make_txn('put k v').addErrback(lambda failure: rejected.append(failure.type))
+        assert rejected == [NodeBusyError]
+
+        b = self.node.create_block()
+        self.node.move_to_block(b)
+        assert self.node.busy
+        self.node.commit(b)
+        assert not self.node.busy
+        assert producer.resumeProducing.called
+        assert learner.transport.resumeProducing.called
+
+        metrics = self.node.admission_metrics()
+        assert metrics['pending_txs'] == 0
+        assert metrics['rejected_txs'] == 1
+        assert metrics['busy_periods'] == 1
+        assert not metrics['busy']
+
     def test_reach_genesis_block(self):
 
         b1 = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
@@ -193,6 +822,30 @@ class TestNode(TestCase):
 
         assert self.node.broadcast.called
 
+    def test_change_genesis_block(self):
+        blocks = []
+        parent = GENESIS
+        for i in range(1, 4):
+            b = Block(1, parent.block_id, [Transaction(1, 'a', i)], i)
+            self.node.blocktree.add_block(b)
+            blocks.append(b)
+            parent = b
+        self.node.commit(blocks[-1])
+        assert self.node.blocktree.genesis == GENESIS
+
+        # the committed heights of all peers must be known
+        self.node.update_peer_height('1', 2)
+        assert self.node.blocktree.genesis == GENESIS
+
+        # the committed heights are piggybacked on TRY_OK messages
+        try_ok = PaxosMessage('TRY_OK', 0)
+        try_ok.height = 3
+        self.node.receive_paxos_message(try_ok, MagicMock(peer_node_id='2'))
+        assert self.node.blocktree.genesis == blocks[1]
+        assert self.node.blocktree.genesis_height == 2
+        assert blocks[0].block_id not in self.node.blocktree.nodes
+        assert blocks[2].block_id in self.node.blocktree.nodes
+
     def test_receive_request_blocks_message(self):
         b1 = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
         b2 = Block(2, GENESIS.block_id, [Transaction(1, 'a', 2)], 2)
@@ -213,6 +866,260 @@ class TestNode(TestCase):
 
         assert self.node.respond.called
 
+    def test_receive_respond_blocks_message_starts_sync(self):
+        b1 = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b2 = Block(1, b1.block_id, [Transaction(1, 'a', 2)], 2)
+
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+
+        # parent of b2 is not known -> node fell far behind
+        self.node.receive_respond_blocks_message(RespondBlockMessage([b2]), None)
+
+        assert self.node.broadcast.called
+        obj = self.node.broadcast.call_args[0][0]
+        assert type(obj) == SyncRequestMessage
+        assert obj.credit == 0
+        assert self.node.sync_heights == {}
+
+    def test_receive_sync_request_message(self):
+        blocks = []
+        parent = GENESIS
+        for i in range(1, 6):
+            b = Block(1, parent.block_id, [Transaction(1, 'a', i)], i)
+            self.node.blocktree.add_block(b)
+            self.node.blocktree.committed_blocks.append(b.block_id)
+            blocks.append(b)
+            parent = b
+        self.node.blocktree.committed_block = blocks[-1]
+        self.node.blocktree.head_block = blocks[-1]
+
+        sender = MagicMock()
+        sender.peer_node_id = '1'
+        self.node.respond = MagicMock()
+
+        # probe
+        self.node.receive_sync_request_message(SyncRequestMessage(0), sender)
+        obj = self.node.respond.call_args[0][0]
+        assert obj.height == 5
+        assert obj.blocks == []
+
+        # every block gets its own chunk, peer only grants two chunks
+        self.node.respond.reset_mock()
+        with patch('piChain.PaxosLogic.SYNC_CHUNK_SIZE', 1):
+            self.node.receive_sync_request_message(SyncRequestMessage(2, 2, None), sender)
+            assert self.node.respond.call_count == 2
+            obj = self.node.respond.call_args[0][0]
+            assert obj.blocks == [blocks[2]]
+            assert not obj.done
+
+            # grant more credit
+            self.node.receive_sync_request_message(SyncRequestMessage(5), sender)
+            assert self.node.respond.call_count == 4
+            obj = self.node.respond.call_args[0][0]
+            assert obj.blocks == [blocks[4]]
+            assert obj.done
+            assert obj.committed_block == blocks[4].block_id
+            assert '1' not in self.node.sync_sessions
+
+    def test_striped_sync(self):
+        blocks = []
+        parent = GENESIS
+        for i in range(1, 7):
+            b = Block(1, parent.block_id, [Transaction(1, 'a', i)], i)
+            b.depth = i
+            blocks.append(b)
+            parent = b
+
+        connections = {}
+        for peer_node_id in ['1', '2']:
+            connections[peer_node_id] = MagicMock()
+            connections[peer_node_id].peer_node_id = peer_node_id
+        self.node.peers_connection = connections
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        self.node.respond = MagicMock()
+
+        with patch('piChain.PaxosLogic.SYNC_STRIPE_MIN_BLOCKS', 2):
+            self.node.start_sync()
+            self.node.receive_sync_response_message(SyncResponseMessage([], None, False, 6), connections['1'])
+            self.node.receive_sync_response_message(SyncResponseMessage([], None, False, 5), connections['2'])
+
+        # the missing range is split into two stripes, the one reaching up to the head goes to the highest peer
+        requests = {c[0][1].peer_node_id: c[0][0] for c in self.node.respond.call_args_list}
+        assert (requests['2'].start, requests['2'].stop) == (1, 4)
+        assert (requests['1'].start, requests['1'].stop) == (4, None)
+
+        # stripes arrive out of order and are stitched together
+        self.node.receive_sync_response_message(SyncResponseMessage(blocks[3:], blocks[5].block_id, True, 6),
+                                                connections['1'])
+        assert self.node.blocktree.committed_height() == 0
+        self.node.receive_sync_response_message(SyncResponseMessage(blocks[:3], None, True, 5), connections['2'])
+
+        assert self.node.sync_stripes == []
+        assert self.node.blocktree.committed_block == blocks[5]
+        assert self.node.blocktree.committed_blocks[1:] == [b.block_id for b in blocks]
+
+    def test_striped_sync_verifies_parent_links(self):
+        b1 = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b1.depth = 1
+        b2 = Block(1, 1234, [Transaction(1, 'a', 2)], 2)
+        b2.depth = 2
+
+        sender = MagicMock()
+        sender.peer_node_id = '1'
+        self.node.peers_connection = {'1': sender}
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        self.node.respond = MagicMock()
+
+        self.node.start_sync()
+        self.node.receive_sync_response_message(SyncResponseMessage([], None, False, 2), sender)
+        self.node.receive_sync_response_message(SyncResponseMessage([b1, b2], b2.block_id, True, 2), sender)
+
+        # b2 does not link to b1: only b1 is accepted
+        assert self.node.blocktree.committed_block == b1
+        assert self.node.blocktree.nodes.get(b2.block_id) is None
+
+    def test_sync_requests_snapshot(self):
+        sender = MagicMock()
+        sender.peer_node_id = '1'
+        self.node.peers_connection = {'1': sender}
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        self.node.respond = MagicMock()
+        self.node.state_machine = MagicMock()
+
+        self.node.start_sync()
+        self.node.receive_sync_response_message(SyncResponseMessage([], None, False, 50), sender)
+        # the peer committed the requested blocks but deleted them
+        self.node.receive_sync_response_message(SyncResponseMessage([], None, True, 50), sender)
+
+        assert self.node.sync_stripes == []
+        request = self.node.respond.call_args[0][0]
+        assert type(request) == SnapshotRequestMessage and request.start
+        assert self.node.snapshot_transfer.peer_node_id == '1'
+
+    def test_snapshot_session_apply_failed(self):
+        sender = MagicMock(peer_node_id='1')
+        self.node.peers_connection = {'1': sender}
+        self.node.respond = MagicMock()
+        self.node.state_machine = MagicMock()
+        pipeline = self.node.get_apply_pipeline()
+        pipeline.running = True
+
+        # the session waits for the running apply, which fails: the peer is told that no snapshot can be served
+        self.node.receive_snapshot_request_message(SnapshotRequestMessage(4, True), sender)
+        assert not self.node.respond.called
+        pipeline.apply_failed(Failure(ValueError('cannot apply')))
+        chunk = self.node.respond.call_args[0][0]
+        assert chunk.done and chunk.block is None
+        assert self.node.snapshot_sessions == {}
+
+    @patch('piChain.PaxosLogic.SNAPSHOT_CHUNK_SIZE', 10)
+    def test_snapshot_transfer(self):
+        # the peer committed 3 blocks
+        peer = Node(1, self.node.peers)
+        peer.blocktree.db = MagicMock()
+        peer.broadcast = MagicMock()
+        parent = GENESIS
+        for i in range(1, 4):
+            b = Block(1, parent.block_id, [Transaction(1, 'a', i)], i)
+            b.depth = i
+            peer.blocktree.add_block(b)
+            parent = b
+        peer.commit(parent)
+        peer.state_machine = MagicMock()
+        peer.state_machine.snapshot.return_value = io.BytesIO(b'x' * 25)
+
+        # wire the two nodes together
+        to_peer = MagicMock()
+        to_peer.peer_node_id = '1'
+        to_node = MagicMock()
+        to_node.peer_node_id = '0'
+        peer.peers_connection = {'0': to_node}
+        chunks = []
+
+        def respond_to_node(obj, sender):
+            chunks.append(obj)
+            self.node.parse_msg(obj.serialize()[:3].decode(), obj.serialize(), to_peer)
+        peer.respond = respond_to_node
+        self.node.respond = lambda obj, sender: peer.parse_msg(obj.serialize()[:3].decode(), obj.serialize(), to_node)
+        self.node.broadcast = MagicMock()
+        self.node.start_sync = MagicMock()
+
+        restored = []
+        self.node.state_machine = MagicMock()
+        self.node.state_machine.restore.side_effect = lambda stream: restored.append(stream.read())
+        self.node.request_snapshot(to_peer)
+
+        # chunked with flow control, the last chunk is tagged with the committed block
+        assert [len(c.data) for c in chunks] == [10, 10, 5]
+        assert chunks[-1].block == parent and chunks[-1].height == 3
+        assert peer.snapshot_sessions == {}
+
+        assert self.node.blocktree.committed_block == parent
+        assert self.node.blocktree.genesis == parent
+        assert self.node.blocktree.committed_height() == 3
+        # the blocks committed after the snapshot are synchronized
+        assert self.node.start_sync.called
+
+        def check(height):
+            assert height == 3
+            assert restored == [b'x' * 25]
+        # reads wait until the snapshot has been restored
+        return self.node.wait_for_height(3).addCallback(check)
+
+    @patch('piChain.apply.ApplyPipeline.restore', MagicMock())
+    def test_install_snapshot_known_txs(self):
+        self.node.reactor = task.Clock()
+        self.node.timeout_over = MagicMock()
+        self.node.state_machine = MagicMock()
+        self.node.start_sync = MagicMock()
+
+        # a tentative block that is deleted by the snapshot, a txn made by this node and a txn waiting for a block
+        t1 = Transaction(1, 'a', 1)
+        b1 = Block(1, GENESIS.block_id, [t1], 1)
+        b1.depth = 1
+        self.node.blocktree.add_block(b1)
+        self.node.move_to_block(b1)
+        made = []
+        self.node.make_txn('b').addCallback(made.append)
+        t2 = self.node.new_txs[0]
+        t3 = Transaction(3, 'c', 1)
+        self.node.receive_transaction(t3)
+        assert self.node.known_txs == {t1.txn_id, t2.txn_id, t3.txn_id}
+
+        # the snapshot block contains the txn made by this node
+        b = Block(2, GENESIS.block_id, [t2], 5)
+        b.depth = 5
+        self.node.install_snapshot(b, 5, io.BytesIO(b''))
+        assert made == [t2.txn_id]
+        assert self.node.pending_txs == {}
+        assert self.node.new_txs == [t3]
+        assert self.node.new_txs_size == t3.get_size() + ITEM_OVERHEAD
+        assert self.node.known_txs == {t2.txn_id, t3.txn_id}
+
+        # the txn of the deleted block is accepted again
+        self.node.receive_transaction(t1)
+        assert self.node.new_txs == [t3, t1]
+
+    @patch('piChain.PaxosLogic.SNAPSHOT_CHUNK_SIZE', 10)
+    def test_snapshot_last_chunk_split(self):
+        b = Block(1, GENESIS.block_id, [Transaction(1, 'a' * 50, 1)], 1)
+        session = SnapshotTransfer('1', io.BytesIO(b'x' * 15))
+        session.block = b
+        session.height = 1
+        session.credit = 4
+        self.node.snapshot_sessions = {'1': session}
+        self.node.respond = MagicMock()
+
+        # the rest of the data and the block do not fit into a single message: the block follows in a chunk of its own
+        with patch('piChain.PaxosLogic.MAX_MESSAGE_SIZE', b.get_size() + ENVELOPE_OVERHEAD + 2):
+            self.node.send_snapshot_chunks(MagicMock(peer_node_id='1'))
+        chunks = [args[0][0] for args in self.node.respond.call_args_list]
+        assert [(len(c.data), c.done, c.block) for c in chunks] == [(10, False, None), (5, False, None), (0, True, b)]
+
     def test_move_to_block(self):
         b1 = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
         b2 = Block(2, GENESIS.block_id, [Transaction(2, 'a', 2)], 2)
@@ -245,6 +1152,33 @@ class TestNode(TestCase):
         assert self.node.broadcast.called
         assert self.node.blocktree.head_block == b1
 
+    def test_speculative_hooks(self):
+        b1 = Block(1, GENESIS.block_id, [Transaction(1, 'a', 1)], 1)
+        b2 = Block(2, b1.block_id, [Transaction(2, 'a', 2)], 2)
+        b3 = Block(3, b2.block_id, [Transaction(3, 'a', 3)], 3)
+        b4 = Block(4, b1.block_id, [Transaction(4, 'a', 4)], 4)
+        for b in [b1, b2, b3, b4]:
+            self.node.blocktree.add_block(b)
+
+        self.node.reactor = task.Clock()
+        self.node.broadcast = MagicMock()
+        events = []
+        self.node.on_block_tentative = lambda b: events.append(('tentative', b))
+        self.node.on_block_committed = lambda b: events.append(('committed', b))
+        self.node.on_block_reverted = lambda b: events.append(('reverted', b))
+
+        self.node.move_to_block(b3)
+        assert events == [('tentative', b1), ('tentative', b2), ('tentative', b3)]
+
+        # fork switch
+        events.clear()
+        self.node.move_to_block(b4)
+        assert events == [('reverted', b3), ('reverted', b2), ('tentative', b4)]
+
+        events.clear()
+        self.node.commit(b4)
+        assert events == [('committed', b1), ('committed', b4)]
+
     def test_receive_transaction(self):
         txn = Transaction(0, 'a', 1)
 
@@ -258,11 +1192,111 @@ class TestNode(TestCase):
 
         assert self.node.timeout_over.called
 
+    def test_timers(self):
+        clock = task.Clock()
+        self.node.reactor = clock
+        self.node.broadcast = MagicMock()
+
+        # a slow node keeps a single patience deadline while txs arrive and blocks are received
+        self.node.state = SLOW
+        for i in range(10):
+            self.node.receive_transaction(Transaction(1, 'a', i + 1))
+        for i in range(9):
+            self.node.new_txs.pop(0)
+            self.node.readjust_timeout()
+        assert len(clock.getDelayedCalls()) == 1
+
+        # the deadline is cancelled once no txn is waiting anymore
+        self.node.new_txs = []
+        self.node.readjust_timeout()
+        assert len(clock.getDelayedCalls()) == 0
+
+        # the quick node keeps a single commit deadline and a single retry while commits are running
+        self.node.state = QUICK
+        for i in range(10):
+            b = Block(0, GENESIS.block_id, [Transaction(0, 'b', i + 20)], i + 20)
+            self.node.blocktree.add_block(b)
+            self.node.c_current_committable_block = b
+            self.node.c_commit_running = False
+            self.node.start_commit_process()
+            self.node.start_commit_process()
+        assert len(clock.getDelayedCalls()) == 2
+
+        # the commit deadline is cancelled once a block got committed
+        self.node.commit(b)
+        assert not self.node.commit_timer.active()
+        assert len(clock.getDelayedCalls()) == 1
+
+    def test_accumulation_time(self):
+        # idle quick node creates a block immediately
+        assert self.node.get_patience() == 0
+
+        # accumulation time grows with the arrival rate
+        self.node.expected_rtt = 0.05
+        self.node.arrival_interval = 0.001
+        low = self.node.get_accumulation_time()
+        self.node.arrival_interval = 0.00001
+        high = self.node.get_accumulation_time()
+        assert 0 < low < high <= 0.05
+
+        # a running commit is covered
+        self.node.c_commit_running = True
+        self.node.c_commit_started_at = time.time()
+        self.node.c_commit_duration = 0.08
+        assert self.node.get_accumulation_time() > 0.07
+
+        # capped
+        self.node.c_commit_duration = 10
+        assert self.node.get_accumulation_time() <= 0.1
+
+    @patch('piChain.PaxosLogic.BATCH_TARGET_COUNT', 3)
+    def test_receive_transaction_batch_target(self):
+        self.node.reactor = task.Clock()
+        self.node.c_commit_running = True
+        self.node.c_commit_started_at = time.time()
+        self.node.broadcast = MagicMock()
+        self.node.start_commit_process = MagicMock()
+
+        self.node.receive_transaction(Transaction(1, 'a', 1))
+        self.node.receive_transaction(Transaction(1, 'b', 2))
+        assert len(self.node.new_txs) == 2
+        assert self.node.new_txs_size == sum(txn.get_size() + 5 for txn in self.node.new_txs)
+
+        # block is created once the target is reached
+        self.node.receive_transaction(Transaction(1, 'c', 3))
+        assert len(self.node.new_txs) == 0
+        assert self.node.new_txs_size == 0
+        assert len(self.node.blocktree.head_block.txs) == 3
+        assert self.node.start_commit_process.called
+
     def test_receive_pong_message(self):
-        pong = PongMessage(time.time())
-        self.node.receive_pong_message(pong, 'a')
+        pong = PongMessage(time.time(), 3)
+        self.node.receive_pong_message(pong, '1')
+
+        assert self.node.rtts.get('1') is not None
+        assert self.node.peer_heights.get('1') == 3
+        assert self.node.known_height == 3
+
+    def test_expected_rtt(self):
+        # 3 nodes: a majority is reached with the answer of the fastest peer
+        self.node.add_rtt_sample('1', 0.01)
+        self.node.add_rtt_sample('2', 2)
+        assert self.node.expected_rtt < 1
+
+        # disconnected peers do not influence the timeouts anymore
+        self.node.peer_disconnected('1')
+        assert '1' not in self.node.rtts
+        assert self.node.expected_rtt > 2
+
+    def test_sample_request_rtt(self):
+        sender = MagicMock()
+        sender.peer_node_id = '1'
+        self.node.record_request_time(3)
+
+        propose_ack = PaxosMessage('PROPOSE_ACK', 3)
+        self.node.sample_request_rtt(propose_ack, sender)
 
-        assert self.node.rtts.get('a') is not None
+        assert self.node.rtts.get('1') is not None
 
     def test_timeout_over(self):
         # create a blocktree and add blocks to it
@@ -0,0 +1,63 @@
+"""Unit tests of the RttEstimator class."""
+
+from unittest import TestCase
+
+from piChain.rtt import RttEstimator
+from piChain.config import PING_INTERVAL_MIN, PING_INTERVAL_MAX, RTT_WINDOW
+
+
+class TestRttEstimator(TestCase):
+
+    def test_add_sample(self):
+        estimator = RttEstimator()
+        estimator.add_sample(0.2)
+
+        assert estimator.srtt == 0.2
+        assert estimator.rttvar == 0.1
+
+        estimator.add_sample(0.2)
+        assert estimator.srtt == 0.2
+        assert estimator.rttvar < 0.1
+
+    def test_percentile(self):
+        estimator = RttEstimator()
+        for i in range(1, 101):
+            estimator.add_sample(i / 1000)
+
+        assert estimator.percentile(50) == 0.05
+        assert estimator.percentile(95) == 0.095
+        assert estimator.percentile(100) == 0.1
+
+    def test_percentile_window(self):
+        estimator = RttEstimator()
+        for i in range(RTT_WINDOW + 50):
+            estimator.add_sample((i * 37 % 101) / 1000)
+
+        # only the most recent samples count
+        assert estimator.ordered == sorted(estimator.samples)
+        assert len(estimator.ordered) == RTT_WINDOW
+        assert estimator.percentile(100) == max(estimator.samples)
+
+    def test_estimate_covers_outlier(self):
+        estimator = RttEstimator()
+        for i in range(10):
+            estimator.add_sample(0.01)
+        estimator.add_sample(0.5)
+
+        assert estimator.estimate() >= estimator.percentile(95)
+        assert estimator.estimate() > 0.01
+
+    def test_ping_interval(self):
+        estimator = RttEstimator()
+        estimator.add_sample(0.01)
+        assert estimator.ping_interval() == PING_INTERVAL_MIN
+
+        # stable RTT -> sample rarely
+        for i in range(20):
+            estimator.add_sample(0.01)
+        assert estimator.ping_interval() > PING_INTERVAL_MAX / 2
+
+        # varying RTT -> sample often
+        for i in range(20):
+            estimator.add_sample(0.01 if i % 2 == 0 else 0.1)
+        assert estimator.ping_interval() == PING_INTERVAL_MIN
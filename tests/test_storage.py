@@ -9,6 +9,8 @@ from unittest import TestCase
 
 from piChain.PaxosLogic import Blocktree, GENESIS
 from piChain.messages import Block, Transaction
+from piChain.config import ID_LEASE_SIZE
+from piChain.state_machine import PlyvelStateMachine
 
 logging.disable(logging.CRITICAL)
 
@@ -87,3 +89,49 @@ class TestBlocktree(TestCase):
         assert bt2.db.get(str(b5.block_id).encode()) == b5.serialize()
 
         bt2.db.close()
+
+    def test_next_counter(self):
+        assert self.bt.next_counter() == 1
+        assert self.bt.next_counter() == 2
+        assert self.bt.db.get(b'counter') == str(ID_LEASE_SIZE).encode()
+
+        self.bt.db.close()
+
+        # a restarted node continues with the next range of ids
+        bt2 = Blocktree(0)
+        assert bt2.next_counter() == ID_LEASE_SIZE + 1
+        assert bt2.db.get(b'counter') == str(2 * ID_LEASE_SIZE).encode()
+
+        bt2.db.close()
+
+    def test_write_batch(self):
+        b1 = Block(1, GENESIS.block_id, [Transaction(0, 'c', 0)], 1)
+        b2 = Block(2, b1.block_id, [Transaction(0, 'c', 1)], 2)
+
+        self.bt.add_blocks([b1, b2])
+
+        assert self.bt.db.get(str(b1.block_id).encode()) == b1.serialize()
+        assert self.bt.db.get(str(b2.block_id).encode()) == b2.serialize()
+
+    def test_plyvel_state_machine(self):
+        class KeyValueStore(PlyvelStateMachine):
+            def execute(self, batch, command):
+                c_list = command.split()
+                if c_list[0] == 'put':
+                    batch.put(c_list[1].encode(), c_list[2].encode())
+                else:
+                    batch.delete(c_list[1].encode())
+
+        store = KeyValueStore(self.bt.db, b'applied')
+        assert store.applied_height() == 0
+
+        # the writes of the shards are not visible before the flush
+        store.apply(['put a 1', 'put a 2'])
+        store.apply(['put b 1', 'delete b'])
+        assert self.bt.db.get(b'a') is None
+        store.flush(3)
+
+        assert self.bt.db.get(b'a') == b'2'
+        assert self.bt.db.get(b'b') is None
+        assert store.applied_height() == 3
+        assert store.staged == []
@@ -0,0 +1,91 @@
+"""Unit tests of the subscriptions to the committed log."""
+
+import logging
+import os
+import shutil
+
+import cbor
+from unittest.mock import MagicMock, patch
+from twisted.test import proto_helpers
+from twisted.trial.unittest import TestCase
+
+from piChain.PaxosLogic import Node, GENESIS
+from piChain.messages import Block, Transaction
+from piChain.subscription import CommittedLogFactory
+
+logging.disable(logging.CRITICAL)
+
+
+class TestCommittedLogProtocol(TestCase):
+
+    def setUp(self):
+        # delete pichain folder on disk
+        base_path = os.path.expanduser('~/.pichain')
+        if os.path.exists(base_path):
+            shutil.rmtree(base_path)
+
+        peers = {
+            '0': {'ip': '127.0.0.1', 'port': 7982},
+            '1': {'ip': '127.0.0.1', 'port': 7981},
+            '2': {'ip': '127.0.0.1', 'port': 7980}
+        }
+        self.node = Node(0, peers)
+        self.node.blocktree.db = MagicMock()
+        self.node.broadcast = MagicMock()
+
+        self.blocks = []
+        parent = GENESIS
+        for i in range(3):
+            b = Block(1, parent.block_id, [Transaction(1, 'c%i' % i, 2 * i), Transaction(1, 'd%i' % i, 2 * i + 1)], i)
+            b.depth = i + 1
+            self.node.blocktree.add_block(b)
+            self.blocks.append(b)
+            parent = b
+
+        self.transport = proto_helpers.StringTransport()
+        self.protocol = CommittedLogFactory(self.node).buildProtocol(None)
+        self.protocol.makeConnection(self.transport)
+
+    def subscribe(self, start):
+        data = cbor.dumps(start)
+        self.protocol.dataReceived(len(data).to_bytes(4, 'little') + data)
+
+    def frames(self):
+        data = self.transport.value()
+        self.transport.clear()
+        frames = []
+        while len(data) != 0:
+            length = int.from_bytes(data[:4], 'little')
+            frames.append(cbor.loads(data[4:4 + length]))
+            data = data[4 + length:]
+        return frames
+
+    @patch('piChain.subscription.SUBSCRIPTION_BATCH_SIZE', 3)
+    def test_subscribe(self):
+        self.node.commit(self.blocks[1])
+        assert self.transport.producer is self.protocol
+
+        # subscribe from the second block: the frames contain whole blocks
+        self.subscribe(2)
+        b = self.blocks[1]
+        assert self.node.log_subscribers == {self.protocol}
+        assert self.frames() == [[[2, b.block_id, b.txs[0].txn_id, 'c1'], [2, b.block_id, b.txs[1].txn_id, 'd1']]]
+
+        # the next committed block is streamed unless the transport is paused
+        self.protocol.pauseProducing()
+        self.node.commit(self.blocks[2])
+        assert self.frames() == []
+        self.protocol.resumeProducing()
+        assert [entry[0] for frame in self.frames() for entry in frame] == [3, 3]
+
+        self.protocol.connectionLost()
+        assert self.node.height_waiters == []
+        assert self.node.log_subscribers == set()
+
+    def test_deleted_blocks(self):
+        self.node.commit(self.blocks[2])
+        self.node.blocktree.nodes.pop(self.blocks[0].block_id)
+
+        self.subscribe(1)
+        assert isinstance(self.frames()[0], str)
+        assert self.transport.disconnecting
@@ -0,0 +1,48 @@
+"""Unit tests of the Timer class."""
+
+from unittest import TestCase
+from unittest.mock import MagicMock
+
+from twisted.internet import task
+
+from piChain.timers import Timer
+
+
+class TestTimer(TestCase):
+
+    def test_fire(self):
+        clock = task.Clock()
+        timer = Timer()
+        f = MagicMock()
+        timer.arm(clock, 1, f, 'a')
+        assert timer.active()
+
+        clock.advance(1)
+        f.assert_called_once_with('a')
+        assert not timer.active()
+
+    def test_rearm(self):
+        clock = task.Clock()
+        timer = Timer()
+        f = MagicMock()
+        for i in range(100):
+            timer.arm(clock, 1, f, i)
+            clock.advance(0.5)
+
+        # the deadline moved with every arm without scheduling another call
+        assert len(clock.getDelayedCalls()) == 1
+        assert not f.called
+        clock.advance(0.5)
+        f.assert_called_once_with(99)
+
+    def test_cancel(self):
+        clock = task.Clock()
+        timer = Timer()
+        f = MagicMock()
+        timer.arm(clock, 1, f)
+        timer.cancel()
+        timer.cancel()
+
+        assert len(clock.getDelayedCalls()) == 0
+        clock.advance(2)
+        assert not f.called
@@ -100,10 +100,13 @@ class MultiNodeTest(TestCase):
                 print("====================== stderr =======================")
                 node_proc.shutdown()
 
-    def extract_committed_blocks_single_process(self, i):
+    def extract_lines_single_process(self, i):
         """
         Args:
             i (int): index of node.
+
+        Returns:
+            list: the lines the node wrote to stdout.
         """
         node_lines = []
         node_name = 'node ' + str(i)
@@ -111,15 +114,29 @@ class MultiNodeTest(TestCase):
             if node_proc.name == node_name:
                 node_lines = node_proc.proc.stdout.readlines()
 
-        node_blocks = []
-
         print("====================== stdout =======================")
         print('')
         print("==========")
         print('node %s:' % i)
         for line in node_lines:
             print(line)
-            if 'block =' in line:
-                node_blocks.append(line)
 
-        return node_blocks
+        return node_lines
+
+    def extract_committed_blocks_single_process(self, i):
+        """
+        Args:
+            i (int): index of node.
+        """
+        return [line for line in self.extract_lines_single_process(i) if 'block =' in line]
+
+    @staticmethod
+    def extract_failover_times(lines):
+        """
+        Args:
+            lines (list): stdout lines of a node (see `extract_lines_single_process`).
+
+        Returns:
+            list: the failover times (in seconds) the node wrote to stdout.
+        """
+        return [float(line.split()[-1]) for line in lines if 'failover =' in line]